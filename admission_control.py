@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Admission Control
+Keeps the host inside a CPU budget when streams are started. The CPU cost of
+each encode profile is learned from the FFmpeg processes that run it; a start
+that would exceed the budget is downgraded (faster preset, then copy mode),
+queued until capacity frees up, or refused.
+"""
+
+import time
+from collections import deque
+
+import psutil
+
+from database import get_config, StreamChannel
+from system_metrics import system_metrics
+
+PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
+
+# Starting estimates in CPU cores for a 30 fps encode, replaced by observed usage
+DEFAULT_PRESET_CORES = {
+    'ultrafast': 0.5, 'superfast': 0.7, 'veryfast': 1.0, 'faster': 1.4, 'fast': 1.8,
+    'medium': 2.4, 'slow': 3.5, 'slower': 5.0, 'veryslow': 8.0,
+}
+COPY_CORES = 0.05
+
+DEFAULT_BUDGET_PERCENT = 85  # 'admission_cpu_budget' configuration, % of the whole host
+DEFAULT_POLICY = 'downgrade'  # 'admission_policy' configuration: downgrade, queue or refuse
+WARMUP_SECONDS = 30  # A new process is not yet visible in the host load
+LEARN_RATE = 0.2  # Weight of a new observation in the cost average
+OBSERVE_INTERVAL = 10
+QUEUE_INTERVAL = 15
+
+
+def profile_key(encoding_mode, preset=None, bitrate=None, fps=None):
+    if encoding_mode == 'copy':
+        return ('copy',)
+    return ('encode', preset, bitrate, int(fps or 30))
+
+
+class AdmissionController:
+    """Decide whether a stream may start, and in which encode profile"""
+
+    def __init__(self, service):
+        self.service = service
+        self.cpu_count = psutil.cpu_count() or 1
+        self.costs = {}  # {profile key: learned % of host}
+        self.running = {}  # {channel_id: (profile key, time.monotonic() of start)}
+        self.waiting = deque()  # channel_ids queued for capacity
+        self.reasons = {}  # {channel_id: last admission decision}
+        self.host_load = None  # Last measured host CPU %
+        self.timers = []
+
+    def start(self):
+        """Start observing usage and draining the queue on supervisor timers"""
+        if not self.timers:
+            psutil.cpu_percent(interval=None)  # Prime the host counter
+            self.timers = [
+                self.service.supervisor.call_every(OBSERVE_INTERVAL, self.observe),
+                self.service.supervisor.call_every(QUEUE_INTERVAL, self.drain_queue),
+            ]
+
+    def budget(self):
+        return float(get_config('admission_cpu_budget', DEFAULT_BUDGET_PERCENT))
+
+    def policy(self):
+        return get_config('admission_policy', DEFAULT_POLICY)
+
+    def estimate(self, key):
+        """Expected % of host for a profile: learned if seen before, else the default table"""
+        if key in self.costs:
+            return self.costs[key]
+        if key[0] == 'copy':
+            cores = COPY_CORES
+        else:
+            cores = DEFAULT_PRESET_CORES.get(key[1], 1.0) * key[3] / 30.0
+        return cores * 100.0 / self.cpu_count
+
+    def current_load(self):
+        """Measured host load plus processes still warming up (or estimates if not measured)"""
+        now = time.monotonic()
+        if self.host_load is None:
+            return sum(self.estimate(key) for key, _ in self.running.values())
+        warming = sum(self.estimate(key) for key, started in self.running.values() if now - started < WARMUP_SECONDS)
+        return self.host_load + warming
+
+    def run_profile(self, channel, overrides=None):
+        """Profile the channel would actually run: cached renditions and shared encodes cost a copy"""
+        overrides = overrides or {}
+        mode = overrides.get('encoding_mode', channel.encoding_mode)
+        if mode == 'copy':
+            return profile_key('copy')
+        if not overrides and not channel.playlist_id:
+            # Read-only: drain_queue asks every tick, the start itself does the lookup
+            if self.service.renditions.peek(channel):
+                return profile_key('copy')
+            group_key = self.service.get_shared_group_key(channel)
+            if group_key and group_key in self.service.shared_encoders.groups:
+                return profile_key('copy')
+        return profile_key('encode', overrides.get('preset', channel.preset), channel.bitrate, channel.fps)
+
+    def evaluate(self, channel):
+        """Admission decision for a start: action admit, downgrade, queue or refuse"""
+        budget = self.budget()
+        load = self.current_load()
+        key = self.run_profile(channel)
+        cost = self.estimate(key)
+        decision = {'action': 'admit', 'overrides': {}, 'profile': key, 'estimated_cost': round(cost, 1),
+                    'host_load': round(load, 1), 'budget': budget, 'reason': None}
+        if load + cost <= budget:
+            return decision
+
+        over = f"would put the host at {load + cost:.0f}% CPU (budget {budget:.0f}%)"
+        policy = self.policy()
+        if policy == 'downgrade':
+            for overrides in self._downgrades(channel):
+                key = self.run_profile(channel, overrides)
+                cost = self.estimate(key)
+                if load + cost <= budget:
+                    change = overrides.get('preset') or 'copy mode'
+                    decision.update(action='downgrade', overrides=overrides, profile=key,
+                                    estimated_cost=round(cost, 1),
+                                    reason=f"Downgraded to {change}: the configured profile {over}")
+                    return decision
+            policy = 'queue'
+
+        decision['action'] = policy if policy in ('queue', 'refuse') else 'refuse'
+        verb = 'Queued' if decision['action'] == 'queue' else 'Refused'
+        decision['reason'] = f"{verb}: starting {channel.name} {over}"
+        return decision
+
+    def _downgrades(self, channel):
+        """Cheaper alternatives, mildest first: each faster preset, then copy mode"""
+        if channel.encoding_mode != 'copy' and channel.preset in PRESETS:
+            for preset in reversed(PRESETS[:PRESETS.index(channel.preset)]):
+                yield {'preset': preset}
+        if channel.encoding_mode != 'copy':
+            yield {'encoding_mode': 'copy'}
+
+    def enqueue(self, channel_id, decision):
+        if channel_id not in self.waiting:
+            self.waiting.append(channel_id)
+        self.reasons[channel_id] = decision
+
+    def dequeue(self, channel_id):
+        """Drop a queued start, True if it was queued"""
+        self.reasons.pop(channel_id, None)
+        if channel_id in self.waiting:
+            self.waiting.remove(channel_id)
+            return True
+        return False
+
+    def started(self, channel_id, key, decision=None):
+        self.running[channel_id] = (key, time.monotonic())
+        if decision:
+            self.reasons[channel_id] = decision
+
+    def released(self, channel_id):
+        self.running.pop(channel_id, None)
+        self.reasons.pop(channel_id, None)
+
+    def drain_queue(self):
+        """Start queued channels in order while they fit"""
+        while self.waiting:
+            channel_id = self.waiting[0]
+            channel = StreamChannel.query.get(channel_id)
+            if not channel:
+                self.dequeue(channel_id)
+                continue
+            if self.evaluate(channel)['action'] not in ('admit', 'downgrade'):
+                return
+            self.dequeue(channel_id)
+            self.service.start_stream(channel_id)
+
+    def observe(self):
+        """Fold the measured CPU of running FFmpeg processes into the profile costs"""
+        # Host load from the metrics sampler: psutil.cpu_percent() keeps one global baseline
+        load = system_metrics.average_cpu(OBSERVE_INTERVAL)
+        self.host_load = load if load is not None else psutil.cpu_percent(interval=None)
+        now = time.monotonic()
+        live = {}
+        for channel_id, process in list(self.service.active_streams.items()):
+            if channel_id in self.running:
+                live[process.pid] = self.running[channel_id]
+        for group in list(self.service.shared_encoders.groups.values()):
+            if group['encoder'] is not None:
+                _, bitrate, fps, preset = group['key']
+                live[group['encoder'].pid] = (profile_key('encode', preset, bitrate, fps), group['started_at'])
+
+        for pid, (key, started) in live.items():
+            sample = self.service.resources.get_pid(pid)
+            if not sample or sample['cpu_percent'] is None:
+                continue  # Not sampled twice yet
+            usage = sample['cpu_percent'] / self.cpu_count
+            if started is None or now - started < WARMUP_SECONDS:
+                continue
+            previous = self.costs.get(key)
+            self.costs[key] = usage if previous is None else previous + LEARN_RATE * (usage - previous)
+
+    def get_state(self, channel_id):
+        """Queue position and last decision for a channel"""
+        decision = self.reasons.get(channel_id)
+        if channel_id not in self.waiting and not decision:
+            return None
+        return {
+            'queued': channel_id in self.waiting,
+            'position': list(self.waiting).index(channel_id) + 1 if channel_id in self.waiting else None,
+            'action': decision['action'] if decision else None,
+            'reason': decision['reason'] if decision else None,
+            'estimated_cost': decision['estimated_cost'] if decision else None,
+        }
+
+    def get_status(self):
+        return {
+            'budget': self.budget(),
+            'policy': self.policy(),
+            'host_load': self.host_load,
+            'estimated_load': round(self.current_load(), 1),
+            'queued': list(self.waiting),
+            'costs': [
+                {'profile': list(key), 'cpu_percent': round(cost, 1)}
+                for key, cost in self.costs.items()
+            ],
+        }
@@ -13,8 +13,13 @@ import time as time_module
 import re
 import random
 from database import db, ScheduledTask, StreamHealth, Playlist, PlaylistItem, PlatformDestination, StreamChannel, VideoLibrary, StreamSession, StreamStats
-import psutil
+from stream_telemetry import FFmpegLogRing, FFmpegProgressParser, ProgressSeries
+from restart_policy import RestartPolicy
+from shared_encoding import free_udp_port
+from cpu_placement import process_kind
 import os
+import subprocess
+import pytz
 
 class AutomatedScheduler:
     """Automated task scheduler for starting/stopping streams"""
@@ -121,101 +126,93 @@ class AutomatedScheduler:
 class StreamHealthMonitor:
     """Monitor stream health and performance"""
     
-    def __init__(self, stream_manager):
+    def __init__(self, stream_manager, interval=30):
         self.stream_manager = stream_manager
-        self.monitoring = {}  # {channel_id: thread}
-        self.stop_flags = {}  # {channel_id: stop_event}
-    
-    def start_monitoring(self, channel_id, session_id):
-        """Start monitoring a stream"""
-        if channel_id in self.monitoring:
-            return
+        self.streaming_service = stream_manager.streaming_service
+        self.interval = interval
+        self.paused = set()  # channel_ids excluded via stop_monitoring
         
-        stop_event = threading.Event()
-        self.stop_flags[channel_id] = stop_event
-        
-        thread = threading.Thread(
-            target=self._monitor_loop,
-            args=(channel_id, session_id, stop_event),
-            daemon=True
-        )
-        thread.start()
-        self.monitoring[channel_id] = thread
+        # Sampled by a shared supervisor timer instead of one thread per channel
+        self.timer = self.streaming_service.supervisor.call_every(interval, self.sample_all)
+    
+    def start_monitoring(self, channel_id, session_id=None):
+        """(Re-)include a stream in health sampling (active streams are sampled by default)"""
+        self.paused.discard(channel_id)
     
     def stop_monitoring(self, channel_id):
-        """Stop monitoring a stream"""
-        if channel_id in self.stop_flags:
-            self.stop_flags[channel_id].set()
-            del self.stop_flags[channel_id]
-        if channel_id in self.monitoring:
-            del self.monitoring[channel_id]
-    
-    def _monitor_loop(self, channel_id, session_id, stop_event):
-        """Monitoring loop"""
-        while not stop_event.is_set():
+        """Exclude a stream from health sampling"""
+        self.paused.add(channel_id)
+    
+    def shutdown(self):
+        self.timer.cancel()
+    
+    def sample_all(self):
+        """Record one health sample for every active stream"""
+        active = dict(self.streaming_service.active_streams)
+        for channel_id in active:
+            session_id = self.streaming_service.running_channels.get(channel_id)
+            if channel_id in self.paused or not session_id:
+                continue
             try:
-                # Get process info
-                process = self.stream_manager.processes.get(channel_id)
-                if not process:
-                    break
-                
-                # Get system metrics
-                try:
-                    proc = psutil.Process(process.pid)
-                    cpu_usage = proc.cpu_percent(interval=1)
-                    memory_usage = proc.memory_percent()
-                except:
-                    cpu_usage = 0
-                    memory_usage = 0
-                
-                # Parse FFmpeg output for stream stats
-                fps, bitrate, dropped_frames = self._parse_ffmpeg_stats(process)
-                
-                # Determine health status
-                status = 'healthy'
-                if dropped_frames > 100 or cpu_usage > 90:
-                    status = 'critical'
-                elif dropped_frames > 50 or cpu_usage > 70:
-                    status = 'warning'
-                
-                # Save health check
-                health = StreamHealth(
-                    session_id=session_id,
-                    fps=fps,
-                    bitrate_kbps=bitrate,
-                    dropped_frames=dropped_frames,
-                    cpu_usage=cpu_usage,
-                    memory_usage=memory_usage,
-                    status=status
-                )
-                db.session.add(health)
-                db.session.commit()
-                
-                # Alert if critical
-                if status == 'critical':
-                    self.stream_manager.add_log(
-                        f"⚠️ Stream health critical for channel {channel_id}: CPU {cpu_usage}%, Dropped frames: {dropped_frames}",
-                        "WARNING",
-                        session_id
-                    )
-                
-                # Wait before next check
-                time_module.sleep(30)  # Check every 30 seconds
-                
+                self._sample(channel_id, session_id)
             except Exception as e:
+                db.session.rollback()
                 print(f"Error in health monitoring: {e}")
-                time_module.sleep(30)
-    
-    def _parse_ffmpeg_stats(self, process):
-        """Parse FFmpeg output for statistics"""
-        # This is a simplified version - in production, you'd parse stderr output
-        fps = 30.0  # Default
-        bitrate = 4000.0  # Default
-        dropped_frames = 0
-        
-        # TODO: Implement actual FFmpeg stats parsing from stderr
-        # For now, return defaults
-        return fps, bitrate, dropped_frames
+    
+    def _sample(self, channel_id, session_id):
+        """Sample one stream and persist a StreamHealth row"""
+        # Process usage from the shared resource sampler (whole FFmpeg process tree)
+        resources = self.streaming_service.resources.get_channel(channel_id)
+        cpu_usage = (resources and resources['cpu_percent']) or 0
+        memory_usage = resources['memory_percent'] if resources else 0
+        
+        # Read real stream stats from the FFmpeg progress series
+        fps, bitrate, dropped_frames, speed = self._get_stream_stats(channel_id)
+        
+        # Determine health status
+        status = 'healthy'
+        if dropped_frames > 100 or cpu_usage > 90 or (speed is not None and speed < 0.9):
+            status = 'critical'
+        elif dropped_frames > 50 or cpu_usage > 70 or (speed is not None and speed < 0.98):
+            status = 'warning'
+        
+        # Save health check
+        health = StreamHealth(
+            session_id=session_id,
+            fps=fps,
+            bitrate_kbps=bitrate,
+            dropped_frames=dropped_frames,
+            speed=speed,
+            cpu_usage=cpu_usage,
+            memory_usage=memory_usage,
+            status=status
+        )
+        db.session.add(health)
+        db.session.commit()
+        self.streaming_service.events.publish('health', dict(health.to_dict(), channel_id=channel_id))
+        
+        # Alert if critical
+        if status == 'critical':
+            self.stream_manager.add_log(
+                f"⚠️ Stream health critical for channel {channel_id}: CPU {cpu_usage}%, "
+                f"Dropped frames: {dropped_frames}, Speed: {speed}x",
+                "WARNING",
+                session_id
+            )
+    
+    def _get_stream_stats(self, channel_id):
+        """Get fps, bitrate, dropped frames and speed over the last interval from FFmpeg progress"""
+        progress = self.streaming_service.get_stream_progress(channel_id, self.interval)
+        summary = progress['summary'] if progress else None
+        if not summary:
+            return None, None, 0, None
+        
+        return (
+            summary['fps'],
+            summary['bitrate_kbps'],
+            summary['dropped_in_window'] or 0,
+            summary['speed']
+        )
 
 
 class PlaylistManager:
@@ -312,13 +309,25 @@ class PlaylistManager:
 
 
 class MultiPlatformStreamer:
-    """Handle streaming to multiple platforms simultaneously"""
+    """Handle streaming to multiple platforms simultaneously
     
-    def __init__(self, stream_manager):
+    Shared-encode mode (default) decodes and encodes once and fans the result
+    out with FFmpeg's tee muxer to one local UDP relay per destination. Each
+    relay is a cheap copy-mode FFmpeg pushing to its RTMP ingest, so a failing
+    destination only restarts its own relay (with its own backoff) while the
+    encoder and the other destinations keep running.
+    """
+    
+    def __init__(self, stream_manager, shared_encode=True):
         self.stream_manager = stream_manager
-        self.platform_processes = {}  # {channel_id: {platform_id: process}}
+        self.streaming_service = stream_manager.streaming_service
+        self.supervisor = self.streaming_service.supervisor
+        self.shared_encode = shared_encode
+        self.platform_processes = {}  # {channel_id: {platform_id: process}} (per-destination mode)
+        self.platform_logs = {}  # {channel_id: {platform_id or 'encoder': FFmpegLogRing}}
+        self.fanouts = {}  # {channel_id: fan-out state} (shared-encode mode)
     
-    def start_multi_platform_stream(self, channel_id):
+    def start_multi_platform_stream(self, channel_id, shared_encode=None):
         """Start streaming to all enabled platforms for a channel"""
         destinations = PlatformDestination.query.filter_by(
             channel_id=channel_id,
@@ -332,6 +341,12 @@ class MultiPlatformStreamer:
         if not channel or not channel.video_path or not os.path.exists(channel.video_path):
             return False, "Video not found"
         
+        if channel_id in self.fanouts or self.platform_processes.get(channel_id):
+            return False, "Multi-platform stream is already running"
+        
+        if self.shared_encode if shared_encode is None else shared_encode:
+            return self._start_fanout(channel, destinations)
+        
         # Initialize platform processes dict
         if channel_id not in self.platform_processes:
             self.platform_processes[channel_id] = {}
@@ -342,6 +357,15 @@ class MultiPlatformStreamer:
                 process = self._start_platform_stream(channel, dest)
                 if process:
                     self.platform_processes[channel_id][dest.id] = process
+                    
+                    # Supervisor drains stderr into a bounded ring and reports the exit
+                    ring = FFmpegLogRing()
+                    self.platform_logs.setdefault(channel_id, {})[dest.id] = ring
+                    self.stream_manager.streaming_service.supervisor.watch(
+                        process,
+                        on_exit=lambda proc, code, dest_id=dest.id: self._on_platform_exit(channel_id, dest_id, proc, code),
+                        on_stderr_line=ring.append
+                    )
                     success_count += 1
                     self.stream_manager.add_log(
                         f"Started streaming to {dest.platform_name} for channel {channel.name}",
@@ -359,14 +383,14 @@ class MultiPlatformStreamer:
     
     def _start_platform_stream(self, channel, destination):
         """Start stream to a specific platform"""
-        import subprocess
-        
         rtmp_url = destination.rtmp_url + destination.stream_key
         
         # Build FFmpeg command
         if channel.encoding_mode == 'copy':
             cmd = [
                 'ffmpeg',
+                '-loglevel', 'warning',
+                '-nostats',
                 '-re',
                 '-stream_loop', '-1',
                 '-i', channel.video_path,
@@ -378,6 +402,8 @@ class MultiPlatformStreamer:
         else:
             cmd = [
                 'ffmpeg',
+                '-loglevel', 'warning',
+                '-nostats',
                 '-re',
                 '-stream_loop', '-1',
                 '-i', channel.video_path,
@@ -392,32 +418,237 @@ class MultiPlatformStreamer:
                 '-c:a', 'aac',
                 '-b:a', '128k',
                 '-ar', '44100',
+                '-threads', str(self.streaming_service.placement.encode_threads()),
                 '-f', 'flv',
                 rtmp_url
             ]
         
         process = subprocess.Popen(
             cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
         )
+        self.streaming_service.placement.place(process, process_kind(cmd))
         
         return process
     
+    def _on_platform_exit(self, channel_id, platform_id, process, returncode):
+        """Called by the supervisor when a platform FFmpeg exits"""
+        processes = self.platform_processes.get(channel_id, {})
+        if processes.get(platform_id) is not process:
+            return  # Stopped via stop_multi_platform_stream
+        
+        del processes[platform_id]
+        self.stream_manager.add_log(
+            f"Platform stream {platform_id} for channel {channel_id} ended with code {returncode}",
+            "WARNING"
+        )
+    
+    # --- Shared encode: one encoder, tee muxer, one relay per destination ---
+    
+    def _build_tee_command(self, channel, ports):
+        """Single decode/encode, fanned out to every relay port by the tee muxer"""
+        slaves = '|'.join(
+            f"[f=mpegts:onfail=ignore]udp://127.0.0.1:{port}?pkt_size=1316"
+            for port in ports
+        )
+        return (
+            self.streaming_service.build_input_args(channel)
+            + self.streaming_service.build_encoding_args(channel)
+            + ['-map', '0:v:0', '-map', '0:a:0?', '-f', 'tee', slaves]
+        )
+    
+    def _start_fanout(self, channel, destinations):
+        """Start relays for every destination, then the shared encoder"""
+        channel_id = channel.id
+        ports = {dest.id: free_udp_port() for dest in destinations}
+        fanout = {
+            'channel_name': channel.name,
+            'encoder': None,
+            'encoder_cmd': self._build_tee_command(channel, ports.values()),
+            'relays': {},
+            'relay_cmds': {
+                dest.id: self.streaming_service.build_relay_command(ports[dest.id], dest.rtmp_url + dest.stream_key)
+                for dest in destinations
+            },
+            'names': {dest.id: dest.platform_name for dest in destinations},
+            'policies': {key: RestartPolicy.for_channel(channel) for key in ['encoder'] + list(ports)},
+            'timers': {},
+            'started_at': {},
+            'progress': ProgressSeries(),
+            'stopping': False
+        }
+        self.fanouts[channel_id] = fanout
+        self.platform_logs[channel_id] = {key: FFmpegLogRing() for key in ['encoder'] + list(ports)}
+        
+        # Relays first, so they already listen when the encoder starts sending
+        for dest_id in fanout['relay_cmds']:
+            self._start_fanout_process(channel_id, dest_id)
+        if not self._start_fanout_process(channel_id, 'encoder'):
+            self.stop_multi_platform_stream(channel_id)
+            return False, "Failed to start shared encoder"
+        
+        self.stream_manager.add_log(
+            f"Shared encoder for {channel.name} fanned out to {len(destinations)} platform(s)",
+            "INFO"
+        )
+        return True, f"Streaming to {len(destinations)} platform(s) with one encoder"
+    
+    def _start_fanout_process(self, channel_id, key):
+        """Start the encoder (key 'encoder') or one destination relay (key dest_id)"""
+        fanout = self.fanouts.get(channel_id)
+        if not fanout or fanout['stopping']:
+            return False
+        fanout['timers'].pop(key, None)
+        
+        is_encoder = key == 'encoder'
+        cmd = fanout['encoder_cmd'] if is_encoder else fanout['relay_cmds'][key]
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE if is_encoder else subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except Exception as e:
+            self.stream_manager.add_log(f"Failed to start {self._fanout_label(fanout, key)}: {e}", "ERROR")
+            return False
+        self.streaming_service.placement.place(process, process_kind(cmd))
+        
+        if is_encoder:
+            fanout['encoder'] = process
+            parser = FFmpegProgressParser()
+            
+            def on_progress_line(line):
+                sample = parser.feed(line)
+                if sample:
+                    fanout['progress'].append(sample)
+        else:
+            fanout['relays'][key] = process
+            on_progress_line = None
+        
+        fanout['policies'][key].restarted()
+        fanout['started_at'][key] = time_module.monotonic()
+        self.supervisor.watch(
+            process,
+            on_exit=lambda proc, code: self._on_fanout_exit(channel_id, key, proc, code),
+            on_stdout_line=on_progress_line,
+            on_stderr_line=self.platform_logs[channel_id][key].append
+        )
+        return True
+    
+    def _fanout_label(self, fanout, key):
+        if key == 'encoder':
+            return f"shared encoder for {fanout['channel_name']}"
+        return f"{fanout['names'][key]} relay for {fanout['channel_name']}"
+    
+    def _on_fanout_exit(self, channel_id, key, process, returncode):
+        """Restart only the process that died, with its own backoff"""
+        fanout = self.fanouts.get(channel_id)
+        if not fanout or fanout['stopping']:
+            return
+        current = fanout['encoder'] if key == 'encoder' else fanout['relays'].get(key)
+        if current is not process:
+            return
+        
+        label = self._fanout_label(fanout, key)
+        ring = self.platform_logs[channel_id][key]
+        if 'fatal' in ring.recent_tags():
+            last_line = ring.tail(1)[0]['line'] if ring.tail(1) else ''
+            self.stream_manager.add_log(f"{label} failed permanently: {last_line}", "ERROR")
+            if key == 'encoder':
+                # Stopping waits for every relay to exit: not on the control thread.
+                # The relays now losing their input must not be restarted meanwhile.
+                fanout['stopping'] = True
+                self.supervisor.run_in_worker(self.stop_multi_platform_stream, channel_id)
+            else:
+                fanout['relays'].pop(key, None)
+            return
+        
+        started_at = fanout['started_at'].get(key)
+        delay = fanout['policies'][key].next_delay(time_module.monotonic() - started_at if started_at else None)
+        if delay is None:
+            self.stream_manager.add_log(f"{label} ended with code {returncode}, not restarting", "ERROR")
+            return
+        
+        self.stream_manager.add_log(
+            f"{label} ended with code {returncode}, restarting in {delay:.1f}s",
+            "WARNING"
+        )
+        fanout['timers'][key] = self.supervisor.call_later(delay, self._start_fanout_process, channel_id, key)
+    
+    def _stop_fanout(self, channel_id):
+        fanout = self.fanouts.pop(channel_id)
+        fanout['stopping'] = True
+        for timer in fanout['timers'].values():
+            timer.cancel()
+        
+        processes = list(fanout['relays'].values())
+        if fanout['encoder']:
+            processes.insert(0, fanout['encoder'])
+        for process in processes:
+            try:
+                process.terminate()
+                process.wait(timeout=5)
+            except:
+                process.kill()
+        
+        self.platform_logs.pop(channel_id, None)
+    
+    def get_multi_platform_status(self, channel_id):
+        """Per-process state of a channel's multi-platform stream"""
+        fanout = self.fanouts.get(channel_id)
+        if fanout:
+            def state(key, process):
+                return {
+                    'running': process is not None and process.poll() is None,
+                    'restart': fanout['policies'][key].to_dict()
+                }
+            
+            return {
+                'mode': 'shared_encode',
+                'encoder': dict(state('encoder', fanout['encoder']), progress=fanout['progress'].latest()),
+                'destinations': {
+                    dest_id: dict(state(dest_id, fanout['relays'].get(dest_id)), platform=fanout['names'][dest_id])
+                    for dest_id in fanout['relay_cmds']
+                }
+            }
+        
+        processes = self.platform_processes.get(channel_id)
+        if processes:
+            return {
+                'mode': 'per_destination',
+                'destinations': {
+                    platform_id: {'running': process.poll() is None}
+                    for platform_id, process in processes.items()
+                }
+            }
+        return None
+    
     def stop_multi_platform_stream(self, channel_id):
         """Stop all platform streams for a channel"""
+        if channel_id in self.fanouts:
+            self._stop_fanout(channel_id)
+            return
+        
         if channel_id not in self.platform_processes:
             return
         
-        for platform_id, process in self.platform_processes[channel_id].items():
+        processes = self.platform_processes.pop(channel_id)
+        for platform_id, process in processes.items():
             try:
                 process.terminate()
                 process.wait(timeout=5)
             except:
                 process.kill()
         
-        del self.platform_processes[channel_id]
+        self.platform_logs.pop(channel_id, None)
+    
+    def get_platform_logs(self, channel_id):
+        """Get recent FFmpeg stderr lines per platform destination"""
+        return {
+            platform_id: ring.tail()
+            for platform_id, ring in self.platform_logs.get(channel_id, {}).items()
+        }
 
 
 class AdvancedAnalytics:
@@ -430,15 +661,16 @@ class AdvancedAnalytics:
         """Get analytics for a specific channel"""
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        sessions = StreamSession.query.filter(
+        # One aggregate row, served by the (channel_id, start_time) index
+        total_sessions, total_duration, successful, failed = db.session.query(
+            db.func.count(StreamSession.id),
+            db.func.coalesce(db.func.sum(StreamSession.duration_seconds), 0),
+            db.func.coalesce(db.func.sum(db.case((StreamSession.status == 'stopped', 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((StreamSession.status == 'error', 1), else_=0)), 0)
+        ).filter(
             StreamSession.channel_id == channel_id,
             StreamSession.start_time >= start_date
-        ).all()
-        
-        total_sessions = len(sessions)
-        total_duration = sum([s.duration_seconds or 0 for s in sessions])
-        successful = len([s for s in sessions if s.status == 'stopped'])
-        failed = len([s for s in sessions if s.status == 'error'])
+        ).one()
         
         # Average session duration
         avg_duration = total_duration / total_sessions if total_sessions > 0 else 0
@@ -471,50 +703,80 @@ class AdvancedAnalytics:
         }
     
     def get_peak_hours(self, channel_id=None, days=30):
-        """Get peak streaming hours"""
+        """Get peak streaming hours, in each channel's own timezone"""
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        query = StreamSession.query.filter(StreamSession.start_time >= start_date)
+        # SQLite has no timezone support: count per channel and UTC quarter hour in SQL
+        # (quarters keep :30 and :45 offsets exact), then shift the few buckets to local time
+        utc_hour = db.func.strftime('%Y-%m-%d %H', StreamSession.start_time)
+        quarter = db.cast(db.func.strftime('%M', StreamSession.start_time), db.Integer) // 15
+        query = db.session.query(
+            StreamSession.channel_id, utc_hour, quarter, db.func.count(StreamSession.id)
+        ).filter(StreamSession.start_time >= start_date)
         if channel_id:
-            query = query.filter_by(channel_id=channel_id)
+            query = query.filter(StreamSession.channel_id == channel_id)
+        buckets = query.group_by(StreamSession.channel_id, utc_hour, quarter).all()
         
-        sessions = query.all()
+        timezones = {}
+        for channel in StreamChannel.query.with_entities(StreamChannel.id, StreamChannel.timezone).all():
+            try:
+                timezones[channel.id] = pytz.timezone(channel.timezone or 'UTC')
+            except pytz.UnknownTimeZoneError:
+                timezones[channel.id] = pytz.utc
         
-        # Count sessions by hour
         hour_counts = {}
-        for session in sessions:
-            hour = session.start_time.hour
-            hour_counts[hour] = hour_counts.get(hour, 0) + 1
+        for bucket_channel, hour, bucket_quarter, count in buckets:
+            moment = datetime.strptime(hour, '%Y-%m-%d %H') + timedelta(minutes=15 * bucket_quarter)
+            local_hour = pytz.utc.localize(moment).astimezone(timezones.get(bucket_channel, pytz.utc)).hour
+            hour_counts[local_hour] = hour_counts.get(local_hour, 0) + count
         
-        # Sort by count
-        sorted_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)
+        # Sort by count, earlier hour first on ties
+        sorted_hours = sorted(hour_counts.items(), key=lambda x: (-x[1], x[0]))
         
         return {
             'peak_hours': [{'hour': h, 'sessions': c} for h, c in sorted_hours[:5]],
             'hour_distribution': hour_counts
         }
     
-    def get_video_performance(self, days=30):
-        """Get performance metrics for videos"""
-        videos = VideoLibrary.query.all()
+    def get_video_performance(self, days=30, limit=50):
+        """Get performance metrics for the most used videos"""
+        start_date = datetime.utcnow() - timedelta(days=days)
         
-        results = []
-        for video in videos:
-            sessions = StreamSession.query.filter(
-                StreamSession.video_file == video.file_path,
-                StreamSession.start_time >= datetime.utcnow() - timedelta(days=days)
-            ).all()
-            
-            results.append({
-                'video_id': video.id,
-                'video_title': video.title,
-                'usage_count': len(sessions),
-                'total_duration': sum([s.duration_seconds or 0 for s in sessions]),
-                'last_used': video.last_used.isoformat() if video.last_used else None
-            })
-        
-        # Sort by usage
-        results.sort(key=lambda x: x['usage_count'], reverse=True)
+        # One grouped pass over the sessions in the window, joined to the library
+        usage = db.session.query(
+            StreamSession.video_id.label('video_id'),
+            db.func.count(StreamSession.id).label('usage_count'),
+            db.func.coalesce(db.func.sum(StreamSession.duration_seconds), 0).label('total_duration')
+        ).filter(
+            StreamSession.start_time >= start_date,
+            StreamSession.video_id.isnot(None)
+        ).group_by(StreamSession.video_id).subquery()
+        
+        rows = db.session.query(VideoLibrary, usage.c.usage_count, usage.c.total_duration)\
+            .join(usage, usage.c.video_id == VideoLibrary.id)\
+            .order_by(usage.c.usage_count.desc(), VideoLibrary.id)\
+            .limit(limit).all()
+        
+        results = [{
+            'video_id': video.id,
+            'video_title': video.title,
+            'usage_count': usage_count,
+            'total_duration': total_duration,
+            'last_used': video.last_used.isoformat() if video.last_used else None
+        } for video, usage_count, total_duration in rows]
+        
+        # Unused videos fill the rest of the page, as before
+        if len(results) < limit:
+            used = db.session.query(usage.c.video_id)
+            for video in VideoLibrary.query.filter(VideoLibrary.id.notin_(used))\
+                    .order_by(VideoLibrary.id).limit(limit - len(results)):
+                results.append({
+                    'video_id': video.id,
+                    'video_title': video.title,
+                    'usage_count': 0,
+                    'total_duration': 0,
+                    'last_used': video.last_used.isoformat() if video.last_used else None
+                })
         return results
     
     def _format_duration(self, seconds):
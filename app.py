@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response, stream_with_context, send_file
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
@@ -8,11 +8,10 @@ import os
 from datetime import datetime, date, timedelta
 import pytz
 import gdown
-import threading
 import signal
 import psutil
 from functools import wraps
-from database import db, init_db, StreamSession, StreamLog, Configuration, StreamStats, StreamChannel, VideoLibrary, User
+from database import db, init_db, StreamSession, StreamLog, Configuration, StreamStats, ChannelDailyStats, StreamChannel, VideoLibrary, User
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'streamlive-secret-key-change-in-production'
@@ -34,6 +33,14 @@ def load_user(user_id):
 init_db(app)
 
 from streaming_service import streaming_service
+from log_sink import log_sink
+from system_metrics import system_metrics
+from video_probe import VideoProber
+from chunked_upload import ChunkedUploads, UploadError
+from video_watcher import VideoWatcher
+streaming_service.init_app(app)
+log_sink.init_app(app)
+system_metrics.init_app(app)
 
 class StreamManager:
     def __init__(self):
@@ -53,18 +60,10 @@ class StreamManager:
             self.log_messages.pop(0)
         print(log_entry)
         
-        # Save to database
-        try:
-            log = StreamLog(
-                timestamp=datetime.utcnow(),
-                level=level,
-                message=message,
-                session_id=session_id
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception as e:
-            print(f"Error saving log to DB: {e}")
+        # Save to database (batched by the background log sink)
+        log_sink.write(message, level, session_id)
+        # Same payload as channel logs (StreamingService.add_stream_log), channel_id None
+        self.streaming_service.events.publish('log', {'channel_id': None, 'message': message, 'level': level})
     
 
     
@@ -169,6 +168,7 @@ class StreamManager:
                 channel_id=channel_id,
                 start_time=datetime.utcnow(),
                 video_file=channel.video_path,
+                video_id=self.streaming_service.get_video_id(channel.video_path),
                 status='started'
             )
             db.session.add(session)
@@ -178,7 +178,7 @@ class StreamManager:
             self.running_channels[channel_id] = session.id
             
             self.add_log(f"Streaming dimulai untuk {channel.name}!", "INFO", session.id)
-            self.update_daily_stats()
+            self.streaming_service.daily_stats.session_started(session)
             return True, f"Streaming {channel.name} berhasil dimulai"
         except Exception as e:
             self.add_log(f"Error start stream {channel.name}: {e}", "ERROR")
@@ -219,7 +219,7 @@ class StreamManager:
                     session.duration_seconds = int((session.end_time - session.start_time).total_seconds())
                     session.status = 'stopped'
                     db.session.commit()
-                    self.update_daily_stats()
+                    self.streaming_service.daily_stats.session_ended(session)
             except Exception as e:
                 print(f"Error updating session: {e}")
             
@@ -237,27 +237,11 @@ class StreamManager:
         return True, "Semua streaming dihentikan"
     
     def update_daily_stats(self):
-        """Update statistik harian"""
+        """Rebuild today's statistics from the sessions (normally kept up to date incrementally)"""
         try:
-            today = date.today()
-            stats = StreamStats.query.filter_by(date=today).first()
-            
-            if not stats:
-                stats = StreamStats(date=today)
-                db.session.add(stats)
-            
-            # Count sessions for today
-            sessions = StreamSession.query.filter(
-                db.func.date(StreamSession.start_time) == today
-            ).all()
-            
-            stats.total_sessions = len(sessions)
-            stats.successful_streams = len([s for s in sessions if s.status == 'stopped'])
-            stats.failed_streams = len([s for s in sessions if s.status == 'error'])
-            stats.total_duration_seconds = sum([s.duration_seconds or 0 for s in sessions])
-            
-            db.session.commit()
+            self.streaming_service.daily_stats.rebuild(datetime.utcnow().date())
         except Exception as e:
+            db.session.rollback()
             print(f"Error updating stats: {e}")
     
     def get_status(self):
@@ -265,37 +249,12 @@ class StreamManager:
         self.running_channels = dict(self.streaming_service.running_channels)
         self.processes = dict(self.streaming_service.active_streams)
         
-        channels = StreamChannel.query.filter_by(enabled=True).all()
-        channel_statuses = []
-        
-        for channel in channels:
-            video_exists = os.path.exists(channel.video_path) if channel.video_path else False
-            video_size = 0
-            if video_exists:
-                video_size = os.path.getsize(channel.video_path) / (1024 * 1024)
-            
-            # Check if really running (double check)
-            is_running = self.streaming_service.is_stream_active(channel.id)
-            
-            channel_statuses.append({
-                "id": channel.id,
-                "name": channel.name,
-                "running": is_running,
-                "video_exists": video_exists,
-                "video_size_mb": round(video_size, 2),
-                "is_streaming_time": self.is_streaming_time(channel),
-                "current_time": datetime.now(pytz.timezone(channel.timezone)).strftime('%H:%M:%S'),
-                "schedule": f"{channel.start_time} - {channel.end_time}"
-            })
-        
-        return {
-            "channels": channel_statuses,
-            "total_running": len(self.streaming_service.active_streams),
-            "total_channels": len(channels)
-        }
+        data, _, _ = self.streaming_service.status.get()
+        return data
 
 # Global stream manager
 stream_manager = StreamManager()
+streaming_service.jobs.log = stream_manager.add_log
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -466,7 +425,59 @@ def simple():
 
 @app.route('/api/status')
 def api_status():
-    return jsonify(stream_manager.get_status())
+    # Cached snapshot; an unchanged payload is answered with 304 Not Modified
+    _, body, etag = streaming_service.status.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@app.route('/api/status/live')
+def api_status_live():
+    # Clocks, progress and restart countdowns: they change every second, so not in the ETag'd status
+    return jsonify(streaming_service.status.live())
+
+SSE_KEEPALIVE_SECONDS = 15
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events: stream lifecycle, logs, health, metrics and CRUD changes
+
+    Each connection holds a worker thread for as long as the page is open: run gunicorn
+    with threaded workers (-k gthread, see configs/). Events come from this worker process
+    only, so the dashboard keeps a slow poll next to the stream.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    subscriber = streaming_service.events.subscribe(last_event_id)
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Comment line keeps proxies from closing the connection and detects gone clients
+                    yield ": keepalive\n\n"
+                    continue
+                event_id = f"id: {event['id']}\n" if event['id'] else ''
+                payload = json.dumps(dict(event['data'], timestamp=event['timestamp']), default=str)
+                yield f"{event_id}event: {event['type']}\ndata: {payload}\n\n"
+        finally:
+            streaming_service.events.unsubscribe(subscriber)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable nginx response buffering
+    })
+
+def publish_system_metrics():
+    """Push CPU/memory/disk usage to dashboards (only while someone listens)"""
+    if not streaming_service.events.has_subscribers():
+        return
+    sample = system_metrics.latest()
+    if sample:
+        streaming_service.events.publish('metrics', sample)
+
+streaming_service.supervisor.call_every(10, publish_system_metrics)
 
 @app.route('/api/logs')
 def api_logs():
@@ -475,18 +486,37 @@ def api_logs():
     db_logs = [log.to_dict() for log in reversed(logs)]
     return jsonify({"logs": stream_manager.log_messages[-50:], "db_logs": db_logs})
 
+@app.route('/api/logs/<int:channel_id>')
+def api_stream_logs(channel_id):
+    """Get service logs and recent FFmpeg stderr lines for a stream"""
+    include_ffmpeg = request.args.get('ffmpeg', '1') != '0'
+    return jsonify({
+        "channel_id": channel_id,
+        "logs": streaming_service.get_stream_logs(channel_id, include_ffmpeg)
+    })
+
+@app.route('/api/progress/<int:channel_id>')
+def api_stream_progress(channel_id):
+    """Get FFmpeg progress telemetry (fps, bitrate, speed, drops) for a stream"""
+    seconds = request.args.get('seconds', 300, type=int)
+    progress = streaming_service.get_stream_progress(channel_id, seconds)
+    if progress is None:
+        return jsonify({"success": False, "message": "Stream is not active"}), 404
+    return jsonify({"success": True, "channel_id": channel_id, **progress})
+
 
 
 @app.route('/api/channels', methods=['GET', 'POST'])
 def api_channels():
     if request.method == 'POST':
         data = request.json
-        # Validate video path
+        # Validate video path (playlist channels take their videos from the playlist)
         video_path = data.get('video_path', '')
-        if not video_path:
+        playlist_id = data.get('playlist_id') or None
+        if not video_path and not playlist_id:
             return jsonify({"success": False, "message": "Video path tidak boleh kosong"})
         
-        if not os.path.exists(video_path):
+        if video_path and not os.path.exists(video_path):
             return jsonify({"success": False, "message": "Video file tidak ditemukan"})
         
         # Parse dates
@@ -512,6 +542,7 @@ def api_channels():
             stream_key=data['stream_key'],
             rtmp_url=data.get('rtmp_url', 'rtmp://a.rtmp.youtube.com/live2/'),
             video_path=video_path,
+            playlist_id=playlist_id,
             start_date=start_date,
             end_date=end_date,
             start_time=data.get('start_time', '08:00'),
@@ -521,10 +552,16 @@ def api_channels():
             bitrate=data.get('bitrate', '4000k'),
             fps=data.get('fps', 30),
             preset=data.get('preset', 'veryfast'),
+            restart_base_delay=data.get('restart_base_delay', 2.0),
+            restart_max_delay=data.get('restart_max_delay', 120.0),
+            restart_budget=data.get('restart_budget', 10),
+            restart_window_seconds=data.get('restart_window_seconds', 600),
+            restart_cooloff_seconds=data.get('restart_cooloff_seconds', 900),
             enabled=data.get('enabled', True)
         )
         db.session.add(channel)
         db.session.commit()
+        streaming_service.events.publish('channels', {'action': 'created', 'channel_id': channel.id})
         return jsonify({"success": True, "message": "Channel ditambahkan", "channel": channel.to_dict()})
     
     channels = StreamChannel.query.all()
@@ -539,6 +576,7 @@ def api_channel(channel_id):
             return jsonify({"success": False, "message": "Stop streaming dulu!"})
         db.session.delete(channel)
         db.session.commit()
+        streaming_service.events.publish('channels', {'action': 'deleted', 'channel_id': channel_id})
         return jsonify({"success": True, "message": "Channel dihapus"})
     
     if request.method == 'PUT':
@@ -547,6 +585,7 @@ def api_channel(channel_id):
             if hasattr(channel, key):
                 setattr(channel, key, value)
         db.session.commit()
+        streaming_service.events.publish('channels', {'action': 'updated', 'channel_id': channel_id})
         return jsonify({"success": True, "message": "Channel diupdate", "channel": channel.to_dict()})
     
     return jsonify({"channel": channel.to_dict()})
@@ -556,7 +595,33 @@ def api_channel(channel_id):
 @app.route('/api/start/<int:channel_id>', methods=['POST'])
 def api_start(channel_id):
     success, message = stream_manager.start_stream(channel_id)
-    return jsonify({"success": success, "message": message})
+    return jsonify({
+        "success": success,
+        "message": message,
+        "admission": streaming_service.admission.get_state(channel_id)
+    })
+
+@app.route('/api/placement')
+def api_placement():
+    """Core sets and current CPU affinity of FFmpeg children"""
+    return jsonify(streaming_service.placement.get_status())
+
+@app.route('/api/admission')
+def api_admission():
+    """CPU budget, learned per-profile costs and queued starts"""
+    return jsonify(streaming_service.admission.get_status())
+
+@app.route('/api/resources')
+def api_resources():
+    """Latest CPU, memory, I/O and context-switch sample of every FFmpeg process tree"""
+    return jsonify(streaming_service.resources.get_status())
+
+@app.route('/api/resources/<int:channel_id>')
+def api_channel_resources(channel_id):
+    sample = streaming_service.resources.get_channel(channel_id)
+    if not sample:
+        return jsonify({"success": False, "error": "Channel not running or not sampled yet"}), 404
+    return jsonify({"success": True, "resources": sample})
 
 @app.route('/api/stop/<int:channel_id>', methods=['POST'])
 def api_stop(channel_id):
@@ -568,39 +633,20 @@ def api_stop_all():
     success, message = stream_manager.stop_all_streams()
     return jsonify({"success": success, "message": message})
 
+video_prober = VideoProber(streaming_service)
+uploads = ChunkedUploads(streaming_service, video_prober)
+uploads.start()
+video_watcher = VideoWatcher(streaming_service, video_prober, './videos')
+video_watcher.start()
+
 def get_video_metadata(file_path):
-    """Get video metadata using ffprobe"""
-    metadata = {
-        'duration_seconds': 0,
-        'resolution': None,
-        'file_size_mb': 0
-    }
-    
+    """Get video metadata using ffprobe (cached while the file is unchanged)"""
     try:
-        if os.path.exists(file_path):
-            metadata['file_size_mb'] = os.path.getsize(file_path) / (1024 * 1024)
-            
-            result = subprocess.run([
-                'ffprobe', '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-show_entries', 'stream=width,height',
-                '-of', 'json',
-                file_path
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                import json as json_lib
-                data = json_lib.loads(result.stdout)
-                if 'format' in data and 'duration' in data['format']:
-                    metadata['duration_seconds'] = int(float(data['format']['duration']))
-                if 'streams' in data and len(data['streams']) > 0:
-                    stream = data['streams'][0]
-                    if 'width' in stream and 'height' in stream:
-                        metadata['resolution'] = f"{stream['width']}x{stream['height']}"
+        return video_prober.get_metadata(file_path)
     except Exception as e:
+        db.session.rollback()
         print(f"Error getting video metadata: {e}")
-    
-    return metadata
+        return {'duration_seconds': 0, 'resolution': None, 'file_size_mb': 0}
 
 @app.route('/api/videos', methods=['GET', 'POST'])
 def api_videos():
@@ -621,15 +667,13 @@ def api_videos():
             source=data.get('source', 'manual')
         )
         
-        # Get file metadata
-        metadata = get_video_metadata(data['file_path'])
-        video.file_size_mb = metadata['file_size_mb']
-        video.duration_seconds = metadata['duration_seconds']
-        video.resolution = metadata['resolution']
-        
         db.session.add(video)
         db.session.commit()
-        return jsonify({"success": True, "message": "Video ditambahkan ke library", "video": video.to_dict()})
+        
+        # Duration and resolution are filled in by a background probe
+        job = video_prober.request_probe(video)
+        streaming_service.events.publish('videos', {'action': 'created', 'video_id': video.id})
+        return jsonify({"success": True, "message": "Video ditambahkan ke library", "video": video.to_dict(), "job_id": job.id})
     
     # GET - return all videos
     videos = VideoLibrary.query.order_by(VideoLibrary.created_at.desc()).all()
@@ -650,15 +694,24 @@ def api_video(video_id):
                 "message": f"Video digunakan oleh channel: {', '.join(channel_names)}"
             })
         
-        # Delete file if exists
-        if os.path.exists(video.file_path):
-            try:
-                os.remove(video.file_path)
-            except Exception as e:
-                print(f"Error deleting file: {e}")
+        # Drop cached renditions of this video (a copy of the same content keeps them)
+        streaming_service.renditions.invalidate(video)
+        
+        # Delete file (a hard-linked copy only drops its name) and the thumbnail unless a copy shares it
+        paths = [video.file_path]
+        if video.thumbnail_path and not VideoLibrary.query.filter(
+                VideoLibrary.thumbnail_path == video.thumbnail_path, VideoLibrary.id != video.id).first():
+            paths.append(video.thumbnail_path)
+        for path in paths:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except Exception as e:
+                    print(f"Error deleting file: {e}")
         
         db.session.delete(video)
         db.session.commit()
+        streaming_service.events.publish('videos', {'action': 'deleted', 'video_id': video_id})
         return jsonify({"success": True, "message": "Video dihapus dari library"})
     
     if request.method == 'PUT':
@@ -667,13 +720,26 @@ def api_video(video_id):
             if hasattr(video, key) and key not in ['id', 'created_at']:
                 setattr(video, key, value)
         db.session.commit()
+        streaming_service.events.publish('videos', {'action': 'updated', 'video_id': video_id})
         return jsonify({"success": True, "message": "Video diupdate", "video": video.to_dict()})
     
     return jsonify({"video": video.to_dict()})
 
+@app.route('/api/videos/<int:video_id>/thumbnail')
+def api_video_thumbnail(video_id):
+    video = VideoLibrary.query.get_or_404(video_id)
+    if not video.thumbnail_path or not os.path.exists(video.thumbnail_path):
+        return jsonify({"success": False, "message": "No thumbnail yet"}), 404
+    return send_file(os.path.abspath(video.thumbnail_path), mimetype='image/jpeg')
+
+@app.route('/api/renditions')
+def api_renditions():
+    """Pre-transcoded rendition cache status"""
+    return jsonify(streaming_service.renditions.get_status())
+
 @app.route('/api/videos/upload', methods=['POST'])
 def api_video_upload():
-    """Upload video file"""
+    """Upload video file in one multipart request (large files: /api/videos/uploads)"""
     try:
         if 'file' not in request.files:
             return jsonify({"success": False, "message": "No file provided"}), 400
@@ -684,154 +750,181 @@ def api_video_upload():
         if file.filename == '':
             return jsonify({"success": False, "message": "No file selected"}), 400
         
-        # Create videos directory if not exists
-        os.makedirs('./videos', exist_ok=True)
-        
-        # Generate safe filename
-        import re
-        safe_filename = re.sub(r'[^\w\s.-]', '', file.filename)
-        safe_filename = safe_filename.replace(' ', '_')
-        
-        # Check if filename already exists
-        counter = 1
-        original_filename = safe_filename
-        while os.path.exists(f"./videos/{safe_filename}"):
-            name, ext = os.path.splitext(original_filename)
-            safe_filename = f"{name}_{counter}{ext}"
-            counter += 1
-        
-        file_path = f"./videos/{safe_filename}"
-        
-        # Save file
-        file.save(file_path)
+        # Same steps as a chunked upload: duplicate policy, then into the library
+        try:
+            video, job = uploads.save(file.filename, file.stream, title)
+        except UploadError as e:
+            return jsonify({"success": False, "message": str(e)}), e.status
+        safe_filename = video.filename
         stream_manager.add_log(f"Video uploaded: {safe_filename}", "INFO")
         
-        # Add to library
-        video = VideoLibrary(
-            title=title,
-            filename=safe_filename,
-            file_path=file_path,
-            source='upload'
-        )
-        
-        # Get metadata
-        metadata = get_video_metadata(file_path)
-        video.file_size_mb = metadata['file_size_mb']
-        video.duration_seconds = metadata['duration_seconds']
-        video.resolution = metadata['resolution']
-        
-        db.session.add(video)
-        db.session.commit()
-        
         return jsonify({
             "success": True, 
             "message": f"Video berhasil diupload: {safe_filename}",
-            "video": video.to_dict()
+            "video": video.to_dict(),
+            "job_id": job.id
         })
     except Exception as e:
         stream_manager.add_log(f"Error upload video: {e}", "ERROR")
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/videos/uploads', methods=['POST'])
+def api_upload_create():
+    """Start a resumable upload: {"filename", "size" (bytes), "title", optional "sha256"}"""
+    data = request.json or {}
+    try:
+        upload = uploads.create(data.get('filename'), data.get('size'), data.get('title'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({"success": False, "message": str(e)}), e.status
+    return jsonify({"success": True, "upload": upload.to_dict(), "chunk_size": uploads.chunk_size}), 201
+
+@app.route('/api/videos/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def api_upload(upload_id):
+    """Upload status (GET), next chunk as raw body at ?offset= (PUT), abort (DELETE)"""
+    upload = uploads.get(upload_id)
+    if not upload:
+        return jsonify({"success": False, "message": "Upload not found"}), 404
+    try:
+        if request.method == 'PUT':
+            uploads.write_chunk(upload, request.args.get('offset', type=int), request.stream, request.content_length)
+        elif request.method == 'DELETE':
+            uploads.abort(upload)
+    except UploadError as e:
+        return jsonify({"success": False, "message": str(e), "offset": e.offset}), e.status
+    return jsonify({"success": True, "upload": upload.to_dict()})
+
+@app.route('/api/videos/uploads/<upload_id>/complete', methods=['POST'])
+def api_upload_complete(upload_id):
+    """Finish an upload: add the video to the library and queue its probe"""
+    upload = uploads.get(upload_id)
+    if not upload:
+        return jsonify({"success": False, "message": "Upload not found"}), 404
+    try:
+        video, job = uploads.complete(upload)
+    except UploadError as e:
+        return jsonify({"success": False, "message": str(e), "offset": e.offset}), e.status
+    stream_manager.add_log(f"Video uploaded: {video.filename}", "INFO")
+    return jsonify({
+        "success": True,
+        "message": f"Video berhasil diupload: {video.filename}",
+        "video": video.to_dict(),
+        "job_id": job.id
+    })
+
 @app.route('/api/videos/scan', methods=['POST'])
 def api_video_scan():
-    """Scan ./videos folder and add unregistered videos to library"""
-    try:
-        videos_dir = './videos'
-        if not os.path.exists(videos_dir):
-            os.makedirs(videos_dir)
-            return jsonify({"success": True, "message": "Folder videos dibuat", "found": 0, "added": 0})
-        
-        # Video extensions
-        video_extensions = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.webm', '.m4v']
-        
-        found_files = []
-        for filename in os.listdir(videos_dir):
-            file_path = os.path.join(videos_dir, filename)
-            if os.path.isfile(file_path):
-                _, ext = os.path.splitext(filename)
-                if ext.lower() in video_extensions:
-                    found_files.append((filename, file_path))
-        
-        added_count = 0
-        for filename, file_path in found_files:
-            # Check if already in library
-            existing = VideoLibrary.query.filter_by(filename=filename).first()
-            if not existing:
-                # Add to library
-                video = VideoLibrary(
-                    title=filename.rsplit('.', 1)[0],  # Remove extension
-                    filename=filename,
-                    file_path=file_path,
-                    source='scan'
-                )
-                
-                # Get metadata
-                metadata = get_video_metadata(file_path)
-                video.file_size_mb = metadata['file_size_mb']
-                video.duration_seconds = metadata['duration_seconds']
-                video.resolution = metadata['resolution']
-                
-                db.session.add(video)
-                added_count += 1
-        
-        db.session.commit()
-        stream_manager.add_log(f"Scan completed: {len(found_files)} found, {added_count} added", "INFO")
-        
-        return jsonify({
-            "success": True,
-            "message": "Scan selesai",
-            "found": len(found_files),
-            "added": added_count
-        })
-    except Exception as e:
-        stream_manager.add_log(f"Error scanning videos: {e}", "ERROR")
-        return jsonify({"success": False, "message": str(e)}), 500
+    """Queue a scan of ./videos for unregistered videos; progress via /api/jobs/<job_id> and 'jobs' events"""
+    job = video_prober.start_scan('./videos')
+    return jsonify({
+        "success": True,
+        "message": "Scan dimulai",
+        "job_id": job.id,
+        "job": job.to_dict()
+    }), 202
+
+@app.route('/api/videos/scan/<int:job_id>')
+def api_video_scan_status(job_id):
+    """Progress of a scan job"""
+    job = streaming_service.jobs.get(job_id)
+    if not job or job.job_type != 'scan':
+        return jsonify({"success": False, "message": "Scan job not found"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
+@app.route('/api/videos/watcher')
+def api_video_watcher():
+    """Live folder watcher: mode (inotify/poll), files settling and changes applied"""
+    return jsonify({"success": True, "watcher": video_watcher.status()})
 
 @app.route('/api/videos/download-gdrive', methods=['POST'])
 def api_video_download_gdrive():
-    """Download video from Google Drive to library"""
+    """Queue a download of a video from Google Drive to the library"""
     data = request.json
+    if not data or not data.get('gdrive_file_id') or not data.get('title'):
+        return jsonify({"success": False, "message": "title and gdrive_file_id are required"}), 400
     
-    def download_thread():
-        try:
-            # Create videos directory if not exists
-            os.makedirs('./videos', exist_ok=True)
-            
-            filename = data.get('filename', f"video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4")
-            file_path = f"./videos/{filename}"
-            
-            stream_manager.add_log(f"Downloading {data['title']} dari Google Drive...", "INFO")
-            
-            url = f"https://drive.google.com/uc?id={data['gdrive_file_id']}"
-            gdown.download(url, file_path, quiet=False)
-            
-            # Add to library
-            video = VideoLibrary(
-                title=data['title'],
-                filename=filename,
-                file_path=file_path,
-                gdrive_file_id=data['gdrive_file_id'],
-                source='gdrive'
-            )
-            
-            # Get metadata
-            metadata = get_video_metadata(file_path)
-            video.file_size_mb = metadata['file_size_mb']
-            video.duration_seconds = metadata['duration_seconds']
-            video.resolution = metadata['resolution']
-            
-            db.session.add(video)
-            db.session.commit()
-            
-            stream_manager.add_log(f"Download selesai: {data['title']}", "INFO")
-        except Exception as e:
-            stream_manager.add_log(f"Error download: {e}", "ERROR")
+    job = streaming_service.jobs.submit('gdrive_download', {
+        'title': data['title'],
+        'gdrive_file_id': data['gdrive_file_id'],
+        'filename': data.get('filename') or f"video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+    }, dedupe_key=f"gdrive:{data['gdrive_file_id']}")
+    return jsonify({"success": True, "message": "Download dimulai", "job_id": job.id}), 202
+
+def download_gdrive_job(job):
+    """'gdrive_download' job: fetch the file, then add it to the library"""
+    data = job.payload
+    os.makedirs('./videos', exist_ok=True)
+    file_path = f"./videos/{data['filename']}"
+    
+    job.update(progress=0, message=f"Downloading {data['title']} dari Google Drive...", force=True)
+    url = f"https://drive.google.com/uc?id={data['gdrive_file_id']}"
+    # Download next to the target: scans skip .part files and a retry starts clean
+    partial = file_path + '.part'
+    if not gdown.download(url, partial, quiet=True):
+        raise RuntimeError(f"Download gagal: {data['gdrive_file_id']}")
+    job.check()
+    
+    # Same bytes already in the library: keep one copy (hard link) or drop the download
+    video = VideoLibrary.query.filter_by(filename=data['filename']).first()
+    content = streaming_service.content
+    key, full, duplicate = content.identify(partial, os.path.getsize(partial), exclude_id=video.id if video else None)
+    if duplicate and content.policy() == 'reject':
+        os.remove(partial)
+        job.message = f"Download {data['title']} dibuang: duplikat dari '{duplicate.title}' ({duplicate.filename})"
+        return {'duplicate_of': duplicate.id}
+    if duplicate and content.link(file_path, duplicate.file_path):
+        os.remove(partial)
+    else:
+        os.replace(partial, file_path)
+    
+    if not video:
+        video = VideoLibrary(
+            title=data['title'],
+            filename=data['filename'],
+            file_path=file_path,
+            gdrive_file_id=data['gdrive_file_id'],
+            source='gdrive'
+        )
+        db.session.add(video)
+    stat = os.stat(file_path)
+    video.fingerprint, video.file_hash = key, full
+    video.hashed_size, video.hashed_mtime = stat.st_size, stat.st_mtime
+    db.session.commit()  # known before the folder watcher picks the file up
+    
+    # Get metadata (already off the request path, shared with copies of the same content)
+    metadata = video_prober.get_metadata(file_path, key)
+    video.file_size_mb = metadata['file_size_mb']
+    video.duration_seconds = metadata['duration_seconds']
+    video.resolution = metadata['resolution']
+    db.session.commit()
+    streaming_service.events.publish('videos', {'action': 'created', 'video_id': video.id})
+    video_prober.request_thumbnail(video)
     
-    thread = threading.Thread(target=download_thread)
-    thread.start()
-    return jsonify({"success": True, "message": "Download dimulai"})
+    job.message = f"Download selesai: {data['title']}"
+    return {'video_id': video.id}
 
+streaming_service.jobs.register('gdrive_download', download_gdrive_job, priority=10, concurrency=2)
 
+@app.route('/api/jobs')
+def api_jobs():
+    """Background jobs, newest first: ?status=queued,running&type=scan&limit=50"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    jobs = streaming_service.jobs.list(request.args.get('status'), request.args.get('type'), limit)
+    return jsonify({"jobs": [job.to_dict() for job in jobs]})
+
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    job = streaming_service.jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def api_job_cancel(job_id):
+    """Cancel a queued job or stop a running one"""
+    if not streaming_service.jobs.cancel(job_id):
+        return jsonify({"success": False, "message": "Job not found or already finished"}), 404
+    return jsonify({"success": True, "message": "Job dibatalkan"})
 
 @app.route('/api/history')
 def api_history():
@@ -856,55 +949,45 @@ def api_stats():
         "total_duration_seconds": total_duration
     })
 
+@app.route('/api/stats/channel/<int:channel_id>')
+def api_channel_stats(channel_id):
+    """Daily statistics of one channel"""
+    days = request.args.get('days', 7, type=int)
+    stats = ChannelDailyStats.query.filter_by(channel_id=channel_id)\
+        .order_by(ChannelDailyStats.date.desc()).limit(days).all()
+    return jsonify({"daily_stats": [s.to_dict() for s in reversed(stats)]})
+
+@app.route('/api/stats/rebuild', methods=['POST'])
+@login_required
+def api_stats_rebuild():
+    """Rebuild daily statistics from the sessions: {"date": "YYYY-MM-DD"} or {"days": N} back from today"""
+    data = request.json or {}
+    try:
+        if data.get('date'):
+            days = [date.fromisoformat(data['date'])]
+        else:
+            today = datetime.utcnow().date()
+            days = [today - timedelta(days=n) for n in range(int(data.get('days', 1)))]
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid date"}), 400
+    
+    rebuilt = [streaming_service.daily_stats.rebuild(day).to_dict() for day in sorted(days)]
+    return jsonify({"success": True, "daily_stats": rebuilt})
+
 @app.route('/api/system/metrics')
 def api_system_metrics():
-    """Get system metrics (CPU, Memory, Disk)"""
+    """Get system metrics (CPU, Memory, Disk, Network), ?history=<seconds> adds recent samples"""
     try:
-        # CPU Usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_count = psutil.cpu_count()
-        
-        # Memory Usage
-        memory = psutil.virtual_memory()
-        memory_total = memory.total / (1024 ** 3)  # GB
-        memory_used = memory.used / (1024 ** 3)    # GB
-        memory_percent = memory.percent
-        
-        # Disk Usage
-        disk = psutil.disk_usage('/')
-        disk_total = disk.total / (1024 ** 3)  # GB
-        disk_used = disk.used / (1024 ** 3)    # GB
-        disk_percent = disk.percent
-        
-        # Network (optional)
-        net_io = psutil.net_io_counters()
-        
-        return jsonify({
-            "success": True,
-            "cpu": {
-                "percent": round(cpu_percent, 1),
-                "count": cpu_count,
-                "per_cpu": psutil.cpu_percent(interval=0.1, percpu=True)
-            },
-            "memory": {
-                "total_gb": round(memory_total, 2),
-                "used_gb": round(memory_used, 2),
-                "available_gb": round(memory.available / (1024 ** 3), 2),
-                "percent": round(memory_percent, 1)
-            },
-            "disk": {
-                "total_gb": round(disk_total, 2),
-                "used_gb": round(disk_used, 2),
-                "free_gb": round(disk.free / (1024 ** 3), 2),
-                "percent": round(disk_percent, 1)
-            },
-            "network": {
-                "bytes_sent": net_io.bytes_sent,
-                "bytes_recv": net_io.bytes_recv,
-                "packets_sent": net_io.packets_sent,
-                "packets_recv": net_io.packets_recv
-            }
-        })
+        # Latest background sample; only the first request after startup samples inline
+        sample = system_metrics.latest() or system_metrics.sample()
+        if not sample:
+            return jsonify({"success": False, "error": "No metrics sampled yet"}), 503
+        
+        result = dict(sample, success=True)
+        history = request.args.get('history', type=float)
+        if history:
+            result['history'] = system_metrics.history(history)
+        return jsonify(result)
     except Exception as e:
         return jsonify({
             "success": False,
@@ -926,15 +1009,15 @@ from database import Playlist, PlaylistItem, ScheduledTask, PlatformDestination,
 automated_scheduler = None
 health_monitor = None
 playlist_manager = PlaylistManager()
-multi_platform = None
+# Starts nothing until asked: needed by the platform routes under gunicorn too
+multi_platform = MultiPlatformStreamer(stream_manager)
 analytics = AdvancedAnalytics()
 
 def init_advanced_features():
     """Initialize advanced features after app starts"""
-    global automated_scheduler, health_monitor, multi_platform
+    global automated_scheduler, health_monitor
     automated_scheduler = AutomatedScheduler(stream_manager)
     health_monitor = StreamHealthMonitor(stream_manager)
-    multi_platform = MultiPlatformStreamer(stream_manager)
 
 # --- Playlist Management ---
 @app.route('/api/playlists', methods=['GET', 'POST'])
@@ -1054,16 +1137,62 @@ def api_platform(platform_id):
     db.session.commit()
     return jsonify({"success": True, "message": "Platform deleted"})
 
+@app.route('/api/platforms/start/<int:channel_id>', methods=['POST'])
+@login_required
+def api_platforms_start(channel_id):
+    """Start multi-platform streaming (shared encode + tee fan-out by default)"""
+    data = request.get_json(silent=True) or {}
+    success, message = multi_platform.start_multi_platform_stream(
+        channel_id,
+        shared_encode=data.get('shared_encode')
+    )
+    return jsonify({"success": success, "message": message})
+
+@app.route('/api/platforms/stop/<int:channel_id>', methods=['POST'])
+@login_required
+def api_platforms_stop(channel_id):
+    """Stop multi-platform streaming for a channel"""
+    multi_platform.stop_multi_platform_stream(channel_id)
+    return jsonify({"success": True, "message": "Multi-platform stream stopped"})
+
+@app.route('/api/platforms/status/<int:channel_id>')
+@login_required
+def api_platforms_status(channel_id):
+    """Get encoder/relay state and recent FFmpeg lines of a multi-platform stream"""
+    return jsonify({
+        "status": multi_platform.get_multi_platform_status(channel_id),
+        "logs": multi_platform.get_platform_logs(channel_id)
+    })
+
 # --- Stream Health ---
 @app.route('/api/health/<int:session_id>')
 @login_required
 def api_stream_health(session_id):
-    """Get health metrics for a session"""
-    health_checks = StreamHealth.query.filter_by(session_id=session_id)\
-        .order_by(StreamHealth.timestamp.desc()).limit(50).all()
+    """Get health metrics for a session: the last 50 samples, or a ?hours= / ?start=&end= range
+    served from raw samples, 1-minute or 1-hour rollups depending on its length"""
+    hours = request.args.get('hours', type=float)
+    start = request.args.get('start')
+    end = request.args.get('end')
+    if not hours and not start:
+        health_checks = StreamHealth.query.filter_by(session_id=session_id)\
+            .order_by(StreamHealth.timestamp.desc()).limit(50).all()
+        return jsonify({
+            "resolution": "raw",
+            "health_checks": [h.to_dict() for h in health_checks]
+        })
+    
+    try:
+        end = datetime.fromisoformat(end) if end else datetime.utcnow()
+        start = datetime.fromisoformat(start) if start else end - timedelta(hours=hours)
+    except ValueError:
+        return jsonify({"success": False, "error": "start/end must be ISO timestamps (UTC)"}), 400
     
+    resolution, points = streaming_service.health_rollups.query(session_id, start, end)
     return jsonify({
-        "health_checks": [h.to_dict() for h in health_checks]
+        "resolution": resolution if resolution == 'raw' else f"{resolution}s",
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "health_checks": points
     })
 
 # --- Analytics ---
@@ -1089,7 +1218,8 @@ def api_peak_hours():
 def api_video_performance():
     """Get video performance metrics"""
     days = request.args.get('days', 30, type=int)
-    data = analytics.get_video_performance(days)
+    limit = request.args.get('limit', 50, type=int)
+    data = analytics.get_video_performance(days, limit)
     return jsonify(data)
 
 @app.route('/api/analytics/export')
@@ -1117,6 +1247,7 @@ def signal_handler(sig, frame):
     if automated_scheduler:
         automated_scheduler.shutdown()
     stream_manager.stop_all_streams()
+    log_sink.close()
     os._exit(0)
 
 if __name__ == '__main__':
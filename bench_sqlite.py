@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+SQLite Contention Benchmark
+Runs the app's write pattern (log inserts, health rows, session updates)
+from several threads next to readers polling status-style queries, once
+with SQLite defaults and once with the tuned pragmas from database.py, and
+reports throughput, write latency and "database is locked" errors. Both
+runs wait the same time for a lock, so only the journal mode, sync level
+and caches differ.
+
+Usage: python bench_sqlite.py [seconds] [writers] [readers] [busy wait seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import SQLITE_PRAGMAS, db, tune_sqlite, ensure_indexes
+
+
+def run(label, tuned, seconds, writers, readers, busy_wait):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Baseline: rollback journal and FULL sync, as before the tuning
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': busy_wait})
+    if tuned:
+        tune_sqlite(engine, dict(SQLITE_PRAGMAS, busy_timeout=int(busy_wait * 1000)))
+    db.metadata.create_all(engine)
+    if tuned:
+        ensure_indexes(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO stream_sessions (id, channel_id, start_time, status) "
+                          "VALUES (1, 1, :now, 'started')"), {'now': datetime.utcnow()})
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    result = {'writes': 0, 'reads': 0, 'locked': 0, 'latencies': []}
+
+    def writer(n):
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO stream_logs (timestamp, level, message, session_id) "
+                                      "VALUES (:now, 'INFO', :msg, 1)"), {'now': datetime.utcnow(), 'msg': f'writer {n}'})
+                    if n % 2:
+                        conn.execute(text("INSERT INTO stream_health (session_id, timestamp, fps, status) "
+                                          "VALUES (1, :now, 30, 'healthy')"), {'now': datetime.utcnow()})
+                    else:
+                        conn.execute(text("UPDATE stream_sessions SET duration_seconds = duration_seconds + 1 "
+                                          "WHERE id = 1"))
+                with lock:
+                    result['writes'] += 1
+                    result['latencies'].append(time.perf_counter() - started)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                with lock:
+                    result['locked'] += 1
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT * FROM stream_logs WHERE session_id = 1 "
+                                      "ORDER BY timestamp DESC LIMIT 50")).fetchall()
+                    conn.execute(text("SELECT COUNT(*), SUM(duration_seconds) FROM stream_sessions")).fetchall()
+                with lock:
+                    result['reads'] += 1
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                with lock:
+                    result['locked'] += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    latencies = sorted(result['latencies']) or [0]
+    p95 = latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0]
+    print(f"{label:<10} writes/s {result['writes'] / seconds:8.0f}   reads/s {result['reads'] / seconds:8.0f}   "
+          f"p95 write {p95 * 1000:7.1f} ms   max write {latencies[-1] * 1000:7.1f} ms   locked {result['locked']}")
+    return result
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    busy_wait = float(sys.argv[4]) if len(sys.argv) > 4 else 0.5
+    print(f"{writers} writer and {readers} reader threads, {seconds:g}s per run, {busy_wait:g}s busy wait")
+    run('default', False, seconds, writers, readers, busy_wait)
+    run('tuned', True, seconds, writers, readers, busy_wait)
+
+
+if __name__ == '__main__':
+    main()
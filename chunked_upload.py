@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Chunked Upload
+Resumable library uploads in three steps: init reserves the final file name,
+each chunk is streamed from the request body straight into <final>.part at
+the offset the server expects next, and complete renames the file into place
+(or hard-links a library copy of the same content) and queues its probe. An
+interrupted upload resumes at its last written byte instead of starting over.
+
+Chunks may reach different worker processes, so the one-chunk-at-a-time lock
+is a conditional UPDATE of the session row on the expected offset. The
+SHA-256 is computed while the bytes arrive when one process saw them all, and
+read from the file once on complete otherwise.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from content_index import file_sha256
+from database import db, get_config, UploadSession, VideoLibrary
+
+UPLOAD_DIR = './videos'
+CHUNK_SIZE = 8 * 1024 * 1024  # suggested to clients
+READ_BLOCK = 1024 * 1024  # bytes read from the request per write
+EXPIRE_INTERVAL = 3600  # seconds between cleanups of abandoned uploads
+DEFAULT_EXPIRY_HOURS = 24  # Override with the 'upload_expiry_hours' configuration
+DEFAULT_MAX_GB = 20  # Override with the 'upload_max_gb' configuration
+LOCK_SECONDS = 300  # a chunk lock not renewed for this long is stale (its request died)
+LOCK_RENEW = 60  # seconds between renewals of the lock while a chunk is written
+
+
+class UploadError(Exception):
+    """Rejected upload request: message, HTTP status and the offset to resume at"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def unique_filename(filename, directory=UPLOAD_DIR):
+    """Sanitised name not used by a file or an upload in progress in directory"""
+    name = re.sub(r'[^\w\s.-]', '', os.path.basename(filename)).replace(' ', '_') or 'video.mp4'
+    base, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while os.path.exists(os.path.join(directory, candidate)) or \
+            os.path.exists(os.path.join(directory, candidate + '.part')):
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    return candidate
+
+
+class ChunkedUploads:
+    """Upload sessions, chunk writes under a database lock, completion and expiry"""
+
+    def __init__(self, service, prober, upload_dir=UPLOAD_DIR):
+        self.service = service
+        self.prober = prober
+        self.upload_dir = upload_dir
+        self.chunk_size = CHUNK_SIZE
+        self.hashers = {}  # {upload_id: (offset, sha256 object)} of uploads whose every chunk came to this process
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def start(self):
+        if not self.timer:
+            self.timer = self.service.supervisor.call_every(EXPIRE_INTERVAL, self.expire)
+
+    def create(self, filename, size, title=None, sha256=None):
+        """Start an upload: reserves the name with an empty .part file"""
+        if not filename:
+            raise UploadError("filename is required")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError("size (bytes) is required")
+        max_bytes = float(get_config('upload_max_gb', DEFAULT_MAX_GB)) * 1024 ** 3
+        if size <= 0 or size > max_bytes:
+            raise UploadError(f"size must be between 1 byte and {max_bytes / 1024 ** 3:g} GB")
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        if size > shutil.disk_usage(self.upload_dir).free:
+            raise UploadError("Not enough disk space", 507)
+
+        with self.lock:
+            name = unique_filename(filename, self.upload_dir)
+            file_path = os.path.join(self.upload_dir, name)
+            open(file_path + '.part', 'wb').close()
+        session = UploadSession(
+            upload_id=uuid.uuid4().hex,
+            title=title or os.path.splitext(name)[0],
+            filename=name,
+            file_path=file_path,
+            total_bytes=size,
+            expected_sha256=sha256.lower() if sha256 else None
+        )
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def get(self, upload_id):
+        return UploadSession.query.filter_by(upload_id=upload_id).first()
+
+    def _resync(self, session):
+        """A crash may have lost unsynced bytes: resume after what is really on disk"""
+        try:
+            size = os.path.getsize(session.file_path + '.part')
+        except OSError:
+            return
+        if size < (session.received_bytes or 0):
+            UploadSession.query.filter_by(id=session.id, received_bytes=session.received_bytes).update(
+                {'received_bytes': size}, synchronize_session=False)
+            db.session.commit()
+            self.hashers.pop(session.upload_id, None)
+
+    def _free(self):
+        """Filter: no request holds the chunk lock (or its lock went stale)"""
+        stale = datetime.utcnow() - timedelta(seconds=LOCK_SECONDS)
+        return or_(UploadSession.writing_since.is_(None), UploadSession.writing_since < stale)
+
+    def _refused(self, session, busy):
+        """UploadError telling why a conditional update of the session matched nothing"""
+        db.session.refresh(session)
+        if session.status != 'uploading':
+            return UploadError(f"Upload is {session.status}", 409)
+        return UploadError(busy, 409, session.received_bytes)
+
+    def _claim(self, session, offset):
+        """Take the chunk lock if the upload expects offset; returns the lock timestamp"""
+        now = datetime.utcnow()
+        claimed = UploadSession.query.filter(
+            UploadSession.id == session.id,
+            UploadSession.status == 'uploading',
+            UploadSession.received_bytes == offset,
+            self._free()
+        ).update({'writing_since': now}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            db.session.refresh(session)
+            if session.status == 'uploading' and offset != session.received_bytes:
+                raise UploadError(f"Expected offset {session.received_bytes}", 409, session.received_bytes)
+            raise self._refused(session, "Another chunk of this upload is in progress")
+        return now
+
+    def _unlock(self, session, offset, claimed, **values):
+        """Release the chunk lock taken at claimed, applying values; False if it was lost"""
+        released = UploadSession.query.filter_by(
+            id=session.id, status='uploading', received_bytes=offset, writing_since=claimed
+        ).update(dict({'writing_since': None}, **values), synchronize_session=False)
+        db.session.commit()
+        return released == 1
+
+    def _digest(self, upload_id, offset):
+        """Running SHA-256 of the bytes before offset, None unless this process wrote them all"""
+        cached = self.hashers.pop(upload_id, None)
+        if cached and cached[0] == offset:
+            return cached[1]
+        return hashlib.sha256() if offset == 0 else None
+
+    def write_chunk(self, session, offset, stream, length):
+        """Write length bytes read from stream at offset; returns the next offset"""
+        if length is None:
+            raise UploadError("Content-Length is required", 411, session.received_bytes)
+        if offset is not None and offset + length > session.total_bytes:
+            raise UploadError("Chunk goes past the declared size", 400, session.received_bytes)
+        self._resync(session)
+        claimed = self._claim(session, offset)
+
+        digest = self._digest(session.upload_id, offset)
+        written = 0
+        error = None
+        try:
+            renewed = time.monotonic()
+            with open(session.file_path + '.part', 'r+b') as f:
+                f.seek(offset)
+                f.truncate()  # drop bytes of a chunk cut off by a crash
+                try:
+                    while written < length:
+                        block = stream.read(min(READ_BLOCK, length - written))
+                        if not block:
+                            break
+                        f.write(block)
+                        if digest:
+                            digest.update(block)
+                        written += len(block)
+                        if time.monotonic() - renewed > LOCK_RENEW:
+                            # Slow client: keep the lock from going stale under it
+                            now = datetime.utcnow()
+                            if not self._unlock(session, offset, claimed, writing_since=now):
+                                break  # taken over as stale: the final unlock reports it
+                            claimed, renewed = now, time.monotonic()
+                except Exception as e:
+                    # Client went away: keep what arrived, it resumes from there
+                    error = e
+        except Exception:
+            db.session.rollback()
+            self._unlock(session, offset, claimed)
+            raise
+
+        if not self._unlock(session, offset, claimed, received_bytes=offset + written,
+                            updated_at=datetime.utcnow()):
+            raise self._refused(session, "Upload changed while the chunk was written")
+        db.session.refresh(session)
+        if digest:
+            self.hashers[session.upload_id] = (session.received_bytes, digest)
+        if written < length:
+            raise UploadError(f"Chunk incomplete ({written} of {length} bytes){f': {error}' if error else ''}",
+                              400, session.received_bytes)
+        return session.received_bytes
+
+    def complete(self, session):
+        """Move the finished file into place, add it to the library and queue its probe"""
+        self._resync(session)
+        completing = UploadSession.query.filter(
+            UploadSession.id == session.id,
+            UploadSession.status == 'uploading',
+            UploadSession.received_bytes == UploadSession.total_bytes,
+            self._free()
+        ).update({'status': 'completing', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not completing:
+            db.session.refresh(session)
+            if session.status == 'uploading' and session.received_bytes != session.total_bytes:
+                raise UploadError(f"Upload incomplete: {session.received_bytes} of {session.total_bytes} bytes",
+                                  409, session.received_bytes)
+            raise self._refused(session, "A chunk of this upload is in progress")
+
+        db.session.refresh(session)
+        try:
+            video = self._finish(session)
+        except Exception:
+            db.session.rollback()
+            # Not finished: the client may retry the completion
+            UploadSession.query.filter_by(id=session.id, status='completing').update(
+                {'status': 'uploading'}, synchronize_session=False)
+            db.session.commit()
+            raise
+
+        job = self.prober.request_probe(video)
+        self.service.events.publish('videos', {'action': 'created', 'video_id': video.id})
+        return video, job
+
+    def _finish(self, session):
+        partial = session.file_path + '.part'
+        cached = self.hashers.pop(session.upload_id, None)
+        if cached and cached[0] == session.total_bytes:
+            sha256 = cached[1].hexdigest()
+        else:
+            # Chunks went to several worker processes: read the file once
+            sha256 = file_sha256(partial)
+        if session.expected_sha256 and session.expected_sha256 != sha256:
+            self._discard(session, 'aborted')
+            raise UploadError("SHA-256 mismatch, upload discarded", 422)
+
+        content = self.service.content
+        key, _, duplicate = content.identify(partial, session.total_bytes, full=sha256)
+        if duplicate and content.policy() == 'reject':
+            self._discard(session, 'aborted')
+            raise UploadError(f"Duplicate of '{duplicate.title}' ({duplicate.filename}), upload discarded", 409)
+
+        stat = os.stat(partial)  # a rename keeps size and mtime
+        video = VideoLibrary(
+            title=session.title,
+            filename=session.filename,
+            file_path=session.file_path,
+            source='upload',
+            file_size_mb=stat.st_size / (1024 * 1024),
+            fingerprint=key,
+            # Hash computed from the upload: duplicate checks need not re-read the file
+            file_hash=sha256,
+            hashed_size=stat.st_size,
+            hashed_mtime=stat.st_mtime
+        )
+        if duplicate:
+            video.duration_seconds, video.resolution = duplicate.duration_seconds, duplicate.resolution
+            video.thumbnail_path = duplicate.thumbnail_path
+        # Registered before the file appears, so the folder watcher finds the name taken
+        db.session.add(video)
+        db.session.commit()
+
+        try:
+            if duplicate and content.link(session.file_path, duplicate.file_path):
+                # Same bytes already in the library: keep one copy on disk
+                os.remove(partial)
+                stat = os.stat(session.file_path)
+                video.hashed_mtime = stat.st_mtime
+            else:
+                os.replace(partial, session.file_path)
+        except OSError as e:
+            db.session.delete(video)
+            db.session.commit()
+            raise UploadError(f"Could not move the upload into place: {e}", 500)
+
+        session.sha256 = sha256
+        session.status = 'complete'
+        session.video_id = video.id
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+        return video
+
+    def save(self, filename, stream, title=None):
+        """Whole file in one request (multipart form): one chunk of a new upload, then complete"""
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        session = self.create(filename, size, title)
+        try:
+            self.write_chunk(session, 0, stream, size)
+        except Exception:
+            db.session.rollback()
+            self.abort(session)
+            raise
+        return self.complete(session)
+
+    def abort(self, session):
+        aborted = UploadSession.query.filter_by(id=session.id, status='uploading').update(
+            {'status': 'aborted'}, synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(session)
+        if not aborted:
+            raise UploadError(f"Upload is {session.status}", 409)
+        self._discard(session, 'aborted')
+
+    def _discard(self, session, status):
+        partial = session.file_path + '.part'
+        if os.path.exists(partial):
+            os.remove(partial)
+        session.status = status
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+        self.hashers.pop(session.upload_id, None)
+
+    def expire(self):
+        """Discard uploads idle longer than the expiry and forget old finished ones"""
+        try:
+            hours = float(get_config('upload_expiry_hours', DEFAULT_EXPIRY_HOURS))
+            cutoff = datetime.utcnow() - timedelta(hours=hours)
+            for session in UploadSession.query.filter(UploadSession.updated_at < cutoff).all():
+                if session.status in ('uploading', 'completing'):
+                    self._discard(session, 'aborted')
+                db.session.delete(session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error expiring uploads: {e}")
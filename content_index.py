@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Content Index
+Identifies library videos by content instead of by filename. The content key
+is a sampled fingerprint: SHA-256 of the size plus a head, middle and tail
+block, a few MB of I/O however large the file. Only when two files share a
+fingerprint are both read completely; identical bytes make the new file a
+duplicate, different bytes get the full SHA-256 as their key. Duplicates are
+hard-linked to the existing file or rejected ('duplicate_policy'), and
+renditions, thumbnails and probe results are shared by key.
+"""
+
+import hashlib
+import os
+import uuid
+
+from database import db, get_config, VideoLibrary
+
+SAMPLE_BYTES = 1024 * 1024  # per sampled block
+HASH_CHUNK_BYTES = 1024 * 1024
+POLICIES = ('link', 'reject')
+DEFAULT_POLICY = 'link'  # Override with the 'duplicate_policy' configuration
+BACKFILL_BATCH = 50  # library rows fingerprinted per commit
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sample_fingerprint(path, size):
+    """SHA-256 of the size and the head, middle and tail blocks (the whole file if small)"""
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, 'rb') as f:
+        if size <= 3 * SAMPLE_BYTES:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2 - SAMPLE_BYTES // 2, size - SAMPLE_BYTES):
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """Content keys of library videos, duplicate detection and hard links"""
+
+    def __init__(self, service):
+        self.service = service
+        service.jobs.register('fingerprint', self._run_backfill, priority=1, max_attempts=2, concurrency=1)
+
+    def start(self):
+        """Queue fingerprinting of library videos added before content keys existed"""
+        with self.service.app.app_context():
+            if VideoLibrary.query.filter(VideoLibrary.fingerprint.is_(None)).first():
+                self.service.jobs.submit('fingerprint', dedupe_key='fingerprint:backfill')
+
+    def policy(self):
+        policy = get_config('duplicate_policy', DEFAULT_POLICY)
+        return policy if policy in POLICIES else DEFAULT_POLICY
+
+    def _fresh(self, video, stat):
+        return video.hashed_size == stat.st_size and video.hashed_mtime == stat.st_mtime
+
+    def _full_hash(self, video):
+        """Full SHA-256 of a library video, kept while the file is unchanged (caller commits)"""
+        try:
+            stat = os.stat(video.file_path)
+        except OSError:
+            return None
+        if not self._fresh(video, stat):
+            return None  # changed since fingerprinted, its key is refreshed on next use
+        if not video.file_hash:
+            video.file_hash = file_sha256(video.file_path)
+        return video.file_hash
+
+    def identify(self, path, size, full=None, sample=None, exclude_id=None):
+        """(content key, full SHA-256 if read, duplicate library video or None) of a file"""
+        sample = sample or sample_fingerprint(path, size)
+        query = VideoLibrary.query.filter(VideoLibrary.fingerprint == sample)
+        if exclude_id:
+            query = query.filter(VideoLibrary.id != exclude_id)
+        candidates = query.all()
+        if not candidates:
+            return sample, full, None
+
+        full = full or file_sha256(path)
+        for candidate in candidates:
+            if self._full_hash(candidate) == full:
+                return sample, full, candidate
+
+        # Same sample, different bytes: this content is keyed by its full hash
+        query = VideoLibrary.query.filter(VideoLibrary.fingerprint == full)
+        if exclude_id:
+            query = query.filter(VideoLibrary.id != exclude_id)
+        return full, full, query.first()
+
+    def refresh(self, video):
+        """Content key of a library video, recomputed when size or mtime changed (commits)"""
+        stat = os.stat(video.file_path)
+        if video.fingerprint and self._fresh(video, stat):
+            return video.fingerprint
+        full = video.file_hash if video.file_hash and self._fresh(video, stat) else None
+        key, full, _ = self.identify(video.file_path, stat.st_size, full=full, exclude_id=video.id)
+        video.fingerprint, video.file_hash = key, full
+        video.hashed_size, video.hashed_mtime = stat.st_size, stat.st_mtime
+        db.session.commit()
+        return key
+
+    def link(self, path, target):
+        """Make path a hard link to target (same content); False if the filesystem refuses"""
+        if os.path.exists(path) and os.path.samefile(path, target):
+            return True
+        # Unique per call: every worker process runs its own watcher and may link the same file
+        temp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.link"
+        created = False
+        try:
+            os.link(target, temp)
+            created = True
+            os.replace(temp, path)
+            return True
+        except OSError as e:
+            if created and os.path.exists(temp):
+                os.remove(temp)
+            print(f"Hard link {path} -> {target} failed, keeping a copy: {e}")
+            return False
+
+    def _run_backfill(self, job):
+        pending = VideoLibrary.query.filter(VideoLibrary.fingerprint.is_(None)).count()
+        done = missing = 0
+        while True:
+            videos = VideoLibrary.query.filter(VideoLibrary.fingerprint.is_(None))\
+                .order_by(VideoLibrary.id).offset(missing).limit(BACKFILL_BATCH).all()
+            if not videos:
+                break
+            for video in videos:
+                if os.path.exists(video.file_path):
+                    self.refresh(video)
+                    done += 1
+                else:
+                    missing += 1
+                job.update(progress=(done + missing) * 100 / max(pending, 1), fingerprinted=done, missing=missing)
+        job.message = f"Fingerprinted {done} library videos"
+        return {'fingerprinted': done, 'missing': missing}
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+CPU Placement
+Gives every FFmpeg child an explicit share of the host instead of letting each
+libx264 start one thread per core: encode processes get a thread count and a
+CPU affinity slice of the encode cores, copy-mode processes are packed onto a
+small shared core set, background transcodes run niced. Affinities are
+rebalanced whenever a process is placed or a stream stops; thread counts are
+fixed at launch.
+"""
+
+import os
+import threading
+
+import psutil
+
+from database import get_config
+
+DEFAULT_COPY_CORES = None  # 'placement_copy_cores' configuration, default 1 core per 8
+DEFAULT_NICE = {'encode': 0, 'copy': 0, 'batch': 10}  # 'placement_<kind>_nice' configuration
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(psutil.cpu_count() or 1))
+
+
+def process_kind(cmd):
+    """'encode' when the command runs libx264, else 'copy'"""
+    return 'encode' if 'libx264' in cmd else 'copy'
+
+
+class CpuPlacer:
+    """Thread counts, affinity slices and niceness for FFmpeg children"""
+
+    def __init__(self):
+        self.cores = available_cores()
+        self.placed = {}  # {pid: (Popen, kind)}, in placement order
+        self.lock = threading.Lock()
+
+    def enabled(self):
+        return str(get_config('placement_enabled', 'true')).lower() in ('1', 'true', 'yes')
+
+    def core_sets(self):
+        """(copy cores, encode cores); small hosts share every core"""
+        count = len(self.cores)
+        copy_count = int(get_config('placement_copy_cores', DEFAULT_COPY_CORES) or max(1, count // 8))
+        if count <= 2 or copy_count >= count:
+            return self.cores, self.cores
+        return self.cores[-copy_count:], self.cores[:-copy_count]
+
+    def _live(self, kind):
+        return [process for process, k in self.placed.values() if k == kind and process.poll() is None]
+
+    def encode_threads(self):
+        """Thread count for the next encode: its share of the encode cores"""
+        _, encode_cores = self.core_sets()
+        with self.lock:
+            running = len(self._live('encode'))
+        return max(1, len(encode_cores) // (running + 1))
+
+    def place(self, process, kind):
+        """Apply niceness to a new child and rebalance every affinity"""
+        if not self.enabled():
+            return
+        nice = int(get_config(f'placement_{kind}_nice', DEFAULT_NICE.get(kind, 0)))
+        try:
+            proc = psutil.Process(process.pid)
+            if nice:
+                proc.nice(nice)
+            if kind == 'batch' and hasattr(psutil, 'IOPRIO_CLASS_IDLE'):
+                # Background transcodes only get disk time nobody else wants (Linux)
+                proc.ionice(psutil.IOPRIO_CLASS_IDLE)
+        except (psutil.Error, OSError) as e:
+            print(f"Error setting priority of pid {process.pid}: {e}")
+
+        with self.lock:
+            self.placed[process.pid] = (process, kind)
+        self.rebalance()
+
+    def rebalance(self):
+        """Split the encode cores between running encoders, pack copies on the copy cores"""
+        if not self.enabled():
+            return
+        copy_cores, encode_cores = self.core_sets()
+        with self.lock:
+            for pid in [pid for pid, (process, _) in self.placed.items() if process.poll() is not None]:
+                del self.placed[pid]
+            encoders = self._live('encode')
+            copies = self._live('copy')
+            batches = self._live('batch')
+
+        assignments = {process.pid: copy_cores for process in copies}
+        # Niced background transcodes may use every encode core, they yield to live encoders
+        assignments.update({process.pid: encode_cores for process in batches})
+        if encoders:
+            share = max(1, len(encode_cores) // len(encoders))
+            for index, process in enumerate(encoders):
+                start = (index * share) % len(encode_cores)
+                assignments[process.pid] = [encode_cores[(start + i) % len(encode_cores)] for i in range(share)]
+
+        for pid, cores in assignments.items():
+            self._set_affinity(pid, cores)
+
+    def _set_affinity(self, pid, cores):
+        """Pin every thread of a process (the process-wide call only moves the main thread on Linux)"""
+        try:
+            proc = psutil.Process(pid)
+            if hasattr(os, 'sched_setaffinity'):
+                for thread in proc.threads():
+                    try:
+                        os.sched_setaffinity(thread.id, cores)
+                    except OSError:
+                        pass  # Thread ended meanwhile
+            elif hasattr(proc, 'cpu_affinity'):
+                proc.cpu_affinity(cores)
+        except (psutil.Error, OSError):
+            pass
+
+    def get_status(self):
+        copy_cores, encode_cores = self.core_sets()
+        placed = []
+        with self.lock:
+            items = list(self.placed.items())
+        for pid, (process, kind) in items:
+            if process.poll() is not None:
+                continue
+            try:
+                affinity = sorted(os.sched_getaffinity(pid)) if hasattr(os, 'sched_getaffinity') else None
+            except OSError:
+                affinity = None
+            placed.append({'pid': pid, 'kind': kind, 'cores': affinity})
+        return {
+            'enabled': self.enabled(),
+            'copy_cores': copy_cores,
+            'encode_cores': encode_cores,
+            'processes': placed,
+        }
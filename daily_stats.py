@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Daily Stats
+Keeps StreamStats (whole site) and ChannelDailyStats (per channel) up to
+date incrementally: a session start adds one session to its day, a session
+end adds its status and its duration, split at UTC midnight across every day
+it covered. Each change is a single INSERT ... ON CONFLICT DO UPDATE SET
+x = x + ?, so concurrent updates never overwrite each other. A repair job
+rebuilds closed days from the sessions table.
+"""
+
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import db, get_config, set_config, StreamSession, StreamStats, ChannelDailyStats
+
+REPAIR_INTERVAL = 3600  # seconds between checks for days to repair
+MAX_REPAIR_DAYS = 31  # days rebuilt per repair step
+STATUS_COUNTERS = {'stopped': 'successful_streams', 'error': 'failed_streams'}
+COUNTERS = ('total_sessions', 'total_duration_seconds', 'successful_streams', 'failed_streams')
+
+
+def split_by_day(start, end):
+    """[(date, seconds)] of a UTC interval, summing to int((end - start).total_seconds())"""
+    parts = []
+    counted = 0
+    day = start.date()
+    while True:
+        boundary = datetime.combine(day + timedelta(days=1), time())
+        elapsed = max(0, int((min(boundary, end) - start).total_seconds()))
+        parts.append((day, elapsed - counted))
+        counted = elapsed
+        if boundary >= end:
+            return parts
+        day += timedelta(days=1)
+
+
+class DailyStats:
+    """Incremental daily counters and their repair"""
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.timer = None
+
+    def start(self):
+        if not self.timer:
+            self.timer = self.supervisor.call_every(REPAIR_INTERVAL, self.repair_pending)
+
+    def _increment(self, day, channel_id, **deltas):
+        """Add deltas to the day's site row and, if known, the channel's row"""
+        targets = [(StreamStats, {'date': day})]
+        if channel_id:
+            targets.append((ChannelDailyStats, {'channel_id': channel_id, 'date': day}))
+        for model, keys in targets:
+            table = model.__table__
+            insert = sqlite_insert(table).values(**keys, **deltas)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={name: table.c[name] + insert.excluded[name] for name in deltas}
+            ))
+
+    def session_started(self, session):
+        try:
+            self._increment(session.start_time.date(), session.channel_id, total_sessions=1)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error updating stats: {e}")
+
+    def session_ended(self, session):
+        """Count the outcome on the start day and the duration on every day covered"""
+        try:
+            counter = STATUS_COUNTERS.get(session.status)
+            if counter:
+                self._increment(session.start_time.date(), session.channel_id, **{counter: 1})
+            for day, seconds in split_by_day(session.start_time, session.end_time):
+                if seconds:
+                    self._increment(day, session.channel_id, total_duration_seconds=seconds)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error updating stats: {e}")
+
+    def rebuild(self, day):
+        """Recompute one day from the sessions table, replacing its rows"""
+        day_start = datetime.combine(day, time())
+        day_end = day_start + timedelta(days=1)
+        totals = {}  # {channel_id: {counter: value}}
+
+        def row(channel_id):
+            return totals.setdefault(channel_id, dict.fromkeys(COUNTERS, 0))
+
+        started = db.session.query(
+            StreamSession.channel_id,
+            db.func.count(StreamSession.id),
+            db.func.coalesce(db.func.sum(db.case((StreamSession.status == 'stopped', 1), else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((StreamSession.status == 'error', 1), else_=0)), 0)
+        ).filter(
+            StreamSession.start_time >= day_start,
+            StreamSession.start_time < day_end
+        ).group_by(StreamSession.channel_id).all()
+        for channel_id, count, successful, failed in started:
+            row(channel_id).update(total_sessions=count, successful_streams=successful, failed_streams=failed)
+
+        covering = db.session.query(StreamSession.channel_id, StreamSession.start_time, StreamSession.end_time)\
+            .filter(StreamSession.start_time < day_end, StreamSession.end_time > day_start).all()
+        for channel_id, start, end in covering:
+            for covered, seconds in split_by_day(start, end):
+                if covered == day:
+                    row(channel_id)['total_duration_seconds'] += seconds
+
+        site = dict.fromkeys(COUNTERS, 0)
+        for counters in totals.values():
+            for name in COUNTERS:
+                site[name] += counters[name]
+
+        stats = StreamStats.query.filter_by(date=day).first()
+        if not stats:
+            stats = StreamStats(date=day)
+            db.session.add(stats)
+        for name in COUNTERS:
+            setattr(stats, name, site[name])
+
+        ChannelDailyStats.query.filter_by(date=day).delete(synchronize_session=False)
+        channel_rows = [
+            dict(counters, channel_id=channel_id, date=day)
+            for channel_id, counters in totals.items() if channel_id
+        ]
+        if channel_rows:
+            db.session.execute(ChannelDailyStats.__table__.insert(), channel_rows)
+        db.session.commit()
+        return stats
+
+    def repair_pending(self):
+        """Rebuild the closed days since the last repair (a few weeks per step)"""
+        try:
+            yesterday = datetime.utcnow().date() - timedelta(days=1)
+            value = get_config('daily_stats_repaired_until')
+            if value:
+                day = date.fromisoformat(value) + timedelta(days=1)
+            else:
+                first = db.session.query(db.func.min(StreamSession.start_time)).scalar()
+                day = first.date() if first else yesterday
+            for _ in range(MAX_REPAIR_DAYS):
+                if day > yesterday:
+                    break
+                self.rebuild(day)
+                set_config('daily_stats_repaired_until', day.isoformat())
+                db.session.commit()
+                day += timedelta(days=1)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error repairing stats: {e}")
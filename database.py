@@ -1,10 +1,22 @@
 #!/usr/bin/env python3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
+import json
 import pytz
 
 db = SQLAlchemy()
 
+# Applied to every new SQLite connection (override with app.config['SQLITE_PRAGMAS'])
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers no longer block the writer and vice versa
+    'synchronous': 'NORMAL',  # Safe with WAL, fsync only at checkpoints
+    'busy_timeout': 10000,  # ms a writer waits for the lock before "database is locked"
+    'mmap_size': 268435456,  # 256 MB of the file read through mmap
+    'cache_size': -16000,  # 16 MB page cache per connection
+    'temp_store': 'MEMORY',
+}
+
 class StreamChannel(db.Model):
     """Model untuk menyimpan channel streaming"""
     __tablename__ = 'stream_channels'
@@ -15,6 +27,7 @@ class StreamChannel(db.Model):
     rtmp_url = db.Column(db.String(255), default='rtmp://a.rtmp.youtube.com/live2/')
     gdrive_file_id = db.Column(db.String(255))
     video_path = db.Column(db.String(255))
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), nullable=True)  # Set = playlist mode
     start_time = db.Column(db.String(10), default='08:00')
     end_time = db.Column(db.String(10), default='20:00')
     start_date = db.Column(db.Date, nullable=True)  # Tanggal mulai campaign
@@ -27,6 +40,13 @@ class StreamChannel(db.Model):
     fps = db.Column(db.Integer, default=30)
     preset = db.Column(db.String(20), default='veryfast')  # ultrafast, veryfast, fast, medium
     
+    # Restart policy (exponential backoff with full jitter + rolling budget)
+    restart_base_delay = db.Column(db.Float, default=2.0)  # seconds
+    restart_max_delay = db.Column(db.Float, default=120.0)  # seconds
+    restart_budget = db.Column(db.Integer, default=10)  # restarts per window, 0 = never restart
+    restart_window_seconds = db.Column(db.Integer, default=600)
+    restart_cooloff_seconds = db.Column(db.Integer, default=900)
+    
     enabled = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -38,6 +58,7 @@ class StreamChannel(db.Model):
             'rtmp_url': self.rtmp_url,
             'gdrive_file_id': self.gdrive_file_id,
             'video_path': self.video_path,
+            'playlist_id': self.playlist_id,
             'start_time': self.start_time,
             'end_time': self.end_time,
             'start_date': self.start_date.isoformat() if self.start_date else None,
@@ -47,12 +68,23 @@ class StreamChannel(db.Model):
             'bitrate': self.bitrate,
             'fps': self.fps,
             'preset': self.preset,
+            'restart_base_delay': self.restart_base_delay,
+            'restart_max_delay': self.restart_max_delay,
+            'restart_budget': self.restart_budget,
+            'restart_window_seconds': self.restart_window_seconds,
+            'restart_cooloff_seconds': self.restart_cooloff_seconds,
             'enabled': self.enabled
         }
 
 class StreamSession(db.Model):
     """Model untuk menyimpan history streaming session"""
     __tablename__ = 'stream_sessions'
+    __table_args__ = (
+        db.Index('ix_stream_sessions_channel_start', 'channel_id', 'start_time'),
+        db.Index('ix_stream_sessions_start', 'start_time'),
+        db.Index('ix_stream_sessions_video_start', 'video_id', 'start_time'),
+        db.Index('ix_stream_sessions_video_file', 'video_file'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     channel_id = db.Column(db.Integer, db.ForeignKey('stream_channels.id'), nullable=True)
@@ -60,6 +92,7 @@ class StreamSession(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     duration_seconds = db.Column(db.Integer, default=0)
     video_file = db.Column(db.String(255))
+    video_id = db.Column(db.Integer, db.ForeignKey('video_library.id'), nullable=True)  # Library video streamed, if any
     status = db.Column(db.String(50))  # started, stopped, error
     error_message = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -76,6 +109,7 @@ class StreamSession(db.Model):
             'duration_seconds': self.duration_seconds,
             'duration_formatted': self.format_duration(),
             'video_file': self.video_file,
+            'video_id': self.video_id,
             'status': self.status,
             'error_message': self.error_message
         }
@@ -95,6 +129,10 @@ class StreamSession(db.Model):
 class StreamLog(db.Model):
     """Model untuk menyimpan logs"""
     __tablename__ = 'stream_logs'
+    __table_args__ = (
+        db.Index('ix_stream_logs_session_time', 'session_id', 'timestamp'),
+        db.Index('ix_stream_logs_time', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -135,17 +173,27 @@ class VideoLibrary(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     filename = db.Column(db.String(255), unique=True, nullable=False)
-    file_path = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False, index=True)
     file_size_mb = db.Column(db.Float, default=0)
     duration_seconds = db.Column(db.Integer, default=0)
     resolution = db.Column(db.String(20))  # 1920x1080, 1280x720, etc
     gdrive_file_id = db.Column(db.String(255))
-    source = db.Column(db.String(50))  # gdrive, upload, url
+    source = db.Column(db.String(50))  # gdrive, upload, url, scan, watch
     thumbnail_path = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_used = db.Column(db.DateTime)
     usage_count = db.Column(db.Integer, default=0)
     
+    # Content key (sampled fingerprint, or the full SHA-256 when samples collide)
+    # and the full SHA-256 once read; both valid while size and mtime match
+    fingerprint = db.Column(db.String(64), index=True)
+    file_hash = db.Column(db.String(64))
+    hashed_size = db.Column(db.BigInteger)
+    hashed_mtime = db.Column(db.Float)
+    
+    # Set by the folder watcher when the file disappears, cleared if it comes back
+    missing_since = db.Column(db.DateTime)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -158,6 +206,10 @@ class VideoLibrary(db.Model):
             'resolution': self.resolution,
             'gdrive_file_id': self.gdrive_file_id,
             'source': self.source,
+            'thumbnail_path': self.thumbnail_path,
+            'fingerprint': self.fingerprint,
+            'missing': self.missing_since is not None,
+            'missing_since': self.missing_since.isoformat() if self.missing_since else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_used': self.last_used.isoformat() if self.last_used else None,
             'usage_count': self.usage_count
@@ -175,6 +227,145 @@ class VideoLibrary(db.Model):
             return f"{minutes}m {seconds}s"
         return f"{seconds}s"
 
+class ProbeCache(db.Model):
+    """Model untuk cached ffprobe results, valid while inode, size and mtime match"""
+    __tablename__ = 'probe_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), unique=True, nullable=False)  # Absolute path
+    inode = db.Column(db.BigInteger)
+    size_bytes = db.Column(db.BigInteger)
+    mtime = db.Column(db.Float)
+    duration_seconds = db.Column(db.Integer, default=0)
+    duration = db.Column(db.Float)  # Exact duration, None if ffprobe could not read it
+    resolution = db.Column(db.String(20))
+    fingerprint = db.Column(db.String(64), index=True)  # Content key, shares results between copies
+    probed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def matches(self, stat):
+        return (self.inode, self.size_bytes, self.mtime) == (stat.st_ino, stat.st_size, stat.st_mtime)
+
+class UploadSession(db.Model):
+    """Model untuk chunked upload (resumable, langsung ke folder videos)"""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.String(32), unique=True, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)  # Final path, bytes go to file_path + '.part'
+    total_bytes = db.Column(db.BigInteger, nullable=False)
+    received_bytes = db.Column(db.BigInteger, default=0)  # Next offset the server accepts
+    expected_sha256 = db.Column(db.String(64))  # Optional, checked on complete
+    sha256 = db.Column(db.String(64))
+    status = db.Column(db.String(20), default='uploading')  # uploading, completing, complete, aborted
+    writing_since = db.Column(db.DateTime)  # Set while a request writes a chunk (lock shared by all workers)
+    video_id = db.Column(db.Integer, db.ForeignKey('video_library.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'title': self.title,
+            'filename': self.filename,
+            'total_bytes': self.total_bytes,
+            'received_bytes': self.received_bytes,
+            'offset': self.received_bytes,
+            'sha256': self.sha256,
+            'status': self.status,
+            'video_id': self.video_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class VideoRendition(db.Model):
+    """Model untuk pre-transcoded renditions (stream-ready H.264/AAC, fixed GOP)"""
+    __tablename__ = 'video_renditions'
+    __table_args__ = (
+        db.UniqueConstraint('source_hash', 'bitrate', 'fps', 'preset', 'resolution', name='uq_rendition_profile'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video_library.id'), nullable=False)
+    source_hash = db.Column(db.String(64), nullable=False)
+    bitrate = db.Column(db.String(20), nullable=False)
+    fps = db.Column(db.Integer, nullable=False)
+    preset = db.Column(db.String(20), nullable=False)
+    resolution = db.Column(db.String(20), default='source')  # source = no scaling
+    file_path = db.Column(db.String(500))
+    size_bytes = db.Column(db.BigInteger, default=0)
+    status = db.Column(db.String(20), default='pending')  # pending, transcoding, ready, failed
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used = db.Column(db.DateTime)
+    
+    video = db.relationship('VideoLibrary', backref=db.backref('renditions', cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'source_hash': self.source_hash,
+            'bitrate': self.bitrate,
+            'fps': self.fps,
+            'preset': self.preset,
+            'resolution': self.resolution,
+            'file_path': self.file_path,
+            'size_mb': round((self.size_bytes or 0) / (1024 * 1024), 2),
+            'status': self.status,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_used': self.last_used.isoformat() if self.last_used else None
+        }
+
+class BackgroundJob(db.Model):
+    """Model untuk background jobs (probe, scan, download, transcode, thumbnail)"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = (
+        db.Index('ix_background_jobs_claim', 'status', 'priority', 'id'),
+        db.Index('ix_background_jobs_dedupe_key', 'dedupe_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed, cancelled
+    priority = db.Column(db.Integer, default=0)  # Higher runs first
+    payload = db.Column(db.Text)  # JSON arguments
+    result = db.Column(db.Text)  # JSON, updated with progress while running
+    progress = db.Column(db.Float, default=0)  # 0-100
+    message = db.Column(db.Text)
+    dedupe_key = db.Column(db.String(255))  # At most one queued/running job per key
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    owner = db.Column(db.String(100))  # host:pid of the process running it
+    heartbeat_at = db.Column(db.DateTime)  # Lease of a running job, renewed by its owner
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # Retry backoff
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'priority': self.priority,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'result': json.loads(self.result) if self.result else {},
+            'progress': round(self.progress or 0, 1),
+            'message': self.message,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'cancel_requested': bool(self.cancel_requested),
+            'owner': self.owner,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class User(db.Model):
     """Model untuk user authentication"""
     __tablename__ = 'users'
@@ -242,6 +433,31 @@ class StreamStats(db.Model):
             return f"{hours}h {minutes}m"
         return f"{minutes}m"
 
+class ChannelDailyStats(db.Model):
+    """Model untuk statistik streaming harian per channel"""
+    __tablename__ = 'channel_daily_stats'
+    __table_args__ = (
+        db.UniqueConstraint('channel_id', 'date', name='uq_channel_daily_stats'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('stream_channels.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    total_sessions = db.Column(db.Integer, default=0)
+    total_duration_seconds = db.Column(db.Integer, default=0)
+    successful_streams = db.Column(db.Integer, default=0)
+    failed_streams = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        return {
+            'channel_id': self.channel_id,
+            'date': self.date.isoformat(),
+            'total_sessions': self.total_sessions,
+            'total_duration_seconds': self.total_duration_seconds,
+            'successful_streams': self.successful_streams,
+            'failed_streams': self.failed_streams
+        }
+
 class Playlist(db.Model):
     """Model untuk video playlist"""
     __tablename__ = 'playlists'
@@ -290,6 +506,10 @@ class PlaylistItem(db.Model):
 class StreamHealth(db.Model):
     """Model untuk monitoring stream health"""
     __tablename__ = 'stream_health'
+    __table_args__ = (
+        db.Index('ix_stream_health_session_time', 'session_id', 'timestamp'),
+        db.Index('ix_stream_health_time', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('stream_sessions.id'), nullable=False)
@@ -297,6 +517,7 @@ class StreamHealth(db.Model):
     fps = db.Column(db.Float)
     bitrate_kbps = db.Column(db.Float)
     dropped_frames = db.Column(db.Integer, default=0)
+    speed = db.Column(db.Float)  # Encoding speed, < 1.0 means slower than realtime
     cpu_usage = db.Column(db.Float)
     memory_usage = db.Column(db.Float)
     status = db.Column(db.String(20), default='healthy')  # healthy, warning, critical
@@ -311,11 +532,57 @@ class StreamHealth(db.Model):
             'fps': self.fps,
             'bitrate_kbps': self.bitrate_kbps,
             'dropped_frames': self.dropped_frames,
+            'speed': self.speed,
             'cpu_usage': self.cpu_usage,
             'memory_usage': self.memory_usage,
             'status': self.status
         }
 
+class StreamHealthRollup(db.Model):
+    """Model untuk aggregated stream health (1-minute and 1-hour buckets)"""
+    __tablename__ = 'stream_health_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'resolution', 'bucket_start', name='uq_health_rollup_bucket'),
+        db.Index('ix_health_rollup_resolution_bucket', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('stream_sessions.id'), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # Bucket length in seconds: 60 or 3600
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    samples = db.Column(db.Integer, default=0)
+    fps_min = db.Column(db.Float)
+    fps_avg = db.Column(db.Float)
+    fps_max = db.Column(db.Float)
+    fps_p95 = db.Column(db.Float)
+    bitrate_min = db.Column(db.Float)
+    bitrate_avg = db.Column(db.Float)
+    bitrate_max = db.Column(db.Float)
+    bitrate_p95 = db.Column(db.Float)
+    cpu_min = db.Column(db.Float)
+    cpu_avg = db.Column(db.Float)
+    cpu_max = db.Column(db.Float)
+    cpu_p95 = db.Column(db.Float)
+    dropped_min = db.Column(db.Float)
+    dropped_avg = db.Column(db.Float)
+    dropped_max = db.Column(db.Float)
+    dropped_p95 = db.Column(db.Float)
+    status = db.Column(db.String(20), default='healthy')  # Worst status in the bucket
+    
+    def to_dict(self):
+        result = {
+            'session_id': self.session_id,
+            'resolution': self.resolution,
+            'timestamp': self.bucket_start.isoformat(),
+            'samples': self.samples,
+            'status': self.status
+        }
+        for metric in ('fps', 'bitrate', 'cpu', 'dropped'):
+            result[metric] = {
+                stat: getattr(self, f'{metric}_{stat}') for stat in ('min', 'avg', 'max', 'p95')
+            }
+        return result
+
 class ScheduledTask(db.Model):
     """Model untuk automated scheduler"""
     __tablename__ = 'scheduled_tasks'
@@ -369,11 +636,48 @@ class PlatformDestination(db.Model):
             'priority': self.priority
         }
 
+def get_config(key, default=None):
+    """Read a value from the configurations table"""
+    config = Configuration.query.filter_by(key=key).first()
+    return config.value if config else default
+
+def set_config(key, value):
+    """Create or update a value in the configurations table (caller commits)"""
+    config = Configuration.query.filter_by(key=key).first()
+    if config:
+        config.value = str(value)
+    else:
+        db.session.add(Configuration(key=key, value=str(value)))
+
+def tune_sqlite(engine, pragmas=None):
+    """Set the SQLite pragmas on every connection the engine opens"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def ensure_indexes(engine):
+    """Create declared indexes missing from existing tables (create_all only adds new tables)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"Index {index.name} not created (run migrate_database.py?): {e}")
+
 def init_db(app):
     """Initialize database"""
     db.init_app(app)
     with app.app_context():
+        tune_sqlite(db.engine, app.config.get('SQLITE_PRAGMAS'))
         db.create_all()
+        ensure_indexes(db.engine)
         print("Database initialized!")
         
         # Create default admin user if not exists
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Event Bus
+In-process publish/subscribe for stream, log and health events. Publishing
+never blocks: every subscriber has a bounded queue and a subscriber that falls
+behind loses its oldest events and is told to resync. Recent events are kept
+so a reconnecting client can resume from its Last-Event-ID.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+SUBSCRIBER_QUEUE = 256
+HISTORY = 200
+
+
+class Subscriber:
+    """Queue of events for one listener (one SSE connection)"""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Slow client: drop the oldest event, the client must refetch state
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.lagged = True
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def get(self, timeout=None):
+        """Next event, a 'resync' event after drops, or None on timeout"""
+        if self.lagged:
+            self.lagged = False
+            return {'id': None, 'type': 'resync', 'timestamp': time.time(), 'data': {}}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Fan events out to every subscriber"""
+
+    def __init__(self, history=HISTORY):
+        self.subscribers = set()
+        self.listeners = []  # In-process callbacks, called on the publishing thread
+        self.history = deque(maxlen=history)
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call callback(event) for every event; it must be quick and must not block"""
+        self.listeners.append(callback)
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def publish(self, event_type, data):
+        with self.lock:
+            event = {
+                'id': next(self.counter),
+                'type': event_type,
+                'timestamp': time.time(),
+                'data': data,
+            }
+            self.history.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Error in event listener: {e}")
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """New subscriber, pre-filled with the events after last_event_id if still known"""
+        subscriber = Subscriber()
+        with self.lock:
+            if last_event_id is not None:
+                missed = [e for e in self.history if e['id'] > last_event_id]
+                if self.history and self.history[0]['id'] > last_event_id + 1:
+                    subscriber.lagged = True  # Gap: older events are gone
+                for event in missed[-SUBSCRIBER_QUEUE:]:
+                    subscriber.put(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
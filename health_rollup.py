@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Health Rollup
+Tiered retention for the StreamHealth time series. Raw samples (one per
+channel every 30 s) are kept for a day; before they expire they are folded
+into 1-minute and 1-hour buckets with min/avg/max/p95 of fps, bitrate, CPU and
+dropped frames. Compaction runs in small steps on a supervisor worker, each
+step continuing from a watermark kept in the configurations table. Range
+queries pick the finest resolution that covers the requested period.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from database import db, get_config, set_config, StreamHealth, StreamHealthRollup
+
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+COMPACT_INTERVAL = 120  # seconds between compaction steps
+MAX_ROWS_PER_STEP = 20000  # raw rows read per resolution and step
+
+# Retention, overridable in the configurations table
+DEFAULT_RAW_HOURS = 24  # 'health_raw_hours'
+DEFAULT_MINUTE_DAYS = 7  # 'health_minute_days'
+DEFAULT_HOUR_DAYS = 180  # 'health_hour_days'
+
+STATUS_RANK = {'healthy': 0, 'warning': 1, 'critical': 2}
+METRICS = {'fps': 'fps', 'bitrate': 'bitrate_kbps', 'cpu': 'cpu_usage', 'dropped': 'dropped_frames'}
+
+
+def floor_time(moment, resolution):
+    seconds = int((moment - datetime.min).total_seconds())
+    return datetime.min + timedelta(seconds=seconds - seconds % resolution)
+
+
+def summarize(values):
+    """(min, avg, max, p95) of the non-null values, Nones when there are none"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None, None, None, None
+    p95 = values[math.ceil(0.95 * len(values)) - 1]  # Nearest rank
+    return round(values[0], 2), round(sum(values) / len(values), 2), round(values[-1], 2), round(p95, 2)
+
+
+class HealthRollup:
+    """Incremental compaction and retention of StreamHealth rows"""
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.timer = None
+        self.last_run = None
+
+    def start(self):
+        if not self.timer:
+            self.timer = self.supervisor.call_every(COMPACT_INTERVAL, self.compact)
+
+    def _watermark_key(self, resolution):
+        return f'health_rollup_{resolution}_until'
+
+    def watermark(self, resolution):
+        """Start of the first bucket not rolled up yet"""
+        value = get_config(self._watermark_key(resolution))
+        if value:
+            return datetime.fromisoformat(value)
+        oldest = db.session.query(db.func.min(StreamHealth.timestamp)).scalar()
+        return floor_time(oldest, resolution) if oldest else None
+
+    def compact(self):
+        """One compaction step for every resolution, then expire old rows"""
+        try:
+            for resolution in RESOLUTIONS:
+                self._compact(resolution)
+            self._expire()
+            self.last_run = datetime.utcnow()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error compacting stream health: {e}")
+
+    def _compact(self, resolution):
+        start = self.watermark(resolution)
+        if start is None:
+            return 0
+        closed = floor_time(datetime.utcnow(), resolution)  # Buckets before this are complete
+        if start >= closed:
+            return 0
+
+        rows = StreamHealth.query\
+            .filter(StreamHealth.timestamp >= start, StreamHealth.timestamp < closed)\
+            .order_by(StreamHealth.timestamp)\
+            .limit(MAX_ROWS_PER_STEP).all()
+        if len(rows) == MAX_ROWS_PER_STEP:
+            # Stop at the last full bucket of this batch, the rest goes in the next step
+            end = floor_time(rows[-1].timestamp, resolution)
+            if end <= start:
+                end = start + timedelta(seconds=resolution)  # A single huge bucket: take what we have
+            rows = [row for row in rows if row.timestamp < end]
+        else:
+            end = closed  # Also skips empty buckets (gaps) in one step
+
+        entries = self._aggregate(rows, resolution)
+        if entries:
+            db.session.execute(StreamHealthRollup.__table__.insert(), entries)
+        set_config(self._watermark_key(resolution), end.isoformat())
+        db.session.commit()
+        return len(entries)
+
+    def _aggregate(self, rows, resolution):
+        """StreamHealthRollup column dicts, one per (session, bucket) of the rows"""
+        buckets = {}
+        for row in rows:
+            buckets.setdefault((row.session_id, floor_time(row.timestamp, resolution)), []).append(row)
+
+        entries = []
+        for (session_id, bucket_start), bucket in sorted(buckets.items()):
+            entry = {
+                'session_id': session_id,
+                'resolution': resolution,
+                'bucket_start': bucket_start,
+                'samples': len(bucket),
+                'status': max((row.status or 'healthy' for row in bucket), key=lambda s: STATUS_RANK.get(s, 0)),
+            }
+            for metric, column in METRICS.items():
+                stats = summarize(getattr(row, column) for row in bucket)
+                for stat, value in zip(('min', 'avg', 'max', 'p95'), stats):
+                    entry[f'{metric}_{stat}'] = value
+            entries.append(entry)
+        return entries
+
+    def _expire(self):
+        """Drop raw rows (only once rolled up) and rollups past their retention"""
+        now = datetime.utcnow()
+        raw_cutoff = now - timedelta(hours=float(get_config('health_raw_hours', DEFAULT_RAW_HOURS)))
+        for resolution in RESOLUTIONS:
+            watermark = self.watermark(resolution)
+            raw_cutoff = min(raw_cutoff, watermark) if watermark else raw_cutoff
+        StreamHealth.query.filter(StreamHealth.timestamp < raw_cutoff).delete(synchronize_session=False)
+
+        retention = {
+            MINUTE: timedelta(days=float(get_config('health_minute_days', DEFAULT_MINUTE_DAYS))),
+            HOUR: timedelta(days=float(get_config('health_hour_days', DEFAULT_HOUR_DAYS))),
+        }
+        for resolution, keep in retention.items():
+            StreamHealthRollup.query.filter(
+                StreamHealthRollup.resolution == resolution,
+                StreamHealthRollup.bucket_start < now - keep
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def resolution_for(self, start, end):
+        """'raw', 60 or 3600: the finest tier that still holds `start` and stays readable"""
+        now = datetime.utcnow()
+        span = end - start
+        raw_hours = float(get_config('health_raw_hours', DEFAULT_RAW_HOURS))
+        minute_days = float(get_config('health_minute_days', DEFAULT_MINUTE_DAYS))
+        if span <= timedelta(hours=6) and start >= now - timedelta(hours=raw_hours):
+            return 'raw'
+        if span <= timedelta(days=3) and start >= now - timedelta(days=minute_days):
+            return MINUTE
+        return HOUR
+
+    def query(self, session_id, start, end):
+        """(resolution, [point dicts]) for a session between start and end (UTC)"""
+        resolution = self.resolution_for(start, end)
+        if resolution == 'raw':
+            rows = StreamHealth.query\
+                .filter(StreamHealth.session_id == session_id,
+                        StreamHealth.timestamp >= start, StreamHealth.timestamp < end)\
+                .order_by(StreamHealth.timestamp).all()
+            return resolution, [row.to_dict() for row in rows]
+
+        rows = StreamHealthRollup.query\
+            .filter(StreamHealthRollup.session_id == session_id,
+                    StreamHealthRollup.resolution == resolution,
+                    StreamHealthRollup.bucket_start >= floor_time(start, resolution),
+                    StreamHealthRollup.bucket_start < end)\
+            .order_by(StreamHealthRollup.bucket_start).all()
+        points = [row.to_dict() for row in rows]
+
+        # The newest buckets are not compacted yet: aggregate them from raw rows on the fly
+        watermark = self.watermark(resolution)
+        if watermark and watermark < end:
+            recent = StreamHealth.query\
+                .filter(StreamHealth.session_id == session_id,
+                        StreamHealth.timestamp >= max(floor_time(start, resolution), watermark),
+                        StreamHealth.timestamp < end)\
+                .order_by(StreamHealth.timestamp).all()
+            points.extend(StreamHealthRollup(**entry).to_dict() for entry in self._aggregate(recent, resolution))
+        return resolution, points
+
+    def get_status(self):
+        watermarks = {}
+        for resolution in RESOLUTIONS:
+            watermark = self.watermark(resolution)
+            watermarks[str(resolution)] = watermark.isoformat() if watermark else None
+        return {
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'watermarks': watermarks,
+            'raw_rows': StreamHealth.query.count(),
+            'rollup_rows': StreamHealthRollup.query.count(),
+        }
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Job Queue
+Persistent background jobs for slow video-library work (probes, scans,
+downloads, transcodes, thumbnails). Jobs are BackgroundJob rows, so queued
+and interrupted work survives a restart. A bounded pool of worker threads
+claims the highest-priority runnable job with a conditional UPDATE, respects
+a per-type concurrency limit, retries failures with exponential backoff and
+stops a running job when it is cancelled. Changes are published as 'jobs'
+events.
+
+Several processes (gunicorn workers) may share the table: the per-type limit
+is counted over the running rows in the same UPDATE that claims a job, a
+running job carries its owner and a heartbeat lease renewed every
+HEARTBEAT_INTERVAL, only jobs whose lease has run out are requeued, and a
+cancel made in any process reaches the owner through cancel_requested.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import psutil
+
+from database import db, get_config, BackgroundJob
+
+DEFAULT_WORKERS = 2  # Override with the 'job_workers' configuration
+POLL_INTERVAL = 5  # seconds an idle worker waits before looking for retries due
+RETRY_DELAY = 30  # seconds before the first retry, doubled per attempt
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes of one job
+PRUNE_INTERVAL = 3600  # seconds between deletions of old finished jobs
+DEFAULT_RETENTION_DAYS = 7  # Override with the 'job_retention_days' configuration
+HEARTBEAT_INTERVAL = 15  # seconds between lease renewals of the running jobs of a process
+LEASE_SECONDS = 60  # a running job not renewed for this long lost its process and is requeued
+CANCEL_POLL_INTERVAL = 2.0  # seconds between cancel_requested reads of one job
+ACTIVE = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job is cancelled"""
+
+
+class JobError(Exception):
+    """Failure a retry cannot fix: the job fails without further attempts"""
+
+
+class JobContext:
+    """What a handler sees of its job: payload, progress reporting, cancellation"""
+
+    def __init__(self, jobs, job):
+        self.jobs = jobs
+        self.id = job.id
+        self.job_type = job.job_type
+        self.attempt = job.attempts
+        self.payload = json.loads(job.payload) if job.payload else {}
+        self.result = json.loads(job.result) if job.result else {}
+        self.message = None
+        self.processes = []
+        self._written = 0
+        self._cancel_checked = time.monotonic()
+
+    def update(self, progress=None, message=None, force=False, **result):
+        """Record progress (0-100), a message and result fields; raises JobCancelled if cancelled"""
+        self.check()
+        if message is not None:
+            self.message = message
+        self.result.update(result)
+        now = time.monotonic()
+        if not force and now - self._written < PROGRESS_INTERVAL:
+            return
+        self._written = now
+        values = {'result': json.dumps(self.result), 'message': self.message}
+        if progress is not None:
+            values['progress'] = max(0.0, min(100.0, float(progress)))
+        BackgroundJob.query.filter_by(id=self.id).update(
+            dict(values, heartbeat_at=datetime.utcnow()), synchronize_session=False)
+        db.session.commit()
+        self.jobs.publish(self.id, dict(values, result=self.result))
+
+    def cancelled(self):
+        """Cancelled in this process, or (read at most every CANCEL_POLL_INTERVAL) in another one"""
+        if self.id in self.jobs.cancelling:
+            return True
+        now = time.monotonic()
+        if now - self._cancel_checked >= CANCEL_POLL_INTERVAL:
+            self._cancel_checked = now
+            requested = BackgroundJob.query.with_entities(BackgroundJob.cancel_requested).filter_by(
+                id=self.id).scalar()
+            if requested:
+                with self.jobs.lock:
+                    self.jobs.cancelling.add(self.id)
+                return True
+        return False
+
+    def check(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+    def track(self, process):
+        """Terminate this Popen if the job is cancelled"""
+        self.processes.append(process)
+        if self.cancelled():
+            process.terminate()
+        return process
+
+
+class JobQueue:
+    """Typed, prioritised, persistent jobs run by a bounded worker pool"""
+
+    def __init__(self, service):
+        self.service = service
+        self.handlers = {}  # {job_type: {'handler', 'priority', 'max_attempts', 'concurrency'}}
+        self.running = {}  # {job_id: JobContext} in this process
+        self.cancelling = set()  # running job ids asked to stop
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.timer = None
+        self.heartbeat_timer = None
+        self.owner = None  # host:pid written on the jobs this process runs
+        self.log = None  # log(message, level) for job outcomes, set by the app
+
+    def register(self, job_type, handler, priority=0, max_attempts=3, concurrency=None):
+        """handler(JobContext) returns a result dict; concurrency caps running jobs of the type"""
+        self.handlers[job_type] = {
+            'handler': handler,
+            'priority': priority,
+            'max_attempts': max_attempts,
+            'concurrency': concurrency,
+        }
+        self.wakeup.set()
+
+    def start(self):
+        """Requeue jobs interrupted by a restart and start the workers (idempotent)"""
+        if self.threads:
+            return
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        with self.service.app.app_context():
+            self.recover()
+            workers = int(get_config('job_workers', DEFAULT_WORKERS))
+        for n in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{n}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.timer = self.service.supervisor.call_every(PRUNE_INTERVAL, self.prune)
+        self.heartbeat_timer = self.service.supervisor.call_every(HEARTBEAT_INTERVAL, self.heartbeat)
+
+    def _orphaned(self, job, now):
+        """True if the job's lease ran out or its owner on this host is gone"""
+        if job.heartbeat_at is None or job.heartbeat_at < now - timedelta(seconds=LEASE_SECONDS):
+            return True
+        host, _, pid = (job.owner or '').rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        if int(pid) == os.getpid():
+            with self.lock:
+                return job.id not in self.running
+        return not psutil.pid_exists(int(pid))
+
+    def recover(self):
+        """Running jobs that lost their process (restart, crashed worker): run them again or give up"""
+        now = datetime.utcnow()
+        recovered = []
+        for job in BackgroundJob.query.filter_by(status='running').all():
+            if not self._orphaned(job, now):
+                continue
+            if job.cancel_requested:
+                values = {'status': 'cancelled', 'message': 'Cancelled', 'finished_at': now}
+            elif job.attempts >= job.max_attempts:
+                values = {'status': 'failed', 'message': 'Interrupted: its process stopped', 'finished_at': now}
+            else:
+                values = {'status': 'queued', 'message': 'Requeued: its process stopped', 'run_after': now}
+            # Conditional: the owner may renew it, or another process recover it, right now
+            if BackgroundJob.query.filter_by(id=job.id, status='running', owner=job.owner,
+                                             heartbeat_at=job.heartbeat_at).update(values, synchronize_session=False):
+                recovered.append((job.id, values))
+        db.session.commit()
+        for job_id, values in recovered:
+            self.publish(job_id, {'status': values['status'], 'message': values['message']})
+        if recovered:
+            self.wakeup.set()
+
+    def heartbeat(self):
+        """Renew the leases of this process's running jobs, pick up cancels from other processes
+        and recover jobs of processes that stopped renewing theirs"""
+        with self.lock:
+            running = dict(self.running)
+        if running:
+            BackgroundJob.query.filter(
+                BackgroundJob.id.in_(list(running)), BackgroundJob.owner == self.owner,
+                BackgroundJob.status == 'running'
+            ).update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            cancelled = [job_id for (job_id,) in BackgroundJob.query.with_entities(BackgroundJob.id).filter(
+                BackgroundJob.id.in_(list(running)), BackgroundJob.cancel_requested.is_(True))]
+            for job_id in cancelled:
+                with self.lock:
+                    self.cancelling.add(job_id)
+                for process in running[job_id].processes:
+                    if process.poll() is None:
+                        process.terminate()
+        self.recover()
+
+    def submit(self, job_type, payload=None, priority=None, dedupe_key=None, max_attempts=None):
+        """Queue a job (commits); with a dedupe_key an identical queued/running job is returned instead"""
+        spec = self.handlers.get(job_type, {})
+        with self.lock:
+            if dedupe_key:
+                existing = BackgroundJob.query.filter(
+                    BackgroundJob.dedupe_key == dedupe_key,
+                    BackgroundJob.status.in_(ACTIVE)
+                ).first()
+                if existing:
+                    return existing
+            job = BackgroundJob(
+                job_type=job_type,
+                payload=json.dumps(payload or {}),
+                priority=spec.get('priority', 0) if priority is None else priority,
+                max_attempts=max_attempts or spec.get('max_attempts', 3),
+                dedupe_key=dedupe_key,
+                run_after=datetime.utcnow()
+            )
+            db.session.add(job)
+            db.session.commit()
+        self.wakeup.set()
+        self.publish(job.id, job.to_dict())
+        return job
+
+    def get(self, job_id):
+        return BackgroundJob.query.get(job_id)
+
+    def list(self, status=None, job_type=None, limit=50):
+        query = BackgroundJob.query
+        if status:
+            query = query.filter(BackgroundJob.status.in_(status.split(',')))
+        if job_type:
+            query = query.filter_by(job_type=job_type)
+        return query.order_by(BackgroundJob.id.desc()).limit(limit).all()
+
+    def count(self, job_type=None, statuses=ACTIVE):
+        query = BackgroundJob.query.filter(BackgroundJob.status.in_(statuses))
+        if job_type:
+            query = query.filter_by(job_type=job_type)
+        return query.count()
+
+    def cancel(self, job_id):
+        """Cancel a queued job now or ask a running one to stop; False if already finished"""
+        job = BackgroundJob.query.get(job_id)
+        if not job or job.status not in ACTIVE:
+            return False
+        if job.status == 'queued':
+            # Conditional, a worker may be claiming it right now
+            cancelled = BackgroundJob.query.filter_by(id=job_id, status='queued').update({
+                'status': 'cancelled', 'message': 'Cancelled', 'finished_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if cancelled:
+                self.publish(job_id, {'status': 'cancelled', 'message': 'Cancelled'})
+                return True
+        BackgroundJob.query.filter_by(id=job_id).update({'cancel_requested': True}, synchronize_session=False)
+        db.session.commit()
+        with self.lock:
+            self.cancelling.add(job_id)
+            context = self.running.get(job_id)
+        for process in context.processes if context else []:
+            if process.poll() is None:
+                process.terminate()
+        self.publish(job_id, {'cancel_requested': True})
+        return True
+
+    def publish(self, job_id, data):
+        self.service.events.publish('jobs', dict(data, id=job_id))
+
+    def prune(self):
+        """Delete finished jobs older than the retention period"""
+        try:
+            days = float(get_config('job_retention_days', DEFAULT_RETENTION_DAYS))
+            BackgroundJob.query.filter(
+                BackgroundJob.status.notin_(ACTIVE),
+                BackgroundJob.finished_at < datetime.utcnow() - timedelta(days=days)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error pruning jobs: {e}")
+
+    def _running_counts(self):
+        """{job_type: running jobs} over every process sharing the table"""
+        return dict(BackgroundJob.query.with_entities(BackgroundJob.job_type, db.func.count(BackgroundJob.id))
+                    .filter(BackgroundJob.status == 'running').group_by(BackgroundJob.job_type).all())
+
+    def _claim(self):
+        """Mark the next runnable job running and return it, or None"""
+        with self.lock:
+            busy = self._running_counts()
+            types = [
+                job_type for job_type, spec in self.handlers.items()
+                if not spec['concurrency'] or busy.get(job_type, 0) < spec['concurrency']
+            ]
+            if not types:
+                return None
+            now = datetime.utcnow()
+            candidates = BackgroundJob.query.with_entities(BackgroundJob.id, BackgroundJob.job_type).filter(
+                BackgroundJob.status == 'queued',
+                BackgroundJob.run_after <= now,
+                BackgroundJob.job_type.in_(types)
+            ).order_by(BackgroundJob.priority.desc(), BackgroundJob.id.asc()).limit(5).all()
+            for job_id, job_type in candidates:
+                job = BackgroundJob.query.get(job_id)
+                # In self.running before the row says running: recover() must never see it unowned
+                context = self.running[job_id] = JobContext(self, job)
+                conditions = [BackgroundJob.id == job_id, BackgroundJob.status == 'queued']
+                limit = self.handlers[job_type]['concurrency']
+                if limit:
+                    # Counted inside the UPDATE: another process cannot claim in between
+                    others = db.aliased(BackgroundJob)
+                    conditions.append(db.select(db.func.count(others.id)).where(
+                        others.status == 'running', others.job_type == job_type
+                    ).scalar_subquery() < limit)
+                try:
+                    claimed = BackgroundJob.query.filter(*conditions).update({
+                        'status': 'running',
+                        'attempts': BackgroundJob.attempts + 1,
+                        'started_at': now,
+                        'owner': self.owner,
+                        'heartbeat_at': now,
+                        'message': None,
+                    }, synchronize_session=False)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    del self.running[job_id]
+                    raise
+                if claimed:
+                    db.session.refresh(job)
+                    context.attempt = job.attempts
+                    return job
+                del self.running[job_id]
+            return None
+
+    def _worker(self):
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            try:
+                with self.service.app.app_context():
+                    job = self._claim()
+                    if job:
+                        self._execute(job)
+                        continue
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                time.sleep(1)
+            self.wakeup.wait(POLL_INTERVAL)
+
+    def _execute(self, job):
+        context = self.running[job.id]
+        spec = self.handlers[job.job_type]
+        self.publish(job.id, {'status': 'running', 'job_type': job.job_type, 'attempts': job.attempts})
+        try:
+            self._finish(job, context, spec)
+        finally:
+            # Only once the outcome is written: until then recover() must see the job as ours
+            with self.lock:
+                self.running.pop(job.id, None)
+                self.cancelling.discard(job.id)
+
+    def _finish(self, job, context, spec):
+        """Run the handler and record its outcome"""
+        values = {'finished_at': datetime.utcnow()}
+        level = 'INFO'
+        try:
+            result = spec['handler'](context)
+            context.check()
+            if result:
+                context.result.update(result)
+            values.update(status='done', progress=100.0, message=context.message or f"{job.job_type} done")
+        except Exception as e:
+            db.session.rollback()
+            for process in context.processes:
+                if process.poll() is None:
+                    process.kill()
+            if isinstance(e, JobCancelled) or context.cancelled():
+                values.update(status='cancelled', message='Cancelled')
+            elif isinstance(e, JobError) or job.attempts >= job.max_attempts:
+                values.update(status='failed', message=f"{job.job_type} failed: {e}")
+                level = 'ERROR'
+            else:
+                delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+                values.update(status='queued', finished_at=None,
+                              run_after=datetime.utcnow() + timedelta(seconds=delay),
+                              message=f"Attempt {job.attempts} failed: {e}, retrying in {delay}s")
+                level = 'WARNING'
+
+        values['result'] = json.dumps(context.result)
+        # Only while still ours: after a lost lease the job was requeued and may run elsewhere
+        finished = BackgroundJob.query.filter_by(id=job.id, status='running', owner=self.owner).update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if not finished:
+            print(f"Job {job.id} lost its lease while running, its outcome is not recorded")
+            return
+        self.publish(job.id, {
+            'status': values['status'], 'job_type': job.job_type,
+            'message': values['message'], 'result': context.result
+        })
+        if self.log and (level != 'INFO' or context.message):
+            self.log(values['message'], level)
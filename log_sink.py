@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Log Sink
+Background writer for StreamLog rows. Callers only append to an in-memory
+queue; a worker thread bulk-inserts the queue every FLUSH_INTERVAL seconds or
+BATCH_SIZE rows in one transaction, instead of one SQLite commit per line.
+When the queue is full INFO lines are dropped right away and warnings/errors
+wait briefly for room. A batch the database refuses (e.g. "database is
+locked") is retried once and then dropped. Drops are counted and reported
+in the log itself.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from database import db, StreamLog
+
+FLUSH_INTERVAL = 0.5  # seconds
+BATCH_SIZE = 500  # rows per flush
+MAX_QUEUE = 10000  # entries held in memory
+BLOCK_SECONDS = 0.05  # how long a WARNING/ERROR waits for room before it is dropped
+RETRY_SECONDS = 1.0  # wait before the one retry of a failed insert
+
+
+class LogSink:
+    """Queue log entries and write them to the database in bulk"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, max_queue=MAX_QUEUE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.app = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.dropped = {}  # {level: count} since the last report
+        self.dropped_total = 0
+        self.written_total = 0
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.close)
+
+    def write(self, message, level='INFO', session_id=None, timestamp=None):
+        """Queue one StreamLog row; never blocks INFO callers"""
+        entry = {
+            'timestamp': timestamp or datetime.utcnow(),
+            'level': level,
+            'message': message,
+            'session_id': session_id,
+        }
+        self._ensure_thread()
+        try:
+            if level in ('WARNING', 'ERROR'):
+                self.queue.put(entry, timeout=BLOCK_SECONDS)
+            else:
+                self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.lock:
+                self.dropped[level] = self.dropped.get(level, 0) + 1
+                self.dropped_total += 1
+
+    def _ensure_thread(self):
+        if self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        """Wait up to flush_interval for entries, return at most batch_size of them"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _flush(self, batch):
+        with self.lock:
+            dropped, self.dropped = self.dropped, {}
+        rows = list(batch)
+        if dropped:
+            counts = ', '.join(f"{count} {level}" for level, count in sorted(dropped.items()))
+            rows.append({
+                'timestamp': datetime.utcnow(),
+                'level': 'WARNING',
+                'message': f"Dropped {counts} log entries (queue full or database busy)",
+                'session_id': None,
+            })
+
+        for attempt in range(2):
+            try:
+                if self.app:
+                    with self.app.app_context():
+                        self._insert(rows)
+                else:
+                    self._insert(rows)
+                self.written_total += len(rows)
+                return
+            except Exception as e:
+                error = e
+                if attempt == 0:
+                    time.sleep(RETRY_SECONDS)
+
+        print(f"Error saving {len(batch)} logs to DB, dropped: {error}")
+        with self.lock:
+            # The next report counts these rows and carries the unwritten one over
+            for level, count in dropped.items():
+                self.dropped[level] = self.dropped.get(level, 0) + count
+            for entry in batch:
+                self.dropped[entry['level']] = self.dropped.get(entry['level'], 0) + 1
+            self.dropped_total += len(batch)
+
+    def _insert(self, rows):
+        try:
+            db.session.execute(StreamLog.__table__.insert(), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def flush(self):
+        """Write everything queued so far on the calling thread"""
+        batch = self._drain()
+        while batch:
+            self._flush(batch[:self.batch_size])
+            batch = batch[self.batch_size:]
+
+    def close(self):
+        """Stop the worker and flush what is still queued"""
+        self.stopping.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def get_status(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written_total,
+            'dropped': self.dropped_total,
+        }
+
+
+log_sink = LogSink()
@@ -41,6 +41,100 @@ def migrate_database():
         if 'preset' not in existing_columns:
             migrations.append("ALTER TABLE stream_channels ADD COLUMN preset VARCHAR(20) DEFAULT 'veryfast'")
         
+        if 'playlist_id' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN playlist_id INTEGER REFERENCES playlists(id)")
+        
+        if 'restart_base_delay' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN restart_base_delay FLOAT DEFAULT 2.0")
+        
+        if 'restart_max_delay' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN restart_max_delay FLOAT DEFAULT 120.0")
+        
+        if 'restart_budget' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN restart_budget INTEGER DEFAULT 10")
+        
+        if 'restart_window_seconds' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN restart_window_seconds INTEGER DEFAULT 600")
+        
+        if 'restart_cooloff_seconds' not in existing_columns:
+            migrations.append("ALTER TABLE stream_channels ADD COLUMN restart_cooloff_seconds INTEGER DEFAULT 900")
+        
+        # Check existing columns in stream_health
+        cursor.execute("PRAGMA table_info(stream_health)")
+        health_columns = [row[1] for row in cursor.fetchall()]
+        
+        if health_columns and 'speed' not in health_columns:
+            migrations.append("ALTER TABLE stream_health ADD COLUMN speed FLOAT")
+        
+        # Check existing columns in video_library
+        cursor.execute("PRAGMA table_info(video_library)")
+        video_columns = [row[1] for row in cursor.fetchall()]
+        
+        if video_columns and 'file_hash' not in video_columns:
+            migrations.append("ALTER TABLE video_library ADD COLUMN file_hash VARCHAR(64)")
+        
+        if video_columns and 'hashed_size' not in video_columns:
+            migrations.append("ALTER TABLE video_library ADD COLUMN hashed_size BIGINT")
+        
+        if video_columns and 'hashed_mtime' not in video_columns:
+            migrations.append("ALTER TABLE video_library ADD COLUMN hashed_mtime FLOAT")
+        
+        if video_columns and 'fingerprint' not in video_columns:
+            migrations.append("ALTER TABLE video_library ADD COLUMN fingerprint VARCHAR(64)")
+        
+        if video_columns and 'missing_since' not in video_columns:
+            migrations.append("ALTER TABLE video_library ADD COLUMN missing_since DATETIME")
+        
+        # Content keys of cached probe results
+        cursor.execute("PRAGMA table_info(probe_cache)")
+        probe_columns = [row[1] for row in cursor.fetchall()]
+        
+        if probe_columns and 'fingerprint' not in probe_columns:
+            migrations.append("ALTER TABLE probe_cache ADD COLUMN fingerprint VARCHAR(64)")
+        
+        # Library video of each session (was only matched on the video_file string)
+        cursor.execute("PRAGMA table_info(stream_sessions)")
+        session_columns = [row[1] for row in cursor.fetchall()]
+        
+        if 'video_id' not in session_columns:
+            migrations.append("ALTER TABLE stream_sessions ADD COLUMN video_id INTEGER REFERENCES video_library(id)")
+            migrations.append(
+                "UPDATE stream_sessions SET video_id = "
+                "(SELECT MIN(id) FROM video_library WHERE video_library.file_path = stream_sessions.video_file) "
+                "WHERE video_id IS NULL AND video_file IS NOT NULL"
+            )
+        
+        # Owner and lease of running background jobs (several worker processes)
+        cursor.execute("PRAGMA table_info(background_jobs)")
+        job_columns = [row[1] for row in cursor.fetchall()]
+        
+        if job_columns and 'owner' not in job_columns:
+            migrations.append("ALTER TABLE background_jobs ADD COLUMN owner VARCHAR(100)")
+        if job_columns and 'heartbeat_at' not in job_columns:
+            migrations.append("ALTER TABLE background_jobs ADD COLUMN heartbeat_at DATETIME")
+        
+        # Chunk lock of uploads (several worker processes)
+        cursor.execute("PRAGMA table_info(upload_sessions)")
+        upload_columns = [row[1] for row in cursor.fetchall()]
+        
+        if upload_columns and 'writing_since' not in upload_columns:
+            migrations.append("ALTER TABLE upload_sessions ADD COLUMN writing_since DATETIME")
+        
+        # Indexes for analytics aggregates over a time window
+        migrations.append("CREATE INDEX IF NOT EXISTS ix_stream_sessions_channel_start ON stream_sessions (channel_id, start_time)")
+        migrations.append("CREATE INDEX IF NOT EXISTS ix_stream_sessions_start ON stream_sessions (start_time)")
+        migrations.append("CREATE INDEX IF NOT EXISTS ix_stream_sessions_video_start ON stream_sessions (video_id, start_time)")
+        if video_columns:
+            migrations.append("CREATE INDEX IF NOT EXISTS ix_video_library_file_path ON video_library (file_path)")
+            migrations.append("CREATE INDEX IF NOT EXISTS ix_video_library_fingerprint ON video_library (fingerprint)")
+        if probe_columns:
+            migrations.append("CREATE INDEX IF NOT EXISTS ix_probe_cache_fingerprint ON probe_cache (fingerprint)")
+        
+        # Indexes for time-range health queries and rollup compaction
+        if health_columns:
+            migrations.append("CREATE INDEX IF NOT EXISTS ix_stream_health_session_time ON stream_health (session_id, timestamp)")
+            migrations.append("CREATE INDEX IF NOT EXISTS ix_stream_health_time ON stream_health (timestamp)")
+        
         # Execute migrations
         for migration in migrations:
             print(f"Executing: {migration}")
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Playlist Streaming
+Plays a playlist gaplessly in one long-lived FFmpeg that reads MPEG-TS from
+its stdin. Each item is remuxed (no re-encode) by a short-lived reader FFmpeg
+writing straight into that pipe, its timestamps shifted to follow the items
+before it, so the long-lived FFmpeg sees one continuous input and the RTMP
+connection stays up across items. When a reader exits the next item's reader
+takes over the same pipe: nothing nests, so file descriptors and memory stay
+flat however long the channel runs.
+
+The item FFmpeg is playing (for logs and sessions) follows from the
+-progress out_time crossing the offset at which each item was written.
+
+To stop, the feed is closed first (reader stopped, stdin closed): with no
+writer left FFmpeg plays what is still buffered in the pipe and exits at EOF.
+A first SIGTERM does not interrupt that, so the usual terminate, wait, kill
+sequence bounds it.
+"""
+
+import os
+import re
+import subprocess
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from advanced_features import PlaylistManager
+from stream_telemetry import FFmpegProgressParser
+
+PIPE_FORMAT = 'mpegts'  # restarts cleanly at every item, fixed 90 kHz clock
+PIPE_BUFFER_BYTES = 1024 * 1024  # stdin pipe of the playing FFmpeg: ~2s at 4 Mbps to cover a reader start
+BOUNDARY_MARGIN = 0.5  # seconds past an item boundary before it counts as playing
+END_PADDING = 0.1  # seconds after an item's last timestamp (a frame start) where the next one starts
+MAX_FAILED_ITEMS = 5  # unreadable items in a row before the feed is given up
+PROGRESS_LINE = re.compile(r'^\w+=')
+
+
+def probe_duration(path):
+    """Duration in seconds via ffprobe, None if unknown"""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            path
+        ], capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def playlist_input_args():
+    """Global/input arguments of the FFmpeg playing a feed from its stdin"""
+    return [
+        'ffmpeg',
+        '-loglevel', 'warning',
+        '-nostats',
+        '-progress', 'pipe:1',
+        '-re',
+        '-f', PIPE_FORMAT,
+        '-i', 'pipe:0',
+    ]
+
+
+def reader_command(path, offset):
+    """Remux one item to the feed format, timestamps starting at offset seconds"""
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-progress', 'pipe:2',  # out_time tells how far the item got
+        '-i', path,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c', 'copy',
+        '-output_ts_offset', f'{offset:.6f}',
+        '-f', PIPE_FORMAT,
+        'pipe:1',
+    ]
+
+
+def _grow_pipe(pipe):
+    """Bigger pipe buffer so the playing FFmpeg never waits for the next reader (Linux)"""
+    if fcntl and hasattr(fcntl, 'F_SETPIPE_SZ'):
+        try:
+            fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, PIPE_BUFFER_BYTES)
+        except OSError:
+            pass  # above /proc/sys/fs/pipe-max-size: keep the default
+
+
+class PlaylistFeeder:
+    """Feed one channel's playlist item by item into the stdin of its FFmpeg"""
+
+    def __init__(self, channel_id, playlist_id, manager=None):
+        self.channel_id = channel_id
+        self.playlist_id = playlist_id
+        self.manager = manager or PlaylistManager()
+        self.current = None  # {'id', 'title', 'path', 'duration'} playing now
+        self.upcoming = deque()  # (start out_time, item) already fed, not playing yet
+        self.offset = 0.0  # out_time at which the next fed item starts
+        self.process = None  # FFmpeg reading the feed
+        self.reader = None  # FFmpeg writing the item being fed
+        self.supervisor = None
+        self.placement = None
+        self.log = None  # log(message, level)
+        self.failed_items = 0
+        self.items_played = 0
+        self.advance_pending = False  # An advance is scheduled on the supervisor control thread
+
+    def _item(self, video):
+        duration = video.duration_seconds or probe_duration(video.file_path)
+        return {
+            'id': video.id,
+            'title': video.title,
+            'path': os.path.abspath(video.file_path),
+            'duration': float(duration) if duration else None,
+        }
+
+    def _pick(self, current_id):
+        """Next playable item after current_id following the playlist mode"""
+        tried = set()
+        video = self.manager.get_next_video(self.playlist_id, current_id)
+        while video and video.id not in tried:
+            if os.path.exists(video.file_path):
+                return self._item(video)
+            tried.add(video.id)
+            video = self.manager.get_next_video(self.playlist_id, video.id)
+        return None
+
+    def begin(self):
+        """Choose the first item of a new FFmpeg (the current one after a restart); False if none"""
+        self.stop_feeding()
+        item = self.current or self._pick(None)
+        if not item:
+            return False
+        self.current = item
+        self.upcoming.clear()
+        self.offset = 0.0
+        self.failed_items = 0
+        self.advance_pending = False
+        return True
+
+    def attach(self, process, supervisor, placement=None, log=None):
+        """Start feeding a new FFmpeg (opened with stdin=PIPE) from the current item"""
+        self.process = process
+        self.supervisor = supervisor
+        self.placement = placement
+        self.log = log
+        _grow_pipe(process.stdin)
+        self._feed(process, self.current)
+
+    def _feed(self, process, item):
+        parser = FFmpegProgressParser()
+        state = {'out_time': None, 'errors': deque(maxlen=3)}
+
+        def on_stderr_line(line):
+            if PROGRESS_LINE.match(line):
+                sample = parser.feed(line)
+                if sample and sample['out_time_seconds'] is not None:
+                    state['out_time'] = sample['out_time_seconds']
+            elif line.strip():
+                state['errors'].append(line.strip())
+
+        try:
+            reader = subprocess.Popen(reader_command(item['path'], self.offset), stdin=subprocess.DEVNULL,
+                                      stdout=process.stdin, stderr=subprocess.PIPE)
+        except ValueError:
+            return  # the feed was closed (stop) meanwhile
+        except OSError as e:
+            self._item_failed(process, item, str(e))
+            return
+        self.reader = reader
+        if process is not self.process:
+            # Stopped while this reader started: it must not hold the pipe open
+            self.reader = None
+            reader.terminate()
+        if self.placement:
+            self.placement.place(reader, 'copy')
+        self.supervisor.watch(
+            reader,
+            on_exit=lambda proc, code: self._fed(process, item, code, state),
+            on_stderr_line=on_stderr_line
+        )
+
+    def _fed(self, process, item, returncode, state):
+        """A reader is done (control thread): feed the item after it"""
+        if process is not self.process or process.poll() is not None:
+            return  # FFmpeg was stopped or replaced, its feed ends here
+        self.reader = None
+        out_time = state['out_time']
+        if returncode != 0 or out_time is None:
+            reason = state['errors'][-1] if state['errors'] else f"reader exited with code {returncode}"
+            if out_time is not None:
+                self.offset += out_time + END_PADDING  # what did get through
+            self._item_failed(process, item, reason)
+            return
+
+        self.failed_items = 0
+        end = out_time + END_PADDING
+        if item['duration'] and end < item['duration'] < out_time + 1.0:
+            # The last frame's duration is not in out_time; a stored duration far off is not trusted
+            end = item['duration']
+        self.offset += end
+        self._next(process, item)
+
+    def _item_failed(self, process, item, reason):
+        self.failed_items += 1
+        self._log(f"Skipping {item['title']}: {reason}", 'WARNING')
+        if self.failed_items >= MAX_FAILED_ITEMS:
+            # Nothing readable: end the input, FFmpeg exits and the restart policy takes over
+            self._log(f"{self.failed_items} playlist items in a row could not be read, ending the stream", 'ERROR')
+            self._close_input(process)
+            return
+        self._next(process, item)
+
+    def _next(self, process, item):
+        nxt = self._pick(item['id']) or item
+        self.upcoming.append((self.offset, nxt))
+        self._feed(process, nxt)
+
+    def _log(self, message, level):
+        if self.log:
+            self.log(message, level)
+        else:
+            print(f"[Playlist {self.channel_id}] {message}")
+
+    def needs_advance(self, out_time_seconds):
+        """True once FFmpeg plays past the start of the next fed item"""
+        return (bool(self.upcoming) and out_time_seconds is not None
+                and out_time_seconds >= self.upcoming[0][0] + BOUNDARY_MARGIN)
+
+    def advance(self, out_time_seconds):
+        """Move to the item FFmpeg is playing now"""
+        while self.needs_advance(out_time_seconds):
+            _, self.current = self.upcoming.popleft()
+            self.items_played += 1
+        return self.current
+
+    def _close_input(self, process):
+        try:
+            process.stdin.close()
+        except (OSError, ValueError):
+            pass
+
+    def stop_feeding(self):
+        """Stop the reader and release the pipe of the FFmpeg fed so far"""
+        reader, self.reader = self.reader, None
+        if reader and reader.poll() is None:
+            reader.terminate()
+        if self.process:
+            self._close_input(self.process)
+            self.process = None
+
+    def cleanup(self):
+        self.stop_feeding()
+
+    def to_dict(self):
+        start, item = self.upcoming[0] if self.upcoming else (None, None)
+        return {
+            'playlist_id': self.playlist_id,
+            'current': self.current,
+            'next': item,
+            'next_at_seconds': start,
+            'items_played': self.items_played,
+        }
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Process Sampler
+One resource sampler for every supervised FFmpeg process. Each tick reads
+/proc once: the stat file of every process (to find the children of the
+FFmpeg processes), then io and status of the FFmpeg trees only. CPU % comes
+from the previous tick's counters, so nothing blocks, and every stream tree
+gets CPU, RSS, disk I/O and context switches. Health monitoring, admission
+control and the API all read the latest samples instead of polling psutil.
+"""
+
+import os
+import time
+
+import psutil
+
+SAMPLE_INTERVAL = 5  # seconds
+PROC = '/proc'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _read_stat(pid):
+    """(ppid, cpu ticks, start time, rss bytes) from /proc/<pid>/stat"""
+    with open(f'{PROC}/{pid}/stat', 'rb') as f:
+        data = f.read()
+    fields = data[data.rindex(b')') + 2:].split()  # comm may contain spaces and parentheses
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[19]), int(fields[21]) * PAGE_SIZE
+
+
+def _read_io(pid):
+    """(read bytes, write bytes) that reached the storage layer, None if not readable"""
+    try:
+        values = {}
+        with open(f'{PROC}/{pid}/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                values[key] = int(value)
+        return values.get('read_bytes', 0), values.get('write_bytes', 0)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_ctx_switches(pid):
+    """(voluntary, involuntary) context switches of all threads"""
+    voluntary = involuntary = 0
+    try:
+        with open(f'{PROC}/{pid}/status') as f:
+            for line in f:
+                if line.startswith('voluntary_ctxt_switches'):
+                    voluntary = int(line.split()[1])
+                elif line.startswith('nonvoluntary_ctxt_switches'):
+                    involuntary = int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return voluntary, involuntary
+
+
+class ProcessSampler:
+    """Sample the FFmpeg process trees from a supervisor timer"""
+
+    def __init__(self, service, interval=SAMPLE_INTERVAL):
+        self.service = service
+        self.interval = interval
+        self.use_proc = os.path.isdir(f'{PROC}/self')
+        self.total_memory = psutil.virtual_memory().total
+        self.counters = {}  # {(pid, start time): (cpu seconds, read, write, ctx switches, monotonic)}
+        self.by_pid = {}  # {root pid: latest sample of its tree}
+        self.by_channel = {}  # {channel_id: latest sample}
+        self.timer = None
+
+    def start(self):
+        if not self.timer:
+            self.timer = self.service.supervisor.call_every(self.interval, self.sample)
+
+    def _roots(self):
+        """{pid: (kind, channel_id)} for every FFmpeg process the supervisor watches"""
+        service = self.service
+        roots = {pid: ('other', None) for pid in list(service.supervisor.watches)}
+        for group in list(service.shared_encoders.groups.values()):
+            if group['encoder'] is not None:
+                roots[group['encoder'].pid] = ('shared_encoder', None)
+        for channel_id, process in list(service.active_streams.items()):
+            roots[process.pid] = ('stream', channel_id)
+        return roots
+
+    def _scan(self):
+        """{pid: (ppid, cpu ticks, start time, rss)} for every process, one /proc pass"""
+        processes = {}
+        for name in os.listdir(PROC):
+            if name.isdigit():
+                try:
+                    processes[int(name)] = _read_stat(name)
+                except (OSError, ValueError, IndexError):
+                    pass  # Exited during the scan
+        return processes
+
+    def _trees(self, roots, processes):
+        """{root pid: [pids of the root and all its descendants]}"""
+        children = {}
+        for pid, (ppid, _, _, _) in processes.items():
+            children.setdefault(ppid, []).append(pid)
+        trees = {}
+        for root in roots:
+            if root not in processes:
+                continue
+            tree, stack = [], [root]
+            while stack:
+                pid = stack.pop()
+                tree.append(pid)
+                stack.extend(children.get(pid, ()))
+            trees[root] = tree
+        return trees
+
+    def _read_tree(self, tree, processes):
+        """Current counters of each process of a tree: [(key, cpu s, rss, read, write, ctx)]"""
+        readings = []
+        for pid in tree:
+            _, ticks, started, rss = processes[pid]
+            io = _read_io(pid) or (0, 0)
+            voluntary, involuntary = _read_ctx_switches(pid)
+            readings.append(((pid, started), ticks / CLOCK_TICKS, rss, io[0], io[1], (voluntary, involuntary)))
+        return readings
+
+    def _read_tree_psutil(self, root):
+        """Same readings through psutil (no /proc, e.g. macOS and Windows)"""
+        readings = []
+        try:
+            top = psutil.Process(root)
+            tree = [top] + top.children(recursive=True)
+        except psutil.Error:
+            return readings
+        for proc in tree:
+            try:
+                with proc.oneshot():
+                    cpu = proc.cpu_times()
+                    rss = proc.memory_info().rss
+                    try:
+                        io = proc.io_counters()
+                        io = (io.read_bytes, io.write_bytes)
+                    except (psutil.Error, AttributeError):
+                        io = (0, 0)
+                    ctx = proc.num_ctx_switches()
+                    readings.append(((proc.pid, proc.create_time()), cpu.user + cpu.system, rss,
+                                     io[0], io[1], (ctx.voluntary, ctx.involuntary)))
+            except psutil.Error:
+                continue
+        return readings
+
+    def sample(self):
+        """Take one sample of every FFmpeg tree"""
+        roots = self._roots()
+        now = time.monotonic()
+        if self.use_proc:
+            processes = self._scan()
+            trees = {root: self._read_tree(tree, processes) for root, tree in self._trees(roots, processes).items()}
+        else:
+            trees = {root: self._read_tree_psutil(root) for root in roots}
+
+        counters, by_pid, by_channel = {}, {}, {}
+        for root, readings in trees.items():
+            if not readings:
+                continue
+            cpu_delta = read_delta = write_delta = ctx_delta = 0.0
+            seconds = None
+            rss = read_total = write_total = voluntary = involuntary = 0
+            for key, cpu, proc_rss, read, write, ctx in readings:
+                counters[key] = (cpu, read, write, sum(ctx), now)
+                rss += proc_rss
+                read_total += read
+                write_total += write
+                voluntary += ctx[0]
+                involuntary += ctx[1]
+                previous = self.counters.get(key)
+                if previous:
+                    # Processes new since the last tick only count from the next one
+                    cpu_delta += cpu - previous[0]
+                    read_delta += read - previous[1]
+                    write_delta += write - previous[2]
+                    ctx_delta += sum(ctx) - previous[3]
+                    seconds = now - previous[4]
+
+            kind, channel_id = roots[root]
+            sample = {
+                'pid': root,
+                'kind': kind,
+                'channel_id': channel_id,
+                'processes': len(readings),
+                'timestamp': time.time(),
+                'cpu_percent': round(cpu_delta * 100.0 / seconds, 1) if seconds else None,
+                'rss_mb': round(rss / (1024 * 1024), 1),
+                'memory_percent': round(rss * 100.0 / self.total_memory, 2),
+                'read_bytes': read_total,
+                'write_bytes': write_total,
+                'read_bytes_per_sec': round(read_delta / seconds, 1) if seconds else None,
+                'write_bytes_per_sec': round(write_delta / seconds, 1) if seconds else None,
+                'ctx_switches_voluntary': voluntary,
+                'ctx_switches_involuntary': involuntary,
+                'ctx_switches_per_sec': round(ctx_delta / seconds, 1) if seconds else None,
+            }
+            by_pid[root] = sample
+            if channel_id is not None:
+                by_channel[channel_id] = sample
+
+        self.counters = counters  # Exited processes fall out here
+        self.by_pid = by_pid
+        self.by_channel = by_channel
+
+        events = self.service.events
+        if by_channel and events.has_subscribers():
+            events.publish('resources', {'channels': list(by_channel.values())})
+
+    def get_channel(self, channel_id):
+        """Latest sample of a stream's process tree, None if not sampled yet"""
+        return self.by_channel.get(channel_id)
+
+    def get_pid(self, pid):
+        return self.by_pid.get(pid)
+
+    def get_status(self):
+        return {
+            'interval': self.interval,
+            'source': 'proc' if self.use_proc else 'psutil',
+            'processes': sorted(self.by_pid.values(), key=lambda s: s['pid']),
+        }
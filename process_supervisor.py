@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Process Supervisor
+One event loop for all FFmpeg child processes: drains their pipes, forwards
+datagrams and reacts to process exit immediately (pidfd on Linux, polling
+elsewhere). The loop only does I/O: exit handlers and one-shot timers run in
+order on a control thread, periodic timers (database maintenance, sampling)
+on a small worker pool, so a slow callback never stalls a pipe or a relay.
+"""
+
+import heapq
+import itertools
+import os
+import queue
+import select
+import selectors
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from stream_telemetry import start_drain_thread
+
+MAX_LINE_BYTES = 64 * 1024
+POLL_INTERVAL = 0.5  # Exit polling when pidfd is not available
+WORKERS = 4  # Threads running periodic timers and run_in_worker callbacks
+
+
+class Timer:
+    """Handle for a scheduled callback, see ProcessSupervisor.call_later"""
+
+    def __init__(self, due, callback, args, interval=None):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+        self.running = False  # A periodic run is still busy on a worker
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Watch:
+    """Book-keeping for one supervised process"""
+
+    def __init__(self, process, on_exit, line_handlers):
+        self.process = process
+        self.on_exit = on_exit
+        self.line_handlers = line_handlers  # {fd: callback}
+        self.buffers = {}  # {fd: bytes}
+        self.pidfd = None
+        self.exited = False
+
+
+class ProcessSupervisor:
+    """Single supervisor loop shared by every stream"""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.RLock()
+        self.watches = {}  # {pid: _Watch}
+        self.timers = []  # heap of (due, seq, Timer)
+        self.counter = itertools.count()
+        self.context = None  # Optional callable returning a context manager (Flask app context)
+        self.thread = None
+        self.control = queue.Queue()  # (callback, args) run in order on the control thread
+        self.control_thread = None
+        self.workers = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='supervisor-worker')
+        self.use_selector = os.name != 'nt'
+        self.use_pidfd = hasattr(os, 'pidfd_open')
+
+        self._wake_r, self._wake_w = os.pipe()
+        if self.use_selector:
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+            self.selector.register(self._wake_r, selectors.EVENT_READ, ('wake', None, None))
+
+    def start(self):
+        """Start the supervisor and control threads (idempotent)"""
+        with self.lock:
+            if not (self.control_thread and self.control_thread.is_alive()):
+                self.control_thread = threading.Thread(target=self._run_control, name='supervisor-control',
+                                                       daemon=True)
+                self.control_thread.start()
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name='process-supervisor', daemon=True)
+            self.thread.start()
+
+    def watch(self, process, on_exit, on_stdout_line=None, on_stderr_line=None):
+        """Supervise a Popen (opened in binary mode); on_exit(process, returncode) runs on exit
+
+        Line handlers run on the loop and must not block; on_exit runs on the control thread.
+        """
+        self.start()
+        handlers = {}
+        for pipe, handler in ((process.stdout, on_stdout_line), (process.stderr, on_stderr_line)):
+            if pipe is not None:
+                handlers[pipe.fileno()] = handler
+
+        watch = _Watch(process, on_exit, handlers)
+        with self.lock:
+            self.watches[process.pid] = watch
+
+            if self.use_selector:
+                for fd in handlers:
+                    os.set_blocking(fd, False)
+                    watch.buffers[fd] = b''
+                    self.selector.register(fd, selectors.EVENT_READ, ('pipe', watch, fd))
+                if self.use_pidfd:
+                    try:
+                        watch.pidfd = os.pidfd_open(process.pid)
+                        self.selector.register(watch.pidfd, selectors.EVENT_READ, ('exit', watch, None))
+                    except OSError:
+                        # Kernel without pidfd support, fall back to polling
+                        self.use_pidfd = False
+            else:
+                for pipe, handler in ((process.stdout, on_stdout_line), (process.stderr, on_stderr_line)):
+                    if pipe is not None:
+                        start_drain_thread(pipe, self._text_handler(handler))
+        self._wake()
+        return watch
+
+    def add_reader(self, fileobj, callback):
+        """Call callback() on the supervisor thread whenever fileobj (e.g. a socket) is readable
+
+        Reader callbacks run without the app context and must not block.
+        """
+        self.start()
+        if not self.use_selector:
+            def poll_reader():
+                while fileobj.fileno() != -1:
+                    readable, _, _ = select.select([fileobj], [], [], POLL_INTERVAL)
+                    if readable:
+                        callback()
+            threading.Thread(target=poll_reader, daemon=True).start()
+            return
+        with self.lock:
+            self.selector.register(fileobj, selectors.EVENT_READ, ('reader', callback, None))
+        self._wake()
+
+    def remove_reader(self, fileobj):
+        if self.use_selector:
+            with self.lock:
+                self._unregister(fileobj)
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) on the control thread after `delay` seconds"""
+        return self._schedule(Timer(time.monotonic() + delay, callback, args))
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) on a worker every `interval` seconds, skipping a tick while still busy"""
+        return self._schedule(Timer(time.monotonic() + interval, callback, args, interval))
+
+    def run_in_worker(self, callback, *args):
+        """Run a blocking callback(*args) on a worker now, off the loop and the control thread"""
+        return self.workers.submit(self._dispatch, callback, *args)
+
+    def _schedule(self, timer):
+        self.start()
+        with self.lock:
+            heapq.heappush(self.timers, (timer.due, next(self.counter), timer))
+        self._wake()
+        return timer
+
+    def _wake(self):
+        if not self.use_selector:
+            return
+        try:
+            os.write(self._wake_w, b'x')
+        except OSError:
+            pass
+
+    def _text_handler(self, handler):
+        def on_line(line):
+            if handler:
+                handler(line.decode('utf-8', 'replace') if isinstance(line, bytes) else line)
+        return on_line
+
+    def _run(self):
+        while True:
+            try:
+                self._run_once()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(POLL_INTERVAL)
+
+    def _next_timeout(self):
+        with self.lock:
+            timeout = None
+            if self.timers:
+                timeout = max(self.timers[0][0] - time.monotonic(), 0)
+            if self.watches and not self.use_pidfd:
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+        return timeout
+
+    def _run_once(self):
+        timeout = self._next_timeout()
+        if self.use_selector:
+            events = self.selector.select(timeout)
+        else:
+            time.sleep(POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL))
+            events = []
+
+        exited = []
+        with self.lock:
+            for key, _ in events:
+                kind, watch, fd = key.data
+                if kind == 'wake':
+                    self._drain_wake_pipe()
+                elif kind == 'pipe':
+                    self._read_pipe(watch, fd)
+                elif kind == 'exit':
+                    exited.append(watch)
+                elif kind == 'reader':
+                    # Hot path (e.g. datagram fan-out): no app context
+                    try:
+                        watch()
+                    except Exception:
+                        traceback.print_exc()
+
+            if not self.use_pidfd:
+                exited.extend(w for w in self.watches.values() if w.process.poll() is not None)
+
+            for watch in exited:
+                self._finish(watch)
+
+        for watch in exited:
+            self.control.put((watch.on_exit, (watch.process, watch.process.returncode)))
+
+        self._run_due_timers()
+
+    def _drain_wake_pipe(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _read_pipe(self, watch, fd):
+        """Read what is available and hand complete lines to the handler, True on EOF"""
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                return False
+            except OSError:
+                chunk = b''
+
+            if not chunk:
+                self._unregister(fd)
+                rest = watch.buffers.pop(fd, b'')
+                if rest:
+                    self._emit_line(watch, fd, rest)
+                return True
+
+            data = watch.buffers.get(fd, b'') + chunk
+            *lines, data = data.split(b'\n')
+            for line in lines:
+                self._emit_line(watch, fd, line)
+            # Never let a line without newline grow without bound
+            if len(data) > MAX_LINE_BYTES:
+                self._emit_line(watch, fd, data)
+                data = b''
+            watch.buffers[fd] = data
+
+    def _emit_line(self, watch, fd, line):
+        handler = watch.line_handlers.get(fd)
+        if handler:
+            try:
+                handler(line.decode('utf-8', 'replace'))
+            except Exception:
+                traceback.print_exc()
+
+    def _unregister(self, fd):
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def _finish(self, watch):
+        """Process has exited: read remaining output, release fds and reap it"""
+        if watch.exited:
+            return
+        watch.exited = True
+        self.watches.pop(watch.process.pid, None)
+
+        if self.use_selector:
+            for fd in list(watch.buffers):
+                self._read_pipe(watch, fd)
+            for fd in watch.line_handlers:
+                self._unregister(fd)
+            if watch.pidfd is not None:
+                self._unregister(watch.pidfd)
+                os.close(watch.pidfd)
+
+            for pipe in (watch.process.stdout, watch.process.stderr):
+                if pipe is not None:
+                    try:
+                        pipe.close()
+                    except OSError:
+                        pass
+        watch.process.wait()
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                _, _, timer = heapq.heappop(self.timers)
+                if timer.cancelled:
+                    continue
+                due.append(timer)
+                if timer.interval:
+                    timer.due = now + timer.interval
+                    heapq.heappush(self.timers, (timer.due, next(self.counter), timer))
+
+        for timer in due:
+            if not timer.interval:
+                self.control.put((timer.callback, timer.args))
+            elif not timer.running:
+                timer.running = True
+                self.workers.submit(self._run_periodic, timer)
+
+    def _run_periodic(self, timer):
+        try:
+            self._dispatch(timer.callback, *timer.args)
+        finally:
+            timer.running = False
+
+    def _run_control(self):
+        while True:
+            callback, args = self.control.get()
+            self._dispatch(callback, *args)
+
+    def _dispatch(self, callback, *args):
+        """Run a callback inside the configured context, never killing the loop"""
+        try:
+            if self.context:
+                with self.context():
+                    callback(*args)
+            else:
+                callback(*args)
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Rendition Cache
+Transcodes a library video once per (content key, bitrate, fps, preset,
+resolution) into a stream-ready H.264/AAC file with a fixed GOP, so encode-mode
+channels can loop it with `-c copy` instead of running libx264 forever.
+Renditions are evicted least-recently-used when the cache exceeds its disk
+budget and dropped when the source file changes. Copies of the same content
+share their renditions. Transcodes run one at a
+time as 'transcode' jobs on the background job queue.
+"""
+
+import os
+import subprocess
+from datetime import datetime
+
+from database import db, get_config, VideoLibrary, VideoRendition
+from job_queue import JobCancelled, JobError
+
+CACHE_DIR = './videos/.renditions'
+DEFAULT_MAX_GB = 20  # Override with the 'rendition_cache_max_gb' configuration
+
+
+class RenditionCache:
+    """Background transcoder plus LRU bookkeeping of VideoRendition rows"""
+
+    def __init__(self, service, cache_dir=CACHE_DIR):
+        self.service = service
+        self.cache_dir = cache_dir
+        service.jobs.register('transcode', self._build, priority=0, max_attempts=2, concurrency=1)
+
+    def profile(self, channel):
+        """Rendition profile of an encode-mode channel (no scaling, source resolution)"""
+        return {
+            'bitrate': channel.bitrate,
+            'fps': int(channel.fps or 30),
+            'preset': channel.preset,
+            'resolution': 'source',
+        }
+
+    def refresh_hash(self, video):
+        """Content key of the source (recomputed when size/mtime changed); drops stale renditions"""
+        stat = os.stat(video.file_path)
+        unchanged = video.hashed_size == stat.st_size and video.hashed_mtime == stat.st_mtime
+        previous_hash = video.file_hash if unchanged else None
+        key = self.service.content.refresh(video)
+        for rendition in list(video.renditions):
+            if rendition.source_hash == key:
+                continue
+            if previous_hash and rendition.source_hash == previous_hash:
+                # Keyed by the full SHA-256 before content keys, same file
+                rendition.source_hash = key
+            else:
+                self._delete(rendition)
+        db.session.commit()
+        return key
+
+    def _source(self, channel):
+        """Library video an encode-mode channel loops, None if it has none"""
+        if channel.encoding_mode == 'copy' or channel.playlist_id or not channel.video_path:
+            return None
+        video = VideoLibrary.query.filter_by(file_path=channel.video_path).first()
+        if not video or not os.path.exists(video.file_path):
+            return None
+        return video
+
+    def _fingerprinted(self, video):
+        """True if the content key still matches the file on disk"""
+        stat = os.stat(video.file_path)
+        return bool(video.fingerprint) and video.hashed_size == stat.st_size and video.hashed_mtime == stat.st_mtime
+
+    def _ready(self, rendition):
+        return (rendition and rendition.status == 'ready' and rendition.file_path
+                and os.path.exists(rendition.file_path))
+
+    def lookup(self, channel):
+        """Path of a ready rendition for the channel, or None (a transcode is queued)"""
+        video = self._source(channel)
+        if not video:
+            return None
+
+        profile = self.profile(channel)
+        if not self._fingerprinted(video):
+            # Fingerprinting may read the whole file on a collision: do it on the worker, stream live meanwhile
+            self.request(video.id, profile)
+            return None
+
+        rendition = VideoRendition.query.filter_by(source_hash=video.fingerprint, **profile).first()
+        if self._ready(rendition):
+            rendition.last_used = datetime.utcnow()
+            db.session.commit()
+            return rendition.file_path
+
+        if not rendition or rendition.status != 'failed':
+            self.request(video.id, profile)
+        return None
+
+    def peek(self, channel):
+        """Path of a ready rendition for the channel, or None, without queueing or touching anything"""
+        video = self._source(channel)
+        if not video or not self._fingerprinted(video):
+            return None
+        rendition = VideoRendition.query.filter_by(source_hash=video.fingerprint, **self.profile(channel)).first()
+        return rendition.file_path if self._ready(rendition) else None
+
+    def request(self, video_id, profile):
+        """Queue a transcode of a library video for a profile (once while queued or running)"""
+        key = ':'.join(str(profile[name]) for name in ('bitrate', 'fps', 'preset', 'resolution'))
+        self.service.jobs.submit('transcode', {'video_id': video_id, 'profile': profile},
+                                 dedupe_key=f'transcode:{video_id}:{key}')
+
+    def _build(self, job):
+        video = VideoLibrary.query.get(job.payload['video_id'])
+        profile = job.payload['profile']
+        if not video or not os.path.exists(video.file_path):
+            return {'skipped': 'video not found'}
+
+        job.update(progress=0, message=f"Hashing {video.title}", force=True)
+        source_hash = self.refresh_hash(video)
+        rendition = VideoRendition.query.filter_by(source_hash=source_hash, **profile).first()
+        if rendition and rendition.status == 'ready' and os.path.exists(rendition.file_path or ''):
+            return {'rendition_id': rendition.id}
+        if not rendition:
+            rendition = VideoRendition(video_id=video.id, source_hash=source_hash, **profile)
+            db.session.add(rendition)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = f"{source_hash[:16]}_{profile['bitrate']}_{profile['fps']}_{profile['preset']}_{profile['resolution']}.mp4"
+        rendition.file_path = os.path.join(self.cache_dir, name)
+        rendition.status = 'transcoding'
+        rendition.error_message = None
+        db.session.commit()
+        job.update(message=f"Transcoding {video.title}", force=True)
+
+        partial = rendition.file_path + '.part'
+        cmd = self.build_transcode_command(video.file_path, partial, profile)
+        process = job.track(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE))
+        self.service.placement.place(process, 'batch')
+        _, stderr = process.communicate()
+
+        if process.returncode != 0:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if job.cancelled():
+                rendition.status = 'pending'
+                db.session.commit()
+                raise JobCancelled()
+            rendition.status = 'failed'
+            rendition.error_message = stderr.decode('utf-8', 'replace').strip()[-500:]
+            db.session.commit()
+            # Same input, same encoder: retrying would fail again
+            raise JobError(f"Rendition for {video.title} failed: {rendition.error_message}")
+
+        os.replace(partial, rendition.file_path)
+        rendition.size_bytes = os.path.getsize(rendition.file_path)
+        rendition.status = 'ready'
+        rendition.last_used = datetime.utcnow()
+        db.session.commit()
+        job.message = f"Rendition ready for {video.title}: {rendition.file_path}"
+        self.evict()
+        return {'rendition_id': rendition.id}
+
+    def build_transcode_command(self, source, output, profile):
+        """One-off encode with a fixed GOP (keyframe every 2s, no scene-cut keyframes)"""
+        bitrate_num = int(profile['bitrate'].replace('k', ''))
+        gop = str(profile['fps'] * 2)
+        cmd = [
+            'ffmpeg', '-y',
+            '-loglevel', 'error',
+            '-nostats',
+            '-i', source,
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c:v', 'libx264',
+            '-preset', profile['preset'],
+            '-b:v', profile['bitrate'],
+            '-maxrate', f'{int(bitrate_num * 1.5)}k',
+            '-bufsize', f'{bitrate_num * 2}k',
+            '-r', str(profile['fps']),
+            '-pix_fmt', 'yuv420p',
+            '-g', gop,
+            '-keyint_min', gop,
+            '-sc_threshold', '0',
+            '-threads', str(self.service.placement.encode_threads()),
+        ]
+        if profile['resolution'] != 'source':
+            width, height = profile['resolution'].split('x')
+            cmd += ['-vf', f'scale={width}:{height}']
+        cmd += [
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            '-ar', '44100',
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            output
+        ]
+        return cmd
+
+    def in_use(self):
+        """Rendition files currently streamed by a channel"""
+        return set(self.service.stream_sources.values())
+
+    def evict(self):
+        """Delete least recently used renditions until the cache fits its disk budget"""
+        budget = float(get_config('rendition_cache_max_gb', DEFAULT_MAX_GB)) * 1024 ** 3
+        ready = VideoRendition.query.filter_by(status='ready').order_by(VideoRendition.last_used.asc()).all()
+        total = sum(r.size_bytes or 0 for r in ready)
+        in_use = self.in_use()
+
+        for rendition in ready:
+            if total <= budget:
+                break
+            if rendition.file_path in in_use:
+                continue
+            total -= rendition.size_bytes or 0
+            self._delete(rendition)
+        db.session.commit()
+
+    def invalidate(self, video):
+        """Drop every rendition of a video (file replaced or deleted), unless a copy still uses them"""
+        sibling = None
+        if video.fingerprint:
+            sibling = VideoLibrary.query.filter(
+                VideoLibrary.fingerprint == video.fingerprint,
+                VideoLibrary.id != video.id
+            ).first()
+        for rendition in list(video.renditions):
+            if sibling:
+                rendition.video = sibling
+            else:
+                self._delete(rendition)
+        video.fingerprint = None
+        video.file_hash = None
+        db.session.commit()
+
+    def _delete(self, rendition):
+        if rendition.file_path and os.path.exists(rendition.file_path):
+            try:
+                os.remove(rendition.file_path)
+            except OSError as e:
+                print(f"Error deleting rendition {rendition.file_path}: {e}")
+        db.session.delete(rendition)
+
+    def get_status(self):
+        renditions = VideoRendition.query.order_by(VideoRendition.last_used.desc()).all()
+        return {
+            'max_gb': float(get_config('rendition_cache_max_gb', DEFAULT_MAX_GB)),
+            'used_mb': round(sum(r.size_bytes or 0 for r in renditions if r.status == 'ready') / (1024 * 1024), 2),
+            'queued': self.service.jobs.count('transcode'),
+            'renditions': [r.to_dict() for r in renditions]
+        }
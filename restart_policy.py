@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Restart Policy
+Exponential backoff with full jitter plus a sliding-window restart budget,
+so crash loops slow down and channels never retry in lockstep
+"""
+
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+
+class RestartPolicy:
+    """Decide when (and whether) a crashed stream is restarted"""
+
+    DEFAULTS = {
+        'base_delay': 2.0,         # First backoff cap in seconds
+        'max_delay': 120.0,        # Backoff cap never exceeds this
+        'budget': 10,              # Restarts allowed per rolling window (0 = never restart)
+        'window_seconds': 600,     # Rolling window size
+        'cooloff_seconds': 900,    # Pause once the budget is spent
+        'stable_seconds': 60,      # Uptime after which the backoff starts over
+    }
+
+    def __init__(self, base_delay=None, max_delay=None, budget=None, window_seconds=None,
+                 cooloff_seconds=None, stable_seconds=None):
+        values = dict(self.DEFAULTS)
+        for key, value in (('base_delay', base_delay), ('max_delay', max_delay), ('budget', budget),
+                           ('window_seconds', window_seconds), ('cooloff_seconds', cooloff_seconds),
+                           ('stable_seconds', stable_seconds)):
+            if value is not None:
+                values[key] = value
+
+        self.base_delay = float(values['base_delay'])
+        self.max_delay = float(values['max_delay'])
+        self.budget = int(values['budget'])
+        self.window_seconds = float(values['window_seconds'])
+        self.cooloff_seconds = float(values['cooloff_seconds'])
+        self.stable_seconds = float(values['stable_seconds'])
+
+        self.attempt = 0  # Consecutive quick crashes
+        self.restarts = deque()  # time.time() of each scheduled restart
+        self.next_retry_at = None
+        self.cooling_off = False
+
+    @classmethod
+    def for_channel(cls, channel):
+        """Build a policy from a StreamChannel's restart_* settings"""
+        return cls(
+            base_delay=getattr(channel, 'restart_base_delay', None),
+            max_delay=getattr(channel, 'restart_max_delay', None),
+            budget=getattr(channel, 'restart_budget', None),
+            window_seconds=getattr(channel, 'restart_window_seconds', None),
+            cooloff_seconds=getattr(channel, 'restart_cooloff_seconds', None),
+        )
+
+    def _prune(self, now):
+        while self.restarts and self.restarts[0] <= now - self.window_seconds:
+            self.restarts.popleft()
+
+    def next_delay(self, uptime_seconds=None, now=None):
+        """Register a crash and return seconds until the restart, or None to give up"""
+        if self.budget <= 0:
+            self.next_retry_at = None
+            return None
+
+        now = time.time() if now is None else now
+        self._prune(now)
+
+        # A stream that ran for a while is not crash-looping: start the backoff over
+        if uptime_seconds is not None and uptime_seconds >= self.stable_seconds:
+            self.attempt = 0
+
+        if len(self.restarts) >= self.budget:
+            # Budget spent: wait out the cool-off, the window has rolled over by then
+            self.cooling_off = True
+            delay = max(self.cooloff_seconds, self.restarts[0] + self.window_seconds - now)
+            self.attempt = 0
+        else:
+            self.cooling_off = False
+            cap = min(self.max_delay, self.base_delay * (2 ** self.attempt))
+            delay = random.uniform(0, cap)  # Full jitter
+            self.attempt += 1
+
+        self.restarts.append(now + delay)
+        self.next_retry_at = now + delay
+        return delay
+
+    def restarted(self):
+        """The scheduled restart has happened"""
+        self.next_retry_at = None
+        self.cooling_off = False
+
+    def to_dict(self, now=None):
+        now = time.time() if now is None else now
+        self._prune(now)
+        next_retry = None
+        if self.next_retry_at is not None:
+            # From the stored epoch time, so it stays the same between calls
+            next_retry = datetime.utcfromtimestamp(self.next_retry_at).isoformat()
+        return {
+            'attempt': self.attempt,
+            'restarts_in_window': len(self.restarts),
+            'budget': self.budget,
+            'window_seconds': self.window_seconds,
+            'cooling_off': self.cooling_off,
+            'next_retry_at': next_retry,
+            'next_retry_in_seconds': round(max(self.next_retry_at - now, 0), 1) if self.next_retry_at else None
+        }
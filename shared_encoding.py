@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Shared Encoding
+Channels that loop the same source with the same encode profile share one
+FFmpeg encoder. The encoder sends MPEG-TS to a local UDP hub, the hub copies
+every datagram to the relay port of each attached channel, so channels can be
+attached and detached while the encoder keeps running.
+"""
+
+import os
+import socket
+import subprocess
+import time
+
+from restart_policy import RestartPolicy
+from stream_telemetry import FFmpegLogRing, FFmpegProgressParser, ProgressSeries
+
+LOCALHOST = '127.0.0.1'
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+def free_udp_port():
+    """Ask the OS for a free local UDP port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def encode_group_key(channel):
+    """(source, encode profile) of an encode-mode channel, None for copy mode"""
+    if channel.encoding_mode == 'copy' or channel.playlist_id or not channel.video_path:
+        return None
+    return (os.path.realpath(channel.video_path), channel.bitrate, int(channel.fps or 30), channel.preset)
+
+
+class UdpFanout:
+    """Copy datagrams arriving on one local port to a changing set of local ports"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_BYTES)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_BYTES)
+        self.sock.bind((LOCALHOST, 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.targets = set()
+        self.packets = 0
+        self.dropped = 0
+
+    def on_readable(self):
+        """Forward everything that is queued (called from the supervisor loop)"""
+        targets = [(LOCALHOST, port) for port in self.targets]
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self.packets += 1
+            for target in targets:
+                try:
+                    self.sock.sendto(data, target)
+                except OSError:
+                    # Receiver not listening yet (restarting relay) or buffer full: drop
+                    self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class SharedEncoderPool:
+    """One encoder per (source, profile) group with attachable per-channel outputs"""
+
+    def __init__(self, service):
+        self.service = service
+        self.groups = {}  # {group_key: group state}
+        self.members = {}  # {channel_id: group_key}
+
+    def plan(self, channels):
+        """Group channels by (source, profile); only groups of 2+ channels are shared"""
+        groups = {}
+        for channel in channels:
+            key = encode_group_key(channel)
+            if key:
+                groups.setdefault(key, []).append(channel.id)
+        return {key: ids for key, ids in groups.items() if len(ids) > 1}
+
+    def attach(self, group_key, channel):
+        """Attach a channel to its group's encoder (started on first attach), returns relay port"""
+        if self.members.get(channel.id) == group_key:
+            return self.groups[group_key]['ports'][channel.id]
+        # Source or profile changed since the last start: leave the old group
+        self.detach(channel.id)
+
+        group = self.groups.get(group_key)
+        if group is None:
+            group = self.groups[group_key] = self._create_group(group_key, channel)
+
+        port = free_udp_port()
+        group['ports'][channel.id] = port
+        group['fanout'].targets.add(port)
+        self.members[channel.id] = group_key
+
+        if group['encoder'] is None and not group['timer']:
+            self._start_encoder(group_key)
+        return port
+
+    def detach(self, channel_id):
+        """Detach a channel; the encoder stops with its last channel"""
+        group_key = self.members.pop(channel_id, None)
+        group = self.groups.get(group_key)
+        if not group:
+            return
+
+        port = group['ports'].pop(channel_id, None)
+        group['fanout'].targets.discard(port)
+        if not group['ports']:
+            self._stop_group(group_key)
+
+    def _create_group(self, group_key, channel):
+        fanout = UdpFanout()
+        self.service.supervisor.add_reader(fanout.sock, fanout.on_readable)
+        return {
+            'key': group_key,
+            'cmd': (
+                self.service.build_input_args(channel)
+                + self.service.build_encoding_args(channel)
+                + ['-map', '0:v:0', '-map', '0:a:0?',
+                   '-f', 'mpegts', f"udp://{LOCALHOST}:{fanout.port}?pkt_size=1316"]
+            ),
+            'encoder': None,
+            'fanout': fanout,
+            'ports': {},  # {channel_id: relay port}
+            'policy': RestartPolicy.for_channel(channel),
+            'timer': None,
+            'started_at': None,
+            'log': FFmpegLogRing(),
+            'progress': ProgressSeries(),
+        }
+
+    def _start_encoder(self, group_key):
+        group = self.groups.get(group_key)
+        if not group or not group['ports']:
+            return
+        group['timer'] = None
+
+        try:
+            process = subprocess.Popen(
+                group['cmd'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                preexec_fn=os.setsid if os.name != 'nt' else None
+            )
+        except Exception as e:
+            self._log_members(group, f"Failed to start shared encoder: {e}", 'ERROR')
+            return
+        self.service.placement.place(process, 'encode')
+
+        group['encoder'] = process
+        group['started_at'] = time.monotonic()
+        group['policy'].restarted()
+        parser = FFmpegProgressParser()
+
+        def on_progress_line(line):
+            sample = parser.feed(line)
+            if sample:
+                group['progress'].append(sample)
+
+        self.service.supervisor.watch(
+            process,
+            on_exit=lambda proc, code: self._on_encoder_exit(group_key, proc, code),
+            on_stdout_line=on_progress_line,
+            on_stderr_line=group['log'].append
+        )
+        self._log_members(group, f"Shared encoder started for {len(group['ports'])} channel(s)", 'INFO')
+
+    def _on_encoder_exit(self, group_key, process, returncode):
+        """Restart the shared encoder with backoff; relays keep waiting on their ports"""
+        group = self.groups.get(group_key)
+        if not group or group['encoder'] is not process:
+            return
+        group['encoder'] = None
+
+        if 'fatal' in group['log'].recent_tags():
+            last_line = group['log'].tail(1)[0]['line'] if group['log'].tail(1) else ''
+            self._log_members(group, f"Shared encoder failed permanently: {last_line}", 'ERROR')
+            for channel_id in list(group['ports']):
+                # stop_stream waits for the relay to exit: not on the control thread
+                self.service.supervisor.run_in_worker(self.service.stop_stream, channel_id)
+            return
+
+        uptime = time.monotonic() - group['started_at'] if group['started_at'] else None
+        delay = group['policy'].next_delay(uptime)
+        if delay is None:
+            self._log_members(group, f"Shared encoder ended with code {returncode}, not restarting", 'ERROR')
+            return
+
+        self._log_members(group, f"Shared encoder ended with code {returncode}, restarting in {delay:.1f}s", 'WARNING')
+        group['timer'] = self.service.supervisor.call_later(delay, self._start_encoder, group_key)
+
+    def _stop_group(self, group_key):
+        group = self.groups.pop(group_key)
+        if group['timer']:
+            group['timer'].cancel()
+        self.service.supervisor.remove_reader(group['fanout'].sock)
+        group['fanout'].close()
+
+        process = group['encoder']
+        group['encoder'] = None
+        if process:
+            try:
+                process.terminate()
+                process.wait(timeout=5)
+            except Exception:
+                process.kill()
+        self.service.placement.rebalance()
+
+    def _log_members(self, group, message, level):
+        for channel_id in list(group['ports']):
+            self.service.add_stream_log(channel_id, message, level)
+
+    def get_group_status(self, channel_id):
+        """Shared encoder state for a channel, None when it encodes on its own"""
+        group = self.groups.get(self.members.get(channel_id))
+        if not group:
+            return None
+        return {
+            'channels': sorted(group['ports']),
+            'encoder_running': group['encoder'] is not None and group['encoder'].poll() is None,
+            'encoder_progress': group['progress'].latest(),
+            'restart': group['policy'].to_dict(),
+            'packets': group['fanout'].packets,
+            'dropped_packets': group['fanout'].dropped,
+        }
@@ -35,33 +35,46 @@ const AppState = {
     },
     
     startAutoUpdates() {
+        // Server pushes changes over SSE, but only those of the worker process holding the
+        // connection: keep a slow poll for the rest, full-rate polling without EventSource
+        if (window.EventSource) {
+            LiveUpdates.connect();
+            this.startPolling(6);
+        } else {
+            this.startPolling(1);
+        }
+    },
+    
+    startPolling(slowdown = 1) {
+        Object.values(this.updateIntervals).forEach(clearInterval);
+        
         // Update dashboard stats every 10 seconds (reduced from 5)
         this.updateIntervals.stats = setInterval(() => {
             if (this.currentSection === 'dashboard') {
                 DashboardModule.updateStats();
             }
-        }, 10000);
+        }, 10000 * slowdown);
         
         // Update channels every 10 seconds (reduced from 3)
         this.updateIntervals.channels = setInterval(() => {
             if (this.currentSection === 'channels') {
                 ChannelsModule.updateChannels();
             }
-        }, 10000);
+        }, 10000 * slowdown);
         
         // Update videos every 30 seconds (reduced from 5)
         this.updateIntervals.videos = setInterval(() => {
             if (this.currentSection === 'videos') {
                 VideosModule.updateVideos();
             }
-        }, 30000);
+        }, 30000 * slowdown);
         
         // Update logs every 10 seconds (reduced from 3)
         this.updateIntervals.logs = setInterval(() => {
             if (this.currentSection === 'logs') {
                 LogsModule.updateLogs();
             }
-        }, 10000);
+        }, 10000 * slowdown);
     },
     
     showSection(section) {
@@ -152,6 +165,56 @@ const AppState = {
     }
 };
 
+// ===================================
+// Live Updates (Server-Sent Events)
+// ===================================
+const LiveUpdates = {
+    source: null,
+    opened: false,
+    pending: {},
+    
+    connect() {
+        this.source = new EventSource('/api/events');
+        
+        // EventSource reconnects by itself; refetch the open section after a reconnect
+        this.source.onopen = () => {
+            if (this.opened) AppState.loadSectionData(AppState.currentSection);
+            this.opened = true;
+        };
+        
+        // Given up (e.g. the server answered with an error): poll at the full rate instead
+        this.source.onerror = () => {
+            if (this.source.readyState === EventSource.CLOSED) {
+                AppState.startPolling(1);
+            }
+        };
+        
+        this.source.addEventListener('stream', () => this.refresh(['dashboard', 'channels', 'stats']));
+        this.source.addEventListener('health', () => this.refresh(['channels']));
+        this.source.addEventListener('channels', () => this.refresh(['dashboard', 'channels']));
+        this.source.addEventListener('videos', () => this.refresh(['dashboard', 'videos']));
+        this.source.addEventListener('resync', () => AppState.loadSectionData(AppState.currentSection));
+        this.source.addEventListener('log', (e) => LogsModule.appendLog(JSON.parse(e.data)));
+        this.source.addEventListener('metrics', (e) => {
+            if (AppState.currentSection === 'dashboard') {
+                DashboardModule.renderSystemMetrics(JSON.parse(e.data));
+            }
+        });
+    },
+    
+    refresh(sections) {
+        // Bursts of events (e.g. stop all) trigger one reload per section
+        const section = AppState.currentSection;
+        if (!sections.includes(section) || this.pending[section]) return;
+        this.pending[section] = setTimeout(() => {
+            delete this.pending[section];
+            if (AppState.currentSection === section) {
+                AppState.loadSectionData(section);
+            }
+        }, 500);
+    }
+};
+
 // ===================================
 // Dashboard Module
 // ===================================
@@ -189,38 +252,40 @@ const DashboardModule = {
     
     updateSystemMetrics() {
         API.get('/system/metrics').then(data => {
-            if (!data.success) return;
-            
-            // Update CPU
-            Utils.updateElement('system-cpu', data.cpu.percent + '%');
-            const cpuBar = document.getElementById('cpu-progress');
-            if (cpuBar) {
-                cpuBar.style.width = data.cpu.percent + '%';
-                cpuBar.className = 'progress-bar ' + this.getProgressClass(data.cpu.percent);
-            }
-            
-            // Update Memory
-            Utils.updateElement('system-memory', data.memory.percent + '%');
-            Utils.updateElement('system-memory-detail', 
-                `${data.memory.used_gb}GB / ${data.memory.total_gb}GB`);
-            const memBar = document.getElementById('memory-progress');
-            if (memBar) {
-                memBar.style.width = data.memory.percent + '%';
-                memBar.className = 'progress-bar ' + this.getProgressClass(data.memory.percent);
-            }
-            
-            // Update Disk
-            Utils.updateElement('system-disk', data.disk.percent + '%');
-            Utils.updateElement('system-disk-detail', 
-                `${data.disk.used_gb}GB / ${data.disk.total_gb}GB`);
-            const diskBar = document.getElementById('disk-progress');
-            if (diskBar) {
-                diskBar.style.width = data.disk.percent + '%';
-                diskBar.className = 'progress-bar ' + this.getProgressClass(data.disk.percent);
-            }
+            if (data.success) this.renderSystemMetrics(data);
         });
     },
     
+    renderSystemMetrics(data) {
+        // Update CPU
+        Utils.updateElement('system-cpu', data.cpu.percent + '%');
+        const cpuBar = document.getElementById('cpu-progress');
+        if (cpuBar) {
+            cpuBar.style.width = data.cpu.percent + '%';
+            cpuBar.className = 'progress-bar ' + this.getProgressClass(data.cpu.percent);
+        }
+        
+        // Update Memory
+        Utils.updateElement('system-memory', data.memory.percent + '%');
+        Utils.updateElement('system-memory-detail', 
+            `${data.memory.used_gb}GB / ${data.memory.total_gb}GB`);
+        const memBar = document.getElementById('memory-progress');
+        if (memBar) {
+            memBar.style.width = data.memory.percent + '%';
+            memBar.className = 'progress-bar ' + this.getProgressClass(data.memory.percent);
+        }
+        
+        // Update Disk
+        Utils.updateElement('system-disk', data.disk.percent + '%');
+        Utils.updateElement('system-disk-detail', 
+            `${data.disk.used_gb}GB / ${data.disk.total_gb}GB`);
+        const diskBar = document.getElementById('disk-progress');
+        if (diskBar) {
+            diskBar.style.width = data.disk.percent + '%';
+            diskBar.className = 'progress-bar ' + this.getProgressClass(data.disk.percent);
+        }
+    },
+    
     getProgressClass(percent) {
         if (percent < 50) return 'progress-success';
         if (percent < 75) return 'progress-warning';
@@ -320,6 +385,12 @@ const ChannelsModule = {
             container.innerHTML = channelsData.channels.map(channel => {
                 const channelStatus = statusData.channels?.find(c => c.id === channel.id);
                 const isRunning = channelStatus ? channelStatus.running : false;
+                const restart = channelStatus?.restart;
+                const restartRow = restart && restart.pending ? `
+                        <div class="info-row">
+                            <span class="info-label">Restart:</span>
+                            <span class="info-value">${restart.cooling_off ? '🧊 Cooling off' : '🔁 Retrying'} in ${Math.max(0, Math.round((Date.parse(restart.next_retry_at + 'Z') - Date.now()) / 1000))}s</span>
+                        </div>` : '';
                 
                 return `
                     <div class="card" style="margin-bottom: 15px;">
@@ -336,7 +407,7 @@ const ChannelsModule = {
                         <div class="info-row">
                             <span class="info-label">Video:</span>
                             <span class="info-value">${channelStatus?.video_exists ? '✅ Ready' : '❌ Missing'}</span>
-                        </div>
+                        </div>${restartRow}
                         <div style="margin-top: 15px;">
                             <button class="btn btn-success btn-sm" onclick="ChannelsModule.startChannel(${channel.id})" ${isRunning ? 'disabled' : ''}>
                                 ▶️ Start
@@ -475,51 +546,91 @@ const VideosModule = {
             return;
         }
         
-        if (file.size > 2 * 1024 * 1024 * 1024) {
-            alert('❌ File too large! Maximum 2GB');
-            return;
-        }
-        
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('title', title);
-        
         document.getElementById('upload-progress').style.display = 'block';
         document.getElementById('upload-btn').disabled = true;
         
-        const xhr = new XMLHttpRequest();
-        
-        xhr.upload.addEventListener('progress', (e) => {
-            if (e.lengthComputable) {
-                const percentComplete = Math.round((e.loaded / e.total) * 100);
-                const progressBar = document.getElementById('upload-progress-bar');
-                progressBar.style.width = percentComplete + '%';
-                progressBar.textContent = percentComplete + '%';
-                document.getElementById('upload-status').textContent = 
-                    `Uploading... ${(e.loaded / 1024 / 1024).toFixed(2)} MB / ${(e.total / 1024 / 1024).toFixed(2)} MB`;
-            }
-        });
-        
-        xhr.addEventListener('load', () => {
-            if (xhr.status === 200) {
-                const response = JSON.parse(xhr.responseText);
-                alert('✅ ' + response.message);
+        this.uploadChunked(file, title).then(data => {
+            if (data.success) {
+                alert('✅ ' + data.message);
                 this.hideUploadModal();
                 this.updateVideos();
             } else {
-                const response = JSON.parse(xhr.responseText);
-                alert('❌ ' + (response.message || 'Upload failed'));
+                alert('❌ ' + (data.message || 'Upload failed'));
             }
+        }).catch(error => {
+            alert('❌ Upload error! ' + error.message + ' (upload again to resume)');
+        }).finally(() => {
             document.getElementById('upload-btn').disabled = false;
         });
+    },
+    
+    async uploadChunked(file, title) {
+        // Resumable upload: the server remembers how many bytes it has, so a
+        // dropped connection (or a reload and the same file again) continues there
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = null;
+        let chunkSize = 8 * 1024 * 1024;
+        const saved = localStorage.getItem(resumeKey);
+        if (saved) {
+            const data = await API.get(`/videos/uploads/${saved}`);
+            if (data.success && data.upload.status === 'uploading') upload = data.upload;
+        }
+        if (!upload) {
+            const data = await API.post('/videos/uploads', {filename: file.name, size: file.size, title: title});
+            if (!data.success) return data;
+            upload = data.upload;
+            chunkSize = data.chunk_size || chunkSize;
+            localStorage.setItem(resumeKey, upload.upload_id);
+        }
         
-        xhr.addEventListener('error', () => {
-            alert('❌ Upload error!');
-            document.getElementById('upload-btn').disabled = false;
-        });
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            try {
+                offset = await this.putChunk(upload.upload_id, file, offset, Math.min(offset + chunkSize, file.size));
+                failures = 0;
+            } catch (error) {
+                if (++failures > 5) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+                // Ask where to continue: part of the failed chunk may have arrived
+                const data = await API.get(`/videos/uploads/${upload.upload_id}`);
+                if (data.success) offset = data.upload.offset;
+            }
+        }
         
-        xhr.open('POST', '/api/videos/upload');
-        xhr.send(formData);
+        document.getElementById('upload-status').textContent = 'Finishing upload...';
+        const data = await API.post(`/videos/uploads/${upload.upload_id}/complete`);
+        if (data.success || data.offset == null) localStorage.removeItem(resumeKey);
+        return data;
+    },
+    
+    putChunk(uploadId, file, start, end) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.upload.addEventListener('progress', (e) => {
+                const loaded = start + e.loaded;
+                const percentComplete = Math.round((loaded / file.size) * 100);
+                const progressBar = document.getElementById('upload-progress-bar');
+                progressBar.style.width = percentComplete + '%';
+                progressBar.textContent = percentComplete + '%';
+                document.getElementById('upload-status').textContent = 
+                    `Uploading... ${(loaded / 1024 / 1024).toFixed(2)} MB / ${(file.size / 1024 / 1024).toFixed(2)} MB`;
+            });
+            xhr.addEventListener('load', () => {
+                const response = JSON.parse(xhr.responseText || '{}');
+                if (xhr.status === 200) {
+                    resolve(response.upload.offset);
+                } else if (response.offset != null && response.offset !== start) {
+                    resolve(response.offset);  // server expects another offset: continue there
+                } else {
+                    reject(new Error(response.message || `HTTP ${xhr.status}`));
+                }
+            });
+            xhr.addEventListener('error', () => reject(new Error('Network error')));
+            xhr.open('PUT', `/api/videos/uploads/${uploadId}?offset=${start}`);
+            xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+            xhr.send(file.slice(start, end));
+        });
     },
     
     downloadFromGDrive(e) {
@@ -542,8 +653,8 @@ const VideosModule = {
         if (confirm('Scan ./videos folder for unregistered videos?')) {
             API.post('/videos/scan').then(data => {
                 if (data.success) {
-                    alert(`✅ ${data.message}\n\nFound: ${data.found} videos\nAdded: ${data.added} new videos`);
-                    this.updateVideos();
+                    Utils.showNotification('Scanning videos...', 'info');
+                    this.waitForScan(data.job_id);
                 } else {
                     alert('❌ ' + data.message);
                 }
@@ -551,6 +662,24 @@ const VideosModule = {
         }
     },
     
+    waitForScan(jobId) {
+        // New files are probed by a background job; poll it until it finishes
+        API.get(`/videos/scan/${jobId}`).then(data => {
+            const job = data.job;
+            if (!job) return;
+            if (job.status === 'queued' || job.status === 'running') {
+                setTimeout(() => this.waitForScan(jobId), 1000);
+                return;
+            }
+            if (job.status === 'done') {
+                alert(`✅ Scan selesai\n\nFound: ${job.result.found} videos\nAdded: ${job.result.added} new videos`);
+            } else {
+                alert('❌ ' + job.message);
+            }
+            this.updateVideos();
+        });
+    },
+    
     deleteVideo(id) {
         if (confirm('Delete this video? This action cannot be undone!')) {
             API.delete(`/videos/${id}`).then(data => {
@@ -576,6 +705,27 @@ const LogsModule = {
             
             container.scrollTop = container.scrollHeight;
         });
+    },
+    
+    appendLog(log) {
+        // Only system-wide lines are shown here, per-channel logs live on the channel
+        const container = document.getElementById('log-container');
+        if (!container || log.channel_id != null || !log.message) return;
+        
+        // Same "[YYYY-MM-DD HH:MM:SS] message" form as /api/logs (timestamp: epoch seconds)
+        const d = new Date(log.timestamp * 1000);
+        const pad = (n) => String(n).padStart(2, '0');
+        const time = `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ` +
+            `${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+        
+        const entry = document.createElement('div');
+        entry.className = 'log-entry';
+        entry.textContent = `[${time}] ${log.message}`;
+        container.appendChild(entry);
+        while (container.children.length > 100) {
+            container.removeChild(container.firstChild);
+        }
+        container.scrollTop = container.scrollHeight;
     }
 };
 
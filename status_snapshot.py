@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Status Snapshot
+Prebuilt `/api/status` payload. Channel rows (with parsed schedules and
+timezones) are reloaded only after channel CRUD, video file stats come from a
+background stat loop, and the stream state is refreshed on stream events or
+after MAX_AGE seconds. Requests serialize nothing: they get the cached JSON
+body and its ETag. Only state that changes on its own events goes in it, so
+the ETag holds between them; clocks, progress and countdowns move every
+second and are served uncached by `/api/status/live`.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+from database import StreamChannel
+
+MAX_AGE = 5  # seconds before schedules and stream state are refreshed
+STAT_INTERVAL = 30  # seconds between video file stat passes
+
+
+def _parse_time(value):
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def _without(state, keys):
+    return {k: v for k, v in state.items() if k not in keys} if state else state
+
+
+class StatusSnapshot:
+    """Cached status payload for every enabled channel"""
+
+    def __init__(self, service):
+        self.service = service
+        self.lock = threading.Lock()
+        self.channels = None  # [static channel dict], None = reload from the DB
+        self.file_stats = {}  # {video_path: (exists, size_mb)}
+        self.body = None
+        self.etag = None
+        self.data = None
+        self.built_at = 0
+        self.dirty = True
+        self.timer = None
+
+    def start(self):
+        """Invalidate on events and keep file stats fresh from a supervisor timer"""
+        self.service.events.add_listener(self.on_event)
+        if not self.timer:
+            self.timer = self.service.supervisor.call_every(STAT_INTERVAL, self.refresh_file_stats)
+
+    def on_event(self, event):
+        if event['type'] in ('channels', 'videos'):
+            self.channels = None
+        if event['type'] in ('channels', 'videos', 'stream'):
+            self.dirty = True
+
+    def _load_channels(self):
+        channels = []
+        for channel in StreamChannel.query.filter_by(enabled=True).all():
+            try:
+                start, end = _parse_time(channel.start_time), _parse_time(channel.end_time)
+            except (TypeError, ValueError):
+                start = end = None
+            channels.append({
+                'id': channel.id,
+                'name': channel.name,
+                'video_path': channel.video_path,
+                'tz': pytz.timezone(channel.timezone),
+                'start_date': channel.start_date,
+                'end_date': channel.end_date,
+                'start': start,
+                'end': end,
+                'schedule': f"{channel.start_time} - {channel.end_time}",
+            })
+        return channels
+
+    def refresh_file_stats(self):
+        """Stat every channel video once (the only filesystem access of the status path)"""
+        channels = self.channels if self.channels is not None else self._load_channels()
+        stats = {}
+        for channel in channels:
+            path = channel['video_path']
+            if path and path not in stats:
+                try:
+                    stats[path] = (True, os.path.getsize(path) / (1024 * 1024))
+                except OSError:
+                    stats[path] = (False, 0)
+        if stats != self.file_stats:
+            self.file_stats = stats
+            self.dirty = True
+
+    def _is_streaming_time(self, channel, now):
+        """Same rules as StreamManager.is_streaming_time, on pre-parsed values"""
+        current_date, current_time = now.date(), now.time()
+        if channel['start_date'] and current_date < channel['start_date']:
+            return False
+        if channel['end_date'] and current_date > channel['end_date']:
+            return False
+        start, end = channel['start'], channel['end']
+        if start is None:
+            return False
+        if start <= end:
+            return start <= current_time <= end
+        return current_time >= start or current_time <= end
+
+    def _build(self):
+        if self.channels is None:
+            self.channels = self._load_channels()
+            self.refresh_file_stats()
+
+        service = self.service
+        statuses = []
+        for channel in self.channels:
+            channel_id = channel['id']
+            exists, size_mb = self.file_stats.get(channel['video_path'], (False, 0))
+            shared = _without(service.shared_encoders.get_group_status(channel_id),
+                              ('encoder_progress', 'packets', 'dropped_packets'))
+            if shared:
+                shared['restart'] = _without(shared['restart'], ('next_retry_in_seconds',))
+            statuses.append({
+                "id": channel_id,
+                "name": channel['name'],
+                "running": service.is_stream_active(channel_id),
+                "video_exists": exists,
+                "video_size_mb": round(size_mb, 2),
+                "is_streaming_time": self._is_streaming_time(channel, datetime.now(channel['tz'])),
+                "schedule": channel['schedule'],
+                "restart": _without(service.get_restart_state(channel_id), ('next_retry_in_seconds',)),
+                "playlist": service.get_playlist_state(channel_id),
+                "admission": service.admission.get_state(channel_id),
+                "shared_encoder": shared
+            })
+
+        return {
+            "channels": statuses,
+            "total_running": len(service.active_streams),
+            "total_channels": len(self.channels)
+        }
+
+    def live(self):
+        """Channel clocks, progress and countdowns: built per request, never cached"""
+        with self.lock:
+            if self.channels is None:
+                self.channels = self._load_channels()
+            channels = self.channels
+        service = self.service
+        statuses = []
+        for channel in channels:
+            channel_id = channel['id']
+            progress = service.get_stream_progress(channel_id, 30) if service.is_stream_active(channel_id) else None
+            restart = service.get_restart_state(channel_id)
+            shared = service.shared_encoders.get_group_status(channel_id)
+            statuses.append({
+                "id": channel_id,
+                "current_time": datetime.now(channel['tz']).strftime('%H:%M:%S'),
+                "progress": progress['latest'] if progress else None,
+                "speed": progress['summary']['speed'] if progress and progress['summary'] else None,
+                "next_retry_in_seconds": restart['next_retry_in_seconds'] if restart else None,
+                "shared_encoder": {
+                    'encoder_progress': shared['encoder_progress'],
+                    'packets': shared['packets'],
+                    'dropped_packets': shared['dropped_packets'],
+                } if shared else None
+            })
+        return {"channels": statuses}
+
+    def get(self):
+        """(data, JSON body, ETag), rebuilt when invalidated or older than MAX_AGE; ETag changes with the body"""
+        with self.lock:
+            if self.dirty or self.body is None or time.monotonic() - self.built_at >= MAX_AGE:
+                self.dirty = False
+                self.built_at = time.monotonic()
+                data = self._build()
+                body = json.dumps(data, sort_keys=True, default=str)
+                if body != self.body:
+                    self.data, self.body = data, body
+                    self.etag = hashlib.sha1(body.encode()).hexdigest()
+            return self.data, self.body, self.etag
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+FFmpeg Stream Telemetry
+Parses the machine-readable `-progress` output of FFmpeg into a bounded
+in-memory time series per channel, and drains/classifies FFmpeg stderr
+"""
+
+import threading
+import time
+from collections import deque
+
+# Keys FFmpeg writes in a -progress block; every block ends with "progress=..."
+PROGRESS_INT_FIELDS = ('frame', 'dup_frames', 'drop_frames', 'total_size', 'out_time_us')
+
+
+def _parse_float(value, suffix=''):
+    """Parse '1.02x' / '2500.1kbits/s' style values, N/A -> None"""
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FFmpegProgressParser:
+    """Accumulate `-progress` key=value lines into one sample per block"""
+
+    def __init__(self):
+        self._block = {}
+
+    def feed(self, line):
+        """Feed one line, returns a sample dict when a block is complete"""
+        line = line.strip()
+        if '=' not in line:
+            return None
+
+        key, _, value = line.partition('=')
+        self._block[key.strip()] = value.strip()
+
+        if key != 'progress':
+            return None
+
+        block, self._block = self._block, {}
+        return self._build_sample(block)
+
+    def _build_sample(self, block):
+        sample = {
+            'timestamp': time.time(),
+            'fps': _parse_float(block.get('fps')),
+            'bitrate_kbps': _parse_float(block.get('bitrate'), 'kbits/s'),
+            'speed': _parse_float(block.get('speed'), 'x'),
+            'out_time': block.get('out_time'),
+            'progress': block.get('progress'),
+        }
+        for field in PROGRESS_INT_FIELDS:
+            sample[field] = _parse_int(block.get(field))
+
+        # Older FFmpeg builds only write out_time_ms (which is in microseconds too)
+        if sample['out_time_us'] is None:
+            sample['out_time_us'] = _parse_int(block.get('out_time_ms'))
+        sample['out_time_seconds'] = (
+            sample['out_time_us'] / 1000000.0 if sample['out_time_us'] is not None else None
+        )
+        return sample
+
+
+class ProgressSeries:
+    """Bounded time series of progress samples for one channel"""
+
+    def __init__(self, max_samples=600):
+        self.samples = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+
+    def append(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    def latest(self):
+        with self.lock:
+            return dict(self.samples[-1]) if self.samples else None
+
+    def window(self, seconds=None):
+        """Samples from the last `seconds` seconds (all samples if None)"""
+        with self.lock:
+            samples = list(self.samples)
+        if seconds is None:
+            return samples
+        cutoff = time.time() - seconds
+        return [s for s in samples if s['timestamp'] >= cutoff]
+
+    def summary(self, seconds=60):
+        """Average fps/bitrate/speed and dropped frames over a window"""
+        samples = self.window(seconds)
+        if not samples:
+            return None
+
+        def average(key):
+            values = [s[key] for s in samples if s.get(key) is not None]
+            return round(sum(values) / len(values), 2) if values else None
+
+        first, last = samples[0], samples[-1]
+        drop_delta = None
+        if first.get('drop_frames') is not None and last.get('drop_frames') is not None:
+            # Counter resets when FFmpeg is restarted inside the window
+            drop_delta = max(last['drop_frames'] - first['drop_frames'], 0)
+
+        return {
+            'window_seconds': seconds,
+            'samples': len(samples),
+            'fps': average('fps'),
+            'bitrate_kbps': average('bitrate_kbps'),
+            'speed': average('speed'),
+            'min_speed': min((s['speed'] for s in samples if s.get('speed') is not None), default=None),
+            'drop_frames': last.get('drop_frames'),
+            'dup_frames': last.get('dup_frames'),
+            'dropped_in_window': drop_delta,
+        }
+
+
+# Stderr classification: tag -> substrings (matched case-insensitively).
+# 'fatal' lines describe problems a restart cannot fix (bad input path, bad options).
+FFMPEG_LINE_PATTERNS = (
+    ('fatal', (
+        'no such file or directory',
+        'invalid data found when processing input',
+        'moov atom not found',
+        'unknown encoder',
+        'unrecognized option',
+        'option not found',
+        'permission denied',
+        'error while opening encoder',
+    )),
+    ('network', (
+        'connection refused',
+        'connection reset',
+        'connection timed out',
+        'broken pipe',
+        'network is unreachable',
+        'failed to resolve hostname',
+        'i/o error',
+        'rtmp',
+        'tcp @',
+        'server returned',
+    )),
+    ('input', (
+        'error while decoding',
+        'corrupt',
+        'decode_slice_header',
+        'could not find codec parameters',
+        'non-monotonous dts',
+        'non-monotonic dts',
+        'invalid nal unit',
+        'missing picture',
+    )),
+    ('encoder', (
+        'libx264',
+        'x264 [',
+        'aac @',
+        'past duration too large',
+        'too many packets buffered',
+        'error initializing output stream',
+        'could not write header',
+        'queue input is backward in time',
+    )),
+)
+
+
+def classify_ffmpeg_line(line):
+    """Tag an FFmpeg stderr line as fatal, network, input or encoder (None if unknown)"""
+    lowered = line.lower()
+    for tag, patterns in FFMPEG_LINE_PATTERNS:
+        if any(p in lowered for p in patterns):
+            return tag
+    return None
+
+
+class FFmpegLogRing:
+    """Bounded ring of recent FFmpeg stderr lines with classification tags"""
+
+    def __init__(self, max_lines=200):
+        self.lines = deque(maxlen=max_lines)
+        self.tag_counts = {}
+        self.lock = threading.Lock()
+
+    def append(self, line):
+        line = line.rstrip()
+        if not line:
+            return None
+        tag = classify_ffmpeg_line(line)
+        entry = {
+            'timestamp': time.time(),
+            'line': line,
+            'tag': tag
+        }
+        with self.lock:
+            self.lines.append(entry)
+            if tag:
+                self.tag_counts[tag] = self.tag_counts.get(tag, 0) + 1
+        return entry
+
+    def tail(self, count=None):
+        with self.lock:
+            lines = list(self.lines)
+        return lines[-count:] if count else lines
+
+    def recent_tags(self, count=20):
+        """Set of tags among the last `count` lines (FFmpeg logs the cause just before exiting)"""
+        return {entry['tag'] for entry in self.tail(count) if entry['tag']}
+
+
+def drain_lines(pipe, on_line):
+    """Read a text pipe line by line until EOF so the child never blocks on a full pipe"""
+    try:
+        for line in pipe:
+            on_line(line)
+    except (ValueError, OSError):
+        # Pipe closed while the process was being stopped
+        pass
+
+
+def start_drain_thread(pipe, on_line):
+    """Drain a pipe on a daemon thread"""
+    thread = threading.Thread(target=drain_lines, args=(pipe, on_line), daemon=True)
+    thread.start()
+    return thread
@@ -5,23 +5,98 @@ Based on Node.js streaming service
 """
 
 import subprocess
-import threading
-import time
 import os
 import signal
+import threading
+import time
 from datetime import datetime
-from database import db, StreamChannel, StreamSession, StreamLog, VideoLibrary
+from database import db, StreamChannel, StreamSession, VideoLibrary
+from stream_telemetry import FFmpegProgressParser, ProgressSeries, FFmpegLogRing
+from process_supervisor import ProcessSupervisor
+from restart_policy import RestartPolicy
+from shared_encoding import SharedEncoderPool
+from rendition_cache import RenditionCache
+from playlist_stream import PlaylistFeeder, playlist_input_args
+from admission_control import AdmissionController
+from log_sink import log_sink
+from event_bus import EventBus
+from cpu_placement import CpuPlacer, process_kind
+from status_snapshot import StatusSnapshot
+from process_sampler import ProcessSampler
+from health_rollup import HealthRollup
+from daily_stats import DailyStats
+from job_queue import JobQueue
+from content_index import ContentIndex
 
 class StreamingService:
     def __init__(self):
         self.active_streams = {}  # {channel_id: process}
         self.running_channels = {}  # {channel_id: session_id}
         self.stream_logs = {}  # {channel_id: [logs]}
-        self.stream_retry_count = {}  # {channel_id: retry_count}
+        self.restart_policies = {}  # {channel_id: RestartPolicy}
+        self.stream_started_at = {}  # {channel_id: time.monotonic() of current process}
         self.manually_stopping = set()  # Set of channel_ids being manually stopped
-        self.MAX_RETRY_ATTEMPTS = 3
+        self.start_lock = threading.RLock()  # One start_stream at a time
         self.MAX_LOG_LINES = 100
-        self.monitor_threads = {}  # {channel_id: thread}
+        self.pending_restarts = {}  # {channel_id: supervisor timer}
+        self.stream_progress = {}  # {channel_id: ProgressSeries}
+        self.MAX_PROGRESS_SAMPLES = 600
+        self.ffmpeg_logs = {}  # {channel_id: FFmpegLogRing}
+        self.MAX_FFMPEG_LOG_LINES = 200
+        
+        # Stream lifecycle, log and health events for live dashboards (SSE)
+        self.events = EventBus()
+        
+        # One loop supervises every FFmpeg child (exit, pipes); timers run off the loop
+        self.supervisor = ProcessSupervisor()
+        self.app = None
+        
+        # Persistent background jobs (probes, downloads, transcodes, thumbnails)
+        self.jobs = JobQueue(self)
+        
+        # Library videos keyed by content: duplicates, shared renditions and thumbnails
+        self.content = ContentIndex(self)
+        
+        # Channels looping the same source with the same profile share one encoder
+        self.shared_encoders = SharedEncoderPool(self)
+        
+        # Pre-transcoded renditions let encode-mode channels stream with -c copy
+        self.renditions = RenditionCache(self)
+        self.stream_sources = {}  # {channel_id: rendition file being streamed}
+        
+        # Playlist channels feed one FFmpeg item by item through its stdin
+        self.playlist_feeders = {}  # {channel_id: PlaylistFeeder}
+        
+        # Starts are admitted against a host CPU budget, possibly with a cheaper profile
+        self.admission = AdmissionController(self)
+        self.encode_overrides = {}  # {channel_id: {'preset': ...} or {'encoding_mode': 'copy'}}
+        
+        # Thread counts, CPU affinity and niceness of every FFmpeg child
+        self.placement = CpuPlacer()
+        
+        # Prebuilt /api/status payload, invalidated by stream and channel events
+        self.status = StatusSnapshot(self)
+        
+        # CPU, memory, I/O and context switches of every FFmpeg process tree
+        self.resources = ProcessSampler(self)
+        
+        # Downsampling and retention of the StreamHealth time series
+        self.health_rollups = HealthRollup(self.supervisor)
+        
+        # Daily session counters, updated on session start/end
+        self.daily_stats = DailyStats(self.supervisor)
+    
+    def init_app(self, app):
+        """Run supervisor callbacks inside the Flask app context"""
+        self.app = app
+        self.supervisor.context = app.app_context
+        self.admission.start()
+        self.status.start()
+        self.resources.start()
+        self.health_rollups.start()
+        self.daily_stats.start()
+        self.jobs.start()
+        self.content.start()
         
     def add_stream_log(self, channel_id, message, level='INFO'):
         """Add log entry for stream"""
@@ -40,54 +115,58 @@ class StreamingService:
         if len(self.stream_logs[channel_id]) > self.MAX_LOG_LINES:
             self.stream_logs[channel_id].pop(0)
         
-        # Also save to database
-        try:
-            session_id = self.running_channels.get(channel_id)
-            log = StreamLog(
-                timestamp=datetime.utcnow(),
-                level=level,
-                message=message,
-                session_id=session_id
-            )
-            db.session.add(log)
-            db.session.commit()
-        except Exception as e:
-            print(f"Error saving log to DB: {e}")
+        # Also save to database (batched by the background log sink)
+        log_sink.write(message, level, self.running_channels.get(channel_id))
+        # The event carries its own timestamp: same payload as StreamManager.add_log
+        self.events.publish('log', {'channel_id': channel_id, 'message': message, 'level': level})
     
-    def build_ffmpeg_command(self, channel):
-        """Build FFmpeg command with reconnection parameters"""
-        rtmp_url = channel.rtmp_url + channel.stream_key
-        
-        # Base command with reconnection logic
-        base_args = [
+    def publish_stream_event(self, channel_id, state, **details):
+        """Announce a lifecycle change (started, stopped, restarting, failed, queued)"""
+        self.events.publish('stream', dict(details, channel_id=channel_id, state=state))
+    
+    def build_input_args(self, channel, video_path=None):
+        """FFmpeg global/input arguments: realtime, looped source with progress telemetry"""
+        return [
             'ffmpeg',
-            '-loglevel', 'error',
+            '-loglevel', 'warning',
+            '-nostats',
+            '-progress', 'pipe:1',  # key=value telemetry on stdout
             '-re',
             '-stream_loop', '-1',
-            '-i', channel.video_path,
+            '-i', video_path or channel.video_path,
         ]
-        
-        # Encoding settings
-        if channel.encoding_mode == 'copy':
-            encoding_args = [
+    
+    def build_encoding_args(self, channel):
+        """FFmpeg codec arguments for the channel's encoding mode (after admission downgrades)"""
+        overrides = self.encode_overrides.get(channel.id, {})
+        if overrides.get('encoding_mode', channel.encoding_mode) == 'copy':
+            return [
                 '-c:v', 'copy',
                 '-c:a', 'copy',
             ]
-        else:
-            bitrate_num = int(channel.bitrate.replace('k', ''))
-            encoding_args = [
-                '-c:v', 'libx264',
-                '-preset', channel.preset,
-                '-b:v', channel.bitrate,
-                '-maxrate', f'{int(bitrate_num * 1.5)}k',
-                '-bufsize', f'{bitrate_num * 2}k',
-                '-r', str(channel.fps),
-                '-pix_fmt', 'yuv420p',
-                '-g', str(channel.fps * 2),
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-            ]
+        
+        bitrate_num = int(channel.bitrate.replace('k', ''))
+        threads = ['-threads', str(self.placement.encode_threads())] if self.placement.enabled() else []
+        return [
+            '-c:v', 'libx264',
+            '-preset', overrides.get('preset', channel.preset),
+            '-b:v', channel.bitrate,
+            '-maxrate', f'{int(bitrate_num * 1.5)}k',
+            '-bufsize', f'{bitrate_num * 2}k',
+            '-r', str(channel.fps),
+            '-pix_fmt', 'yuv420p',
+            '-g', str(channel.fps * 2),
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            '-ar', '44100',
+        ] + threads
+    
+    def build_ffmpeg_command(self, channel):
+        """Build FFmpeg command with reconnection parameters"""
+        rtmp_url = channel.rtmp_url + channel.stream_key
+        
+        base_args = self.build_input_args(channel)
+        encoding_args = self.build_encoding_args(channel)
         
         # Output settings with reconnection
         output_args = [
@@ -100,74 +179,237 @@ class StreamingService:
         
         return base_args + encoding_args + output_args
     
-    def monitor_stream(self, channel_id, process):
-        """Monitor stream process and handle errors"""
-        channel = StreamChannel.query.get(channel_id)
+    def build_relay_command(self, port, rtmp_url):
+        """Copy-mode relay from a local UDP MPEG-TS feed to one RTMP ingest"""
+        return [
+            'ffmpeg',
+            '-loglevel', 'warning',
+            '-nostats',
+            '-progress', 'pipe:1',
+            '-f', 'mpegts',
+            '-i', f"udp://127.0.0.1:{port}?fifo_size=1000000&overrun_nonfatal=1",
+            '-c', 'copy',
+            '-f', 'flv',
+            rtmp_url
+        ]
+    
+    def get_video_id(self, video_path):
+        """Library id of a video file, None if it is not in the library"""
+        if not video_path:
+            return None
+        video = VideoLibrary.query.with_entities(VideoLibrary.id).filter_by(file_path=video_path).first()
+        return video.id if video else None
+    
+    def plan_encode_groups(self):
+        """{group_key: [channel_id, ...]} for enabled channels that can share an encoder"""
+        channels = StreamChannel.query.filter_by(enabled=True).all()
+        return self.shared_encoders.plan(channels)
+    
+    def get_shared_group_key(self, channel):
+        """Group key if another enabled channel encodes the same source the same way"""
+        for key, channel_ids in self.plan_encode_groups().items():
+            if channel.id in channel_ids:
+                return key
+        return None
+    
+    def build_rendition_command(self, channel, rendition_path):
+        """Loop a pre-transcoded rendition in copy mode"""
+        return (
+            self.build_input_args(channel, rendition_path)
+            + ['-c:v', 'copy', '-c:a', 'copy']
+            + ['-f', 'flv', channel.rtmp_url + channel.stream_key]
+        )
+    
+    def build_playlist_command(self, channel):
+        """One FFmpeg reading the channel's playlist feed from its stdin"""
+        return playlist_input_args() + self.build_encoding_args(channel) + [
+            '-f', 'flv',
+            '-reconnect', '1',
+            '-reconnect_streamed', '1',
+            '-reconnect_delay_max', '5',
+            channel.rtmp_url + channel.stream_key
+        ]
+    
+    def build_channel_command(self, channel):
+        """Cheapest way to run the channel: cached rendition, shared encoder, own encode"""
+        if channel.playlist_id:
+            # A restart may take another path than the last start: leave a shared encoder first
+            self.shared_encoders.detach(channel.id)
+            feeder = self.playlist_feeders.get(channel.id)
+            if not feeder or feeder.playlist_id != channel.playlist_id:
+                feeder = self.playlist_feeders[channel.id] = PlaylistFeeder(channel.id, channel.playlist_id)
+            if not feeder.begin():
+                raise ValueError("Playlist has no playable videos")
+            return self.build_playlist_command(channel)
         
-        while True:
-            # Check if process is still running
-            poll = process.poll()
-            
-            if poll is not None:
-                # Process ended
-                print(f"[StreamingService] Stream {channel_id} ended with code {poll}")
-                self.add_stream_log(channel_id, f"Stream ended with code {poll}", 'WARNING')
-                
-                # Check if manually stopped
-                if channel_id in self.manually_stopping:
-                    self.add_stream_log(channel_id, "Stream was manually stopped", 'INFO')
-                    self.manually_stopping.discard(channel_id)
-                    self.cleanup_stream(channel_id)
-                    break
-                
-                # Auto-retry logic
-                retry_count = self.stream_retry_count.get(channel_id, 0)
-                
-                if retry_count < self.MAX_RETRY_ATTEMPTS:
-                    self.stream_retry_count[channel_id] = retry_count + 1
-                    self.add_stream_log(
-                        channel_id,
-                        f"FFmpeg crashed. Attempting restart #{retry_count + 1}",
-                        'WARNING'
-                    )
-                    
-                    # Wait before retry
-                    time.sleep(5)
-                    
-                    # Retry
-                    try:
-                        self.cleanup_stream(channel_id, keep_session=True)
-                        success, message = self.start_stream(channel_id)
-                        
-                        if success:
-                            self.add_stream_log(channel_id, "Stream restarted successfully", 'INFO')
-                        else:
-                            self.add_stream_log(channel_id, f"Failed to restart: {message}", 'ERROR')
-                            self.cleanup_stream(channel_id)
-                    except Exception as e:
-                        self.add_stream_log(channel_id, f"Error during restart: {e}", 'ERROR')
-                        self.cleanup_stream(channel_id)
-                else:
-                    self.add_stream_log(
-                        channel_id,
-                        f"Maximum retry attempts ({self.MAX_RETRY_ATTEMPTS}) reached",
-                        'ERROR'
-                    )
-                    self.cleanup_stream(channel_id)
-                
-                break
+        if self.encode_overrides.get(channel.id):
+            # Downgraded by admission control: runs on its own with the cheaper profile
+            self.shared_encoders.detach(channel.id)
+            return self.build_ffmpeg_command(channel)
+        
+        rendition_path = self.renditions.lookup(channel)
+        if rendition_path:
+            self.shared_encoders.detach(channel.id)
+            self.stream_sources[channel.id] = rendition_path
+            return self.build_rendition_command(channel, rendition_path)
+        self.stream_sources.pop(channel.id, None)
+        
+        group_key = self.get_shared_group_key(channel)
+        if group_key is None:
+            self.shared_encoders.detach(channel.id)
+            return self.build_ffmpeg_command(channel)
+        port = self.shared_encoders.attach(group_key, channel)
+        return self.build_relay_command(port, channel.rtmp_url + channel.stream_key)
+    
+    def watch_process(self, channel_id, process):
+        """Hand FFmpeg to the supervisor: progress series, stderr ring and exit handling"""
+        if channel_id not in self.stream_progress:
+            self.stream_progress[channel_id] = ProgressSeries(self.MAX_PROGRESS_SAMPLES)
+        if channel_id not in self.ffmpeg_logs:
+            self.ffmpeg_logs[channel_id] = FFmpegLogRing(self.MAX_FFMPEG_LOG_LINES)
+        
+        series = self.stream_progress[channel_id]
+        parser = FFmpegProgressParser()
+        feeder = self.playlist_feeders.get(channel_id)
+        
+        def on_progress_line(line):
+            sample = parser.feed(line)
+            if sample:
+                series.append(sample)
+                if feeder and not feeder.advance_pending and feeder.needs_advance(sample['out_time_seconds']):
+                    # Picking the next item hits the DB: not on the loop, on the control thread
+                    feeder.advance_pending = True
+                    self.supervisor.call_later(0, self.advance_playlist, channel_id, process,
+                                               sample['out_time_seconds'])
+        
+        self.supervisor.watch(
+            process,
+            on_exit=lambda proc, code: self.handle_stream_exit(channel_id, proc, code),
+            on_stdout_line=on_progress_line,
+            on_stderr_line=self.ffmpeg_logs[channel_id].append
+        )
+    
+    def advance_playlist(self, channel_id, process, out_time_seconds):
+        """FFmpeg has played into the next fed item: it is the one playing now"""
+        feeder = self.playlist_feeders.get(channel_id)
+        if not feeder or self.active_streams.get(channel_id) is not process:
+            return
+        try:
+            previous = feeder.current
+            current = feeder.advance(out_time_seconds)
+            if current is not previous:
+                self.add_stream_log(channel_id, f"Now playing: {current['title']}", 'INFO')
+        finally:
+            feeder.advance_pending = False
+    
+    def get_playlist_state(self, channel_id):
+        """Current and next playlist item of a playlist channel"""
+        feeder = self.playlist_feeders.get(channel_id)
+        return feeder.to_dict() if feeder else None
+    
+    def get_stream_progress(self, channel_id, seconds=None):
+        """Get latest progress sample, summary and samples for a stream"""
+        series = self.stream_progress.get(channel_id)
+        if not series:
+            return None
+        return {
+            'latest': series.latest(),
+            'summary': series.summary(seconds or 60),
+            'samples': series.window(seconds)
+        }
+    
+    def handle_stream_exit(self, channel_id, process, returncode):
+        """Called by the supervisor as soon as an FFmpeg process exits"""
+        # Stopped manually (or already replaced): stop_stream does the cleanup
+        if self.active_streams.get(channel_id) is not process or channel_id in self.manually_stopping:
+            return
+        
+        print(f"[StreamingService] Stream {channel_id} ended with code {returncode}")
+        self.add_stream_log(channel_id, f"Stream ended with code {returncode}", 'WARNING')
+        
+        # Auto-retry logic
+        should_retry, reason = self.get_restart_advice(channel_id)
+        last_error = self.get_last_error_line(channel_id)
+        self.end_session(channel_id, 'error', last_error or f"FFmpeg exited with code {returncode}")
+        
+        if not should_retry:
+            self.add_stream_log(
+                channel_id,
+                f"Not restarting, FFmpeg reported a {reason} error: {last_error}",
+                'ERROR'
+            )
+            self.cleanup_stream(channel_id)
+            self.publish_stream_event(channel_id, 'failed', reason=reason, error=last_error)
+            return
+        
+        policy = self.restart_policies.get(channel_id) or RestartPolicy()
+        self.restart_policies[channel_id] = policy
+        started_at = self.stream_started_at.get(channel_id)
+        uptime = time.monotonic() - started_at if started_at else None
+        delay = policy.next_delay(uptime)
+        
+        if delay is None:
+            self.add_stream_log(channel_id, "Auto-restart disabled for this channel (restart budget 0)", 'ERROR')
+            self.cleanup_stream(channel_id)
+            self.publish_stream_event(channel_id, 'failed', reason=reason, error=last_error)
+            return
+        
+        if policy.cooling_off:
+            self.add_stream_log(
+                channel_id,
+                f"Restart budget spent ({policy.budget} per {int(policy.window_seconds)}s), "
+                f"cooling off for {delay:.0f}s",
+                'ERROR'
+            )
+        else:
+            self.add_stream_log(
+                channel_id,
+                f"FFmpeg crashed ({reason or 'unknown'} error). "
+                f"Restart attempt #{policy.attempt} in {delay:.1f}s",
+                'WARNING'
+            )
+        
+        # Retry later from a supervisor timer; the channel stays active meanwhile
+        self.cleanup_stream(channel_id, keep_session=True)
+        self.pending_restarts[channel_id] = self.supervisor.call_later(delay, self.restart_stream, channel_id)
+        self.publish_stream_event(channel_id, 'restarting', reason=reason, delay=round(delay, 1),
+                                  restart=policy.to_dict())
+    
+    def restart_stream(self, channel_id):
+        """Restart a crashed stream (runs on the supervisor control thread)"""
+        if self.pending_restarts.pop(channel_id, None) is None:
+            return
+        
+        policy = self.restart_policies.get(channel_id)
+        if policy:
+            policy.restarted()
+        
+        try:
+            success, message = self.start_stream(channel_id, restart=True)
             
-            # Sleep before next check
-            time.sleep(2)
+            if success:
+                self.add_stream_log(channel_id, "Stream restarted successfully", 'INFO')
+            else:
+                self.add_stream_log(channel_id, f"Failed to restart: {message}", 'ERROR')
+                self.cleanup_stream(channel_id)
+                self.publish_stream_event(channel_id, 'failed', error=message)
+        except Exception as e:
+            self.add_stream_log(channel_id, f"Error during restart: {e}", 'ERROR')
+            self.cleanup_stream(channel_id)
+            self.publish_stream_event(channel_id, 'failed', error=str(e))
     
-    def start_stream(self, channel_id):
+    def start_stream(self, channel_id, restart=False):
         """Start streaming with auto-retry support"""
+        # Requests, restarts (control thread) and the admission queue (worker) start streams
+        with self.start_lock:
+            return self._start_stream(channel_id, restart)
+    
+    def _start_stream(self, channel_id, restart):
+        process = None
+        watched = False
         try:
-            # Reset retry count
-            self.stream_retry_count[channel_id] = 0
-            
-            # Check if already streaming
-            if channel_id in self.active_streams:
+            # Check if already streaming (or waiting for an automatic restart)
+            if channel_id in self.active_streams or channel_id in self.pending_restarts:
                 return False, "Stream is already active"
             
             # Get channel
@@ -175,58 +417,148 @@ class StreamingService:
             if not channel:
                 return False, "Channel not found"
             
-            # Check video exists
-            if not channel.video_path or not os.path.exists(channel.video_path):
+            # Check video exists (playlist channels check their items)
+            if not channel.playlist_id and (not channel.video_path or not os.path.exists(channel.video_path)):
                 return False, "Video file not found"
             
-            # Build FFmpeg command
-            cmd = self.build_ffmpeg_command(channel)
+            # A manual start gets a fresh restart policy, auto-restarts keep their history
+            if not restart or channel_id not in self.restart_policies:
+                self.restart_policies[channel_id] = RestartPolicy.for_channel(channel)
+            
+            # Admission control (auto-restarts keep the slot and profile they were admitted with)
+            decision = None
+            if not restart:
+                decision = self.admission.evaluate(channel)
+                if decision['action'] in ('queue', 'refuse'):
+                    if decision['action'] == 'queue':
+                        self.admission.enqueue(channel_id, decision)
+                        self.publish_stream_event(channel_id, 'queued', reason=decision['reason'])
+                    self.add_stream_log(channel_id, decision['reason'], 'WARNING')
+                    return False, decision['reason']
+                self.admission.dequeue(channel_id)
+                if decision['overrides']:
+                    self.encode_overrides[channel_id] = decision['overrides']
+                    self.add_stream_log(channel_id, decision['reason'], 'WARNING')
+                else:
+                    self.encode_overrides.pop(channel_id, None)
+            
+            # Build FFmpeg command (a copy relay when the encode is shared)
+            cmd = self.build_channel_command(channel)
             
             self.add_stream_log(channel_id, f"Starting stream: {' '.join(cmd)}", 'INFO')
             
-            # Start FFmpeg process
+            # Start FFmpeg process (playlist channels read their feed from stdin)
+            feeder = self.playlist_feeders.get(channel_id) if channel.playlist_id else None
             process = subprocess.Popen(
                 cmd,
+                stdin=subprocess.PIPE if feeder else None,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True,
                 preexec_fn=os.setsid if os.name != 'nt' else None
             )
+            self.placement.place(process, process_kind(cmd))
+            if feeder:
+                feeder.attach(process, self.supervisor, self.placement,
+                              log=lambda message, level: self.add_stream_log(channel_id, message, level))
             
             # Create session
+            if feeder:
+                current = feeder.current
+                video_file, video_id = current['path'], current['id']
+            else:
+                video_file, video_id = channel.video_path, self.get_video_id(channel.video_path)
             session = StreamSession(
                 channel_id=channel_id,
                 start_time=datetime.utcnow(),
-                video_file=channel.video_path,
+                video_file=video_file,
+                video_id=video_id,
                 status='started'
             )
             db.session.add(session)
             db.session.commit()
+            self.daily_stats.session_started(session)
             
             # Store process and session
             self.active_streams[channel_id] = process
             self.running_channels[channel_id] = session.id
+            self.stream_started_at[channel_id] = time.monotonic()
+            if decision:
+                self.admission.started(channel_id, decision['profile'], decision)
             
-            # Start monitoring thread
-            monitor_thread = threading.Thread(
-                target=self.monitor_stream,
-                args=(channel_id, process),
-                daemon=True
-            )
-            monitor_thread.start()
-            self.monitor_threads[channel_id] = monitor_thread
+            # Supervise process (progress series and log ring survive auto-restarts)
+            self.watch_process(channel_id, process)
+            watched = True
             
             self.add_stream_log(channel_id, f"Stream started successfully for {channel.name}", 'INFO')
+            self.publish_stream_event(channel_id, 'started', restart=restart)
             
             return True, f"Streaming {channel.name} started successfully"
             
         except Exception as e:
+            db.session.rollback()
+            if process is not None and not watched:
+                # Spawned but not supervised yet: nothing else would ever stop it
+                self.abandon_start(channel_id, process, str(e))
+            if channel_id not in self.active_streams:
+                self.shared_encoders.detach(channel_id)
+                if not restart:
+                    self.encode_overrides.pop(channel_id, None)
             self.add_stream_log(channel_id, f"Error starting stream: {e}", 'ERROR')
             return False, str(e)
     
+    def abandon_start(self, channel_id, process, error):
+        """Undo a start that failed after FFmpeg was spawned: stop it, close its session, free its slot"""
+        feeder = self.playlist_feeders.get(channel_id)
+        if feeder:
+            feeder.stop_feeding()
+        try:
+            self.terminate_process(process)
+        except Exception as e:
+            print(f"Error stopping FFmpeg of failed start {channel_id}: {e}")
+        self.placement.rebalance()
+        if self.active_streams.get(channel_id) is process:
+            self.end_session(channel_id, 'error', error)
+            del self.active_streams[channel_id]
+            self.running_channels.pop(channel_id, None)
+            self.stream_started_at.pop(channel_id, None)
+        self.admission.released(channel_id)
+    
+    def terminate_process(self, process, timeout=5):
+        """SIGTERM the process group, SIGKILL it if still running after timeout; reaps it"""
+        try:
+            if os.name != 'nt':
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            else:
+                process.terminate()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                if os.name != 'nt':
+                    os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                else:
+                    process.kill()
+                process.wait()
+        except ProcessLookupError:
+            pass  # already exited and reaped
+    
     def stop_stream(self, channel_id):
         """Stop streaming"""
         try:
+            # Start waiting for CPU capacity: just drop it from the queue
+            if self.admission.dequeue(channel_id) and channel_id not in self.active_streams:
+                self.add_stream_log(channel_id, "Queued start cancelled", 'INFO')
+                self.publish_stream_event(channel_id, 'stopped')
+                return True, "Queued start cancelled"
+            
+            # Crashed stream waiting for its restart: just cancel the restart
+            pending = self.pending_restarts.pop(channel_id, None)
+            if pending and channel_id not in self.active_streams:
+                pending.cancel()
+                self.cleanup_stream(channel_id)
+                self.add_stream_log(channel_id, "Pending restart cancelled, stream stopped", 'INFO')
+                self.publish_stream_event(channel_id, 'stopped')
+                return True, "Stream stopped successfully"
+            
             if channel_id not in self.active_streams:
                 return False, "Stream is not active"
             
@@ -239,22 +571,12 @@ class StreamingService:
             process = self.active_streams.get(channel_id)
             
             if process:
+                feeder = self.playlist_feeders.get(channel_id)
+                if feeder:
+                    # End the feed first: with no writer left FFmpeg reaches EOF
+                    feeder.stop_feeding()
                 try:
-                    # Send SIGTERM
-                    if os.name != 'nt':
-                        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                    else:
-                        process.terminate()
-                    
-                    # Wait for process to end
-                    try:
-                        process.wait(timeout=5)
-                    except subprocess.TimeoutExpired:
-                        # Force kill if not terminated
-                        if os.name != 'nt':
-                            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                        else:
-                            process.kill()
+                    self.terminate_process(process)
                 except Exception as e:
                     self.add_stream_log(channel_id, f"Error killing process: {e}", 'ERROR')
             
@@ -262,6 +584,7 @@ class StreamingService:
             self.cleanup_stream(channel_id)
             
             self.add_stream_log(channel_id, "Stream stopped successfully", 'INFO')
+            self.publish_stream_event(channel_id, 'stopped')
             
             return True, "Stream stopped successfully"
             
@@ -279,16 +602,26 @@ class StreamingService:
             
             # Update session
             if not keep_session and channel_id in self.running_channels:
-                session_id = self.running_channels[channel_id]
-                session = StreamSession.query.get(session_id)
-                
-                if session:
-                    session.end_time = datetime.utcnow()
-                    session.duration_seconds = int((session.end_time - session.start_time).total_seconds())
-                    session.status = 'stopped'
-                    db.session.commit()
+                self.end_session(channel_id, 'stopped')
                 
                 del self.running_channels[channel_id]
+                self.stream_progress.pop(channel_id, None)
+                self.ffmpeg_logs.pop(channel_id, None)
+                self.restart_policies.pop(channel_id, None)
+                self.stream_started_at.pop(channel_id, None)
+            
+            # Auto-restarts stay attached to their shared encoder
+            if not keep_session:
+                self.shared_encoders.detach(channel_id)
+                self.stream_sources.pop(channel_id, None)
+                feeder = self.playlist_feeders.pop(channel_id, None)
+                if feeder:
+                    feeder.cleanup()
+                self.encode_overrides.pop(channel_id, None)
+                self.admission.released(channel_id)
+            
+            # Hand the freed cores to the remaining encoders
+            self.placement.rebalance()
             
             # Remove from manually stopping set
             self.manually_stopping.discard(channel_id)
@@ -296,24 +629,80 @@ class StreamingService:
         except Exception as e:
             print(f"Error cleaning up stream {channel_id}: {e}")
     
+    def end_session(self, channel_id, status, error_message=None):
+        """Close the channel's current session (once)"""
+        session_id = self.running_channels.get(channel_id)
+        session = StreamSession.query.get(session_id) if session_id else None
+        
+        if session and session.end_time is None:
+            session.end_time = datetime.utcnow()
+            session.duration_seconds = int((session.end_time - session.start_time).total_seconds())
+            session.status = status
+            session.error_message = error_message
+            db.session.commit()
+            self.daily_stats.session_ended(session)
+    
     def stop_all_streams(self):
         """Stop all active streams"""
-        channel_ids = list(self.active_streams.keys())
+        channel_ids = self.get_active_streams()
         for channel_id in channel_ids:
             self.stop_stream(channel_id)
         return True, "All streams stopped"
     
-    def get_stream_logs(self, channel_id):
-        """Get logs for a stream"""
-        return self.stream_logs.get(channel_id, [])
+    def get_stream_logs(self, channel_id, include_ffmpeg=True):
+        """Get logs for a stream, merged with recent FFmpeg stderr lines"""
+        logs = list(self.stream_logs.get(channel_id, []))
+        ring = self.ffmpeg_logs.get(channel_id)
+        
+        if include_ffmpeg and ring:
+            for entry in ring.tail():
+                logs.append({
+                    'timestamp': datetime.fromtimestamp(entry['timestamp']).isoformat(),
+                    'message': entry['line'],
+                    'level': 'ERROR' if entry['tag'] == 'fatal' else 'WARNING',
+                    'source': 'ffmpeg',
+                    'tag': entry['tag']
+                })
+            logs.sort(key=lambda log: log['timestamp'])
+        
+        return logs
+    
+    def get_restart_advice(self, channel_id):
+        """Decide from the stderr tags before exit whether a restart can help"""
+        ring = self.ffmpeg_logs.get(channel_id)
+        tags = ring.recent_tags() if ring else set()
+        
+        if 'fatal' in tags:
+            return False, 'fatal'
+        for tag in ('network', 'input', 'encoder'):
+            if tag in tags:
+                return True, tag
+        return True, None
+    
+    def get_restart_state(self, channel_id):
+        """Backoff/budget state and next retry time of a stream"""
+        policy = self.restart_policies.get(channel_id)
+        if not policy:
+            return None
+        state = policy.to_dict()
+        state['pending'] = channel_id in self.pending_restarts
+        return state
+    
+    def get_last_error_line(self, channel_id):
+        """Last classified FFmpeg stderr line"""
+        ring = self.ffmpeg_logs.get(channel_id)
+        for entry in reversed(ring.tail() if ring else []):
+            if entry['tag']:
+                return entry['line']
+        return None
     
     def is_stream_active(self, channel_id):
-        """Check if stream is active"""
-        return channel_id in self.active_streams
+        """Check if stream is active (running or about to be restarted)"""
+        return channel_id in self.active_streams or channel_id in self.pending_restarts
     
     def get_active_streams(self):
         """Get list of active stream IDs"""
-        return list(self.active_streams.keys())
+        return list(set(self.active_streams) | set(self.pending_restarts))
 
 # Global instance
 streaming_service = StreamingService()
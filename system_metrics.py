@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+System Metrics
+Background sampler for host CPU, memory, disk and network usage. A thread
+takes one sample every interval and keeps the last samples in a ring buffer,
+so readers get the latest values immediately instead of blocking in
+psutil.cpu_percent(interval=...). Counters (CPU times, disk and network I/O)
+are turned into rates between consecutive samples.
+"""
+
+import threading
+import time
+from collections import deque
+
+import psutil
+
+from database import get_config
+
+DEFAULT_INTERVAL = 2.0  # 'metrics_interval' configuration, seconds between samples
+DEFAULT_HISTORY = 300  # 'metrics_history' configuration, samples kept
+DISK_PATH = '/'
+
+GB = 1024 ** 3
+
+
+def _busy_percent(before, after):
+    """CPU busy % between two cpu_times() results (idle and iowait count as idle)"""
+    def idle(times):
+        return times.idle + getattr(times, 'iowait', 0)
+
+    total = sum(after) - sum(before)
+    if total <= 0:
+        return 0.0
+    busy = total - (idle(after) - idle(before))
+    return round(max(0.0, min(100.0, busy * 100.0 / total)), 1)
+
+
+def _rate(before, after, field, seconds):
+    if before is None or after is None or seconds <= 0:
+        return None
+    return round(max(0, getattr(after, field) - getattr(before, field)) / seconds, 1)
+
+
+class SystemMetricsSampler:
+    """Sample host usage on a thread, keep recent samples in memory"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, history=DEFAULT_HISTORY):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self.cpu_count = psutil.cpu_count()
+        self.previous = None  # (monotonic time, cpu times, per-cpu times, disk io, net io)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.sample_lock = threading.Lock()  # Request threads may sample before the first tick
+        self.stopping = threading.Event()
+
+    def init_app(self, app):
+        """Read the interval and history size from the configuration, then start"""
+        with app.app_context():
+            self.interval = max(0.5, float(get_config('metrics_interval', self.interval)))
+            history = int(get_config('metrics_history', self.samples.maxlen))
+        if history != self.samples.maxlen:
+            self.samples = deque(self.samples, maxlen=max(1, history))
+        self.start()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self._counters()  # Prime the counters, rates need two readings
+        self.thread = threading.Thread(target=self._run, name='system-metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sampling system metrics: {e}")
+
+    def _counters(self):
+        try:
+            disk_io = psutil.disk_io_counters()
+        except Exception:
+            disk_io = None  # No disks visible (containers)
+        counters = (time.monotonic(), psutil.cpu_times(), psutil.cpu_times(percpu=True),
+                    disk_io, psutil.net_io_counters())
+        previous, self.previous = self.previous, counters
+        return previous, counters
+
+    def sample(self):
+        """Take one sample and add it to the ring buffer"""
+        with self.sample_lock:
+            previous, current = self._counters()
+        if previous is None:
+            return None
+        seconds = current[0] - previous[0]
+        _, cpu_before, per_cpu_before, disk_before, net_before = previous
+        _, cpu_after, per_cpu_after, disk_after, net_after = current
+
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(DISK_PATH)
+        sample = {
+            "timestamp": time.time(),
+            "cpu": {
+                "percent": _busy_percent(cpu_before, cpu_after),
+                "count": self.cpu_count,
+                "per_cpu": [_busy_percent(b, a) for b, a in zip(per_cpu_before, per_cpu_after)]
+            },
+            "memory": {
+                "total_gb": round(memory.total / GB, 2),
+                "used_gb": round(memory.used / GB, 2),
+                "available_gb": round(memory.available / GB, 2),
+                "percent": round(memory.percent, 1)
+            },
+            "disk": {
+                "total_gb": round(disk.total / GB, 2),
+                "used_gb": round(disk.used / GB, 2),
+                "free_gb": round(disk.free / GB, 2),
+                "percent": round(disk.percent, 1),
+                "read_bytes_per_sec": _rate(disk_before, disk_after, 'read_bytes', seconds),
+                "write_bytes_per_sec": _rate(disk_before, disk_after, 'write_bytes', seconds)
+            },
+            "network": {
+                "bytes_sent": net_after.bytes_sent,
+                "bytes_recv": net_after.bytes_recv,
+                "packets_sent": net_after.packets_sent,
+                "packets_recv": net_after.packets_recv,
+                "sent_bytes_per_sec": _rate(net_before, net_after, 'bytes_sent', seconds),
+                "recv_bytes_per_sec": _rate(net_before, net_after, 'bytes_recv', seconds),
+                "sent_packets_per_sec": _rate(net_before, net_after, 'packets_sent', seconds),
+                "recv_packets_per_sec": _rate(net_before, net_after, 'packets_recv', seconds)
+            }
+        }
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+
+    def latest(self):
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    def history(self, seconds):
+        """Samples of the last `seconds`, oldest first"""
+        cutoff = time.time() - seconds
+        with self.lock:
+            return [sample for sample in self.samples if sample['timestamp'] >= cutoff]
+
+    def average_cpu(self, seconds):
+        """Mean host CPU % over the last `seconds`, None before the first sample"""
+        window = self.history(seconds)
+        if not window:
+            return None
+        return sum(sample['cpu']['percent'] for sample in window) / len(window)
+
+
+system_metrics = SystemMetricsSampler()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Analytics Test Script
+Check the SQL aggregates of AdvancedAnalytics against the original
+implementations that load every session, on a throwaway in-memory database
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytz
+from flask import Flask
+
+from database import db, StreamChannel, StreamSession, VideoLibrary
+from advanced_features import AdvancedAnalytics
+
+TIMEZONES = ['UTC', 'Asia/Jakarta', 'Asia/Kolkata', 'Asia/Kathmandu', 'America/New_York']
+
+
+def reference_channel_analytics(channel_id, days):
+    """Original implementation: load the sessions and count in Python"""
+    start_date = datetime.utcnow() - timedelta(days=days)
+    sessions = StreamSession.query.filter(
+        StreamSession.channel_id == channel_id,
+        StreamSession.start_time >= start_date
+    ).all()
+    total_sessions = len(sessions)
+    total_duration = sum([s.duration_seconds or 0 for s in sessions])
+    successful = len([s for s in sessions if s.status == 'stopped'])
+    failed = len([s for s in sessions if s.status == 'error'])
+    return {
+        'total_sessions': total_sessions,
+        'total_duration_seconds': total_duration,
+        'successful_sessions': successful,
+        'failed_sessions': failed,
+        'success_rate': (successful / total_sessions * 100) if total_sessions > 0 else 0,
+        'average_session_duration': total_duration / total_sessions if total_sessions > 0 else 0,
+    }
+
+
+def reference_hour_distribution(channel_id, days):
+    """Original implementation, with each start shifted to its channel's timezone"""
+    start_date = datetime.utcnow() - timedelta(days=days)
+    query = StreamSession.query.filter(StreamSession.start_time >= start_date)
+    if channel_id:
+        query = query.filter_by(channel_id=channel_id)
+    hour_counts = {}
+    for session in query.all():
+        tz = pytz.timezone(session.channel.timezone) if session.channel else pytz.utc
+        hour = pytz.utc.localize(session.start_time).astimezone(tz).hour
+        hour_counts[hour] = hour_counts.get(hour, 0) + 1
+    return hour_counts
+
+
+def reference_video_performance(days):
+    """Original implementation: one session query per library video"""
+    results = []
+    for video in VideoLibrary.query.all():
+        sessions = StreamSession.query.filter(
+            StreamSession.video_file == video.file_path,
+            StreamSession.start_time >= datetime.utcnow() - timedelta(days=days)
+        ).all()
+        results.append({
+            'video_id': video.id,
+            'usage_count': len(sessions),
+            'total_duration': sum([s.duration_seconds or 0 for s in sessions]),
+        })
+    return {r['video_id']: (r['usage_count'], r['total_duration']) for r in results}
+
+
+def seed(channels=5, sessions=3000, days=45, videos=40):
+    now = datetime.utcnow()
+    library = []
+    for n in range(videos):
+        video = VideoLibrary(title=f'Video {n}', filename=f'video-{n}.mp4', file_path=f'videos/video-{n}.mp4')
+        db.session.add(video)
+        db.session.flush()
+        library.append(video)
+    ids = []
+    for n in range(channels):
+        channel = StreamChannel(name=f'Test {n}', stream_key=f'key-{n}', rtmp_url='rtmp://localhost/live',
+                                video_path='/tmp/test.mp4', timezone=TIMEZONES[n % len(TIMEZONES)])
+        db.session.add(channel)
+        db.session.flush()
+        ids.append(channel.id)
+    rows = []
+    for _ in range(sessions):
+        video = random.choice(library + [None])
+        rows.append({
+            'video_file': video.file_path if video else '/tmp/elsewhere.mp4',
+            'video_id': video.id if video else None,
+            'channel_id': random.choice(ids + [None]),
+            'start_time': now - timedelta(seconds=random.randint(0, days * 86400)),
+            'duration_seconds': random.choice([None, 0, random.randint(1, 20000)]),
+            'status': random.choice(['started', 'stopped', 'stopped', 'error', None]),
+            'created_at': now,
+        })
+    db.session.execute(StreamSession.__table__.insert(), rows)
+    db.session.commit()
+    return ids
+
+
+def check(name, expected, actual):
+    if expected == actual:
+        print(f'✅ {name}: OK')
+        return True
+    print(f'❌ {name}: expected {expected}, got {actual}')
+    return False
+
+
+def main():
+    print('=' * 50)
+    print('StreamLive Analytics Test')
+    print('=' * 50)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    analytics = AdvancedAnalytics()
+    results = []
+
+    with app.app_context():
+        db.create_all()
+        random.seed(17)
+        ids = seed()
+
+        for channel_id in ids + [9999]:
+            for days in (1, 7, 30):
+                expected = reference_channel_analytics(channel_id, days)
+                data = analytics.get_channel_analytics(channel_id, days)
+                actual = {key: data[key] for key in expected}
+                results.append(check(f'Channel {channel_id} analytics ({days}d)', expected, actual))
+
+        for channel_id in ids + [None]:
+            for days in (7, 30):
+                expected = reference_hour_distribution(channel_id, days)
+                data = analytics.get_peak_hours(channel_id, days)
+                results.append(check(f'Peak hours channel {channel_id} ({days}d)', expected, data['hour_distribution']))
+                top = sorted(expected.values(), reverse=True)[:5]
+                results.append(check(f'Top hours channel {channel_id} ({days}d)', top,
+                                     [p['sessions'] for p in data['peak_hours']]))
+
+        for days in (1, 30):
+            expected = reference_video_performance(days)
+            data = analytics.get_video_performance(days, limit=len(expected))
+            actual = {r['video_id']: (r['usage_count'], r['total_duration']) for r in data}
+            results.append(check(f'Video performance ({days}d)', expected, actual))
+            counts = [r['usage_count'] for r in data]
+            results.append(check(f'Video performance sorted ({days}d)', sorted(counts, reverse=True), counts))
+            top = analytics.get_video_performance(days, limit=5)
+            results.append(check(f'Video performance limit ({days}d)', data[:5], top))
+
+    print()
+    print(f'{sum(results)}/{len(results)} checks passed')
+    return all(results)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if main() else 1)
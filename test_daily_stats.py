@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Daily Stats Test Script
+Check split_by_day at and across UTC midnight, and that the incremental
+counters of DailyStats match a rebuild from the sessions table, on a
+throwaway in-memory database
+"""
+import random
+from datetime import datetime, date, timedelta
+
+from flask import Flask
+
+from database import db, StreamChannel, StreamSession, StreamStats, ChannelDailyStats
+from daily_stats import DailyStats, COUNTERS, split_by_day
+
+
+def check(name, expected, actual):
+    if expected == actual:
+        print(f'✅ {name}: OK')
+        return True
+    print(f'❌ {name}: expected {expected}, got {actual}')
+    return False
+
+
+def snapshot():
+    """Counters per day and per (channel, day); a rebuild also writes empty days, skip those"""
+    site = {s.date: tuple(getattr(s, n) or 0 for n in COUNTERS) for s in StreamStats.query.all()}
+    channels = {(c.channel_id, c.date): tuple(getattr(c, n) or 0 for n in COUNTERS)
+                for c in ChannelDailyStats.query.all()}
+    return ({k: v for k, v in site.items() if any(v)},
+            {k: v for k, v in channels.items() if any(v)})
+
+
+def main():
+    print('=' * 50)
+    print('StreamLive Daily Stats Test')
+    print('=' * 50)
+    results = []
+
+    d = date(2024, 2, 28)
+    at = lambda day, hour, minute=0, second=0: datetime(day.year, day.month, day.day, hour, minute, second)
+    results.append(check('Same day', [(d, 3600)], split_by_day(at(d, 10), at(d, 11))))
+    results.append(check('Empty interval', [(d, 0)], split_by_day(at(d, 10), at(d, 10))))
+    results.append(check('Across midnight', [(d, 600), (date(2024, 2, 29), 900)],
+                         split_by_day(at(d, 23, 50), at(date(2024, 2, 29), 0, 15))))
+    results.append(check('Ends exactly at midnight', [(d, 3600)],
+                         split_by_day(at(d, 23), datetime(2024, 2, 29))))
+    results.append(check('Starts exactly at midnight', [(d, 60)], split_by_day(datetime(2024, 2, 28), at(d, 0, 1))))
+    parts = split_by_day(at(d, 12), at(date(2024, 3, 2), 6))
+    results.append(check('Multi-day (leap day)', [
+        (date(2024, 2, 28), 43200), (date(2024, 2, 29), 86400),
+        (date(2024, 3, 1), 86400), (date(2024, 3, 2), 21600)], parts))
+
+    random.seed(19)
+    exact = True
+    for _ in range(500):
+        start = datetime(2024, 1, 1) + timedelta(seconds=random.randint(0, 10 * 86400),
+                                                 microseconds=random.randint(0, 999999))
+        end = start + timedelta(seconds=random.randint(0, 4 * 86400), microseconds=random.randint(0, 999999))
+        parts = split_by_day(start, end)
+        exact = exact and sum(s for _, s in parts) == int((end - start).total_seconds()) \
+            and all(s >= 0 for _, s in parts) and parts[0][0] == start.date()
+    results.append(check('Random splits sum to the duration', True, exact))
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        channel = StreamChannel(name='Test', stream_key='key', rtmp_url='rtmp://localhost/live', video_path='/tmp/test.mp4')
+        db.session.add(channel)
+        db.session.commit()
+
+        stats = DailyStats(supervisor=None)
+        base = datetime(2024, 3, 1)
+        for _ in range(200):
+            start = base + timedelta(seconds=random.randint(0, 6 * 86400))
+            session = StreamSession(channel_id=random.choice([channel.id, None]), start_time=start,
+                                    video_file='/tmp/test.mp4', status='started')
+            db.session.add(session)
+            db.session.commit()
+            stats.session_started(session)
+            session.end_time = start + timedelta(seconds=random.randint(0, 3 * 86400))
+            session.status = random.choice(['stopped', 'error', 'stopped'])
+            session.duration_seconds = int((session.end_time - session.start_time).total_seconds())
+            db.session.commit()
+            stats.session_ended(session)
+        incremental = snapshot()
+        for offset in range(10):
+            stats.rebuild(base.date() + timedelta(days=offset))
+        rebuilt = snapshot()
+        results.append(check('Incremental site rows match a rebuild', rebuilt[0], incremental[0]))
+        results.append(check('Incremental channel rows match a rebuild', rebuilt[1], incremental[1]))
+        total = sum(row[1] for row in incremental[0].values())
+        durations = db.session.query(db.func.sum(StreamSession.duration_seconds)).scalar()
+        results.append(check('Durations add up over all days', durations, total))
+
+    print()
+    print(f'{sum(results)}/{len(results)} checks passed')
+    return all(results)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if main() else 1)
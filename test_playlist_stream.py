@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Playlist Stream Test Script
+Play a short playlist through one FFmpeg fed by PlaylistFeeder for a dozen
+item transitions and check that the item in play follows the playlist while
+the file descriptors and memory of FFmpeg and of this process stay flat.
+Needs ffmpeg on PATH (skipped otherwise)
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import signal
+import threading
+from types import SimpleNamespace
+
+from process_supervisor import ProcessSupervisor
+from playlist_stream import PlaylistFeeder, playlist_input_args
+from stream_telemetry import FFmpegProgressParser
+
+CLIP_SECONDS = 0.5
+TRANSITIONS = 12
+
+
+def check(name, expected, actual):
+    if expected == actual:
+        print(f'✅ {name}: OK')
+        return True
+    print(f'❌ {name}: expected {expected}, got {actual}')
+    return False
+
+
+def make_clip(path, frequency):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc=size=160x120:rate=25:duration={CLIP_SECONDS}',
+        '-f', 'lavfi', '-i', f'sine=frequency={frequency}:duration={CLIP_SECONDS}',
+        '-c:v', 'mpeg4', '-c:a', 'aac', '-shortest', path
+    ], check=True)
+
+
+class Playlist:
+    """Stands in for PlaylistManager: plays the videos in order, then wraps"""
+
+    def __init__(self, videos):
+        self.videos = videos
+
+    def get_next_video(self, playlist_id, current_video_id=None):
+        ids = [v.id for v in self.videos]
+        if current_video_id not in ids:
+            return self.videos[0]
+        return self.videos[(ids.index(current_video_id) + 1) % len(self.videos)]
+
+
+def open_fds(pid):
+    return len(os.listdir(f'/proc/{pid}/fd'))
+
+
+def pipe_writers(pid):
+    """pids holding the write end of the pipe on the stdin of pid"""
+    pipe = os.readlink(f'/proc/{pid}/fd/0')
+    writers = []
+    for other in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            for fd in os.listdir(f'/proc/{other}/fd'):
+                if os.readlink(f'/proc/{other}/fd/{fd}') != pipe:
+                    continue
+                with open(f'/proc/{other}/fdinfo/{fd}') as f:
+                    flags = int(next(line for line in f if line.startswith('flags:')).split()[1], 8)
+                if flags & os.O_ACCMODE != os.O_RDONLY:
+                    writers.append(int(other))
+        except OSError:
+            continue  # exited meanwhile
+    return writers
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    print('=' * 50)
+    print('StreamLive Playlist Stream Test')
+    print('=' * 50)
+    if not shutil.which('ffmpeg') or not os.path.isdir('/proc/self/fd'):
+        print('ffmpeg or /proc not available, skipped')
+        return True
+    results = []
+
+    workdir = tempfile.mkdtemp(prefix='playlist-test-')
+    videos = []
+    for n in range(3):
+        path = os.path.join(workdir, f'item_{n}.mp4')
+        make_clip(path, 440 * (n + 1))
+        videos.append(SimpleNamespace(id=n + 1, title=f'item {n}', file_path=path, duration_seconds=CLIP_SECONDS))
+
+    supervisor = ProcessSupervisor()
+    feeder = PlaylistFeeder(1, 1, manager=Playlist(videos))
+    results.append(check('First item', True, feeder.begin() and feeder.current['id'] == 1))
+
+    process = subprocess.Popen(playlist_input_args() + ['-c', 'copy', '-f', 'null', '-'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               preexec_fn=os.setsid)
+    played, samples, out_times, logs = [feeder.current['id']], [], [], []
+    done = threading.Event()
+    parser = FFmpegProgressParser()
+
+    def advance(out_time):
+        try:
+            fed = [item['id'] for _, item in feeder.upcoming]
+            before = feeder.items_played
+            feeder.advance(out_time)
+            played.extend(fed[:feeder.items_played - before])
+            # One sample per transition: (ffmpeg fds, ffmpeg RSS, our fds)
+            samples.append((open_fds(process.pid), rss_mb(process.pid), open_fds(os.getpid())))
+            if feeder.items_played >= TRANSITIONS:
+                done.set()
+        finally:
+            feeder.advance_pending = False
+
+    def on_progress_line(line):
+        sample = parser.feed(line)
+        if sample and sample['out_time_seconds'] is not None:
+            out_times.append(sample['out_time_seconds'])
+            if not feeder.advance_pending and feeder.needs_advance(sample['out_time_seconds']):
+                feeder.advance_pending = True
+                supervisor.call_later(0, advance, sample['out_time_seconds'])
+
+    supervisor.watch(process, lambda proc, code: done.set(), on_stdout_line=on_progress_line)
+    feeder.attach(process, supervisor, log=lambda message, level: logs.append(message))
+    done.wait(TRANSITIONS * CLIP_SECONDS * 4 + 10)
+
+    results.append(check('FFmpeg still playing', None, process.poll()))
+    results.append(check(f'{TRANSITIONS} transitions', TRANSITIONS, min(feeder.items_played, TRANSITIONS)))
+    results.append(check('Items in playlist order', [(n % 3) + 1 for n in range(len(played))], played))
+    results.append(check('No item skipped', [], logs))
+    results.append(check('Output clock keeps going', True,
+                         bool(out_times) and out_times[-1] >= (TRANSITIONS - 1) * CLIP_SECONDS))
+    if len(samples) >= 4:
+        # Settled after the first transitions: nothing may pile up from one item to the next
+        settled = samples[2:]
+        ffmpeg_fds = [s[0] for s in settled]
+        own_fds = [s[2] for s in settled]
+        results.append(check('FFmpeg fds flat', True, max(ffmpeg_fds) - min(ffmpeg_fds) <= 1))
+        results.append(check('Own fds flat', True, max(own_fds) - min(own_fds) <= 2))
+        results.append(check('FFmpeg memory flat', True, settled[-1][1] - settled[0][1] < 20))
+    else:
+        results.append(check('Enough transitions sampled', True, False))
+
+    # Stopped the way stop_stream does it, while a reader may still be writing:
+    # the feed is closed first so FFmpeg reaches EOF, then terminate, wait, kill
+    reader = feeder.reader
+    feeder.stop_feeding()
+    if reader:
+        reader.wait(timeout=10)
+    results.append(check('Closed feed has no writer left', [], pipe_writers(process.pid)))
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    results.append(check('FFmpeg stopped', True, process.wait(timeout=5) is not None))
+    feeder.cleanup()
+    results.append(check('Cleanup closes the feed', True, process.stdin.closed))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(f'{sum(results)}/{len(results)} checks passed')
+    return all(results)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Restart Policy Test Script
+Check the jittered backoff bounds, the stable-uptime reset and the rolling
+restart budget with its cool-off, on a simulated clock
+"""
+import random
+
+from restart_policy import RestartPolicy
+
+
+def check(name, expected, actual):
+    if expected == actual:
+        print(f'✅ {name}: OK')
+        return True
+    print(f'❌ {name}: expected {expected}, got {actual}')
+    return False
+
+
+def main():
+    print('=' * 50)
+    print('StreamLive Restart Policy Test')
+    print('=' * 50)
+    random.seed(4)
+    results = []
+
+    # Full jitter: attempt n waits between 0 and min(max_delay, base * 2^n)
+    caps, within = [], True
+    for _ in range(200):
+        policy = RestartPolicy(base_delay=2, max_delay=30, budget=100, window_seconds=600)
+        now = 1000.0
+        for attempt in range(8):
+            cap = min(30.0, 2.0 * 2 ** attempt)
+            delay = policy.next_delay(uptime_seconds=1, now=now)
+            within = within and 0 <= delay <= cap
+            caps.append(cap)
+            now += delay + 1
+    results.append(check('Jitter within [0, cap]', True, within))
+    results.append(check('Cap never above max_delay', 30.0, max(caps)))
+
+    delays = []
+    for _ in range(500):
+        policy = RestartPolicy(base_delay=10, max_delay=10, budget=100)
+        delays.append(policy.next_delay(now=0))
+    results.append(check('Jitter spreads restarts', True, min(delays) < 2 and max(delays) > 8))
+
+    policy = RestartPolicy(base_delay=2, max_delay=120, budget=100)
+    for n in range(5):
+        policy.next_delay(uptime_seconds=1, now=n * 200.0)
+    results.append(check('Quick crashes grow the attempt', 5, policy.attempt))
+    policy.next_delay(uptime_seconds=policy.stable_seconds, now=1200.0)
+    results.append(check('Stable uptime starts over', 1, policy.attempt))
+
+    # Budget: 3 restarts per 600s window, then a cool-off of at least 900s
+    policy = RestartPolicy(base_delay=1, max_delay=1, budget=3, window_seconds=600, cooloff_seconds=900)
+    now = 0.0
+    for _ in range(3):
+        now += policy.next_delay(uptime_seconds=1, now=now) + 1
+    results.append(check('Within budget', (False, 3), (policy.cooling_off, policy.to_dict(now)['restarts_in_window'])))
+    delay = policy.next_delay(uptime_seconds=1, now=now)
+    results.append(check('Budget spent: cooling off', True, policy.cooling_off))
+    results.append(check('Cool-off delay', True, delay >= 900))
+    results.append(check('Cool-off resets the backoff', 0, policy.attempt))
+    policy.restarted()
+    now += delay
+    delay = policy.next_delay(uptime_seconds=1, now=now)
+    results.append(check('After the cool-off: jittered again', (False, True), (policy.cooling_off, delay <= 1)))
+
+    # The window rolls: old restarts stop counting against the budget
+    policy = RestartPolicy(base_delay=1, max_delay=1, budget=2, window_seconds=60, cooloff_seconds=300)
+    policy.next_delay(now=0)
+    policy.next_delay(now=10)
+    policy.next_delay(now=100)
+    results.append(check('Rolled window: no cool-off', False, policy.cooling_off))
+
+    policy = RestartPolicy(budget=0)
+    results.append(check('Budget 0 never restarts', (None, None), (policy.next_delay(now=0), policy.next_retry_at)))
+
+    print()
+    print(f'{sum(results)}/{len(results)} checks passed')
+    return all(results)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if main() else 1)
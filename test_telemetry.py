@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Telemetry Test Script
+Check that FFmpeg -progress output becomes one sample per block, including
+lines that arrive split across pipe reads and blocks after a restart
+"""
+import subprocess
+import sys
+import threading
+
+from process_supervisor import ProcessSupervisor
+from stream_telemetry import FFmpegProgressParser, ProgressSeries
+
+BLOCK = """frame=250
+fps=25.00
+stream_0_0_q=23.0
+bitrate=2500.1kbits/s
+total_size=3125000
+out_time_us=10000000
+out_time=00:00:10.000000
+dup_frames=1
+drop_frames=2
+speed=1.01x
+progress=continue
+"""
+
+# Writes BLOCK twice in pieces cut mid-key and mid-value, flushing each piece
+SPLIT_WRITER = """
+import sys, time
+data = sys.argv[1] * 2
+for start in range(0, len(data), 7):
+    sys.stdout.write(data[start:start + 7])
+    sys.stdout.flush()
+    time.sleep(0.002)
+"""
+
+
+def check(name, expected, actual):
+    if expected == actual:
+        print(f'✅ {name}: OK')
+        return True
+    print(f'❌ {name}: expected {expected}, got {actual}')
+    return False
+
+
+def feed_all(parser, text):
+    return [s for s in (parser.feed(line) for line in text.splitlines()) if s]
+
+
+def fields(sample, *keys):
+    return {key: sample[key] for key in keys}
+
+
+def main():
+    print('=' * 50)
+    print('StreamLive Telemetry Test')
+    print('=' * 50)
+    results = []
+
+    samples = feed_all(FFmpegProgressParser(), BLOCK)
+    results.append(check('One sample per block', 1, len(samples)))
+    results.append(check('Block values', {
+        'frame': 250, 'fps': 25.0, 'bitrate_kbps': 2500.1, 'speed': 1.01, 'total_size': 3125000,
+        'dup_frames': 1, 'drop_frames': 2, 'out_time_seconds': 10.0, 'progress': 'continue',
+    }, fields(samples[0], 'frame', 'fps', 'bitrate_kbps', 'speed', 'total_size', 'dup_frames',
+              'drop_frames', 'out_time_seconds', 'progress')))
+
+    na = feed_all(FFmpegProgressParser(), 'fps=N/A\nbitrate=N/A\nspeed=N/A\nframe=\nprogress=continue\n')
+    results.append(check('N/A values', {'fps': None, 'bitrate_kbps': None, 'speed': None, 'frame': None},
+                         fields(na[0], 'fps', 'bitrate_kbps', 'speed', 'frame')))
+
+    legacy = feed_all(FFmpegProgressParser(), 'out_time_ms=2500000\nprogress=continue\n')
+    results.append(check('out_time_ms fallback', 2.5, legacy[0]['out_time_seconds']))
+
+    # A restarted FFmpeg starts its counters over; stray non key=value lines are ignored
+    parser = FFmpegProgressParser()
+    restart = BLOCK.replace('progress=continue', 'progress=end') + \
+        '\n[tcp @ 0x55] Connection reset by peer\nframe=3\ndrop_frames=0\nprogress=continue\n'
+    samples = feed_all(parser, restart)
+    results.append(check('Reset: samples', ['end', 'continue'], [s['progress'] for s in samples]))
+    results.append(check('Reset: counters start over', {'frame': 3, 'drop_frames': 0, 'fps': None},
+                         fields(samples[1], 'frame', 'drop_frames', 'fps')))
+    series = ProgressSeries()
+    for sample in samples:
+        series.append(sample)
+    results.append(check('Reset: dropped in window never negative', 0, series.summary()['dropped_in_window']))
+    results.append(check('Incomplete block pending', None, parser.feed('frame=4')))
+
+    # Through the supervisor: lines cut across pipe reads are reassembled
+    supervisor = ProcessSupervisor()
+    parser = FFmpegProgressParser()
+    samples, done = [], threading.Event()
+
+    def on_line(line):
+        sample = parser.feed(line)
+        if sample:
+            samples.append(sample)
+
+    process = subprocess.Popen([sys.executable, '-c', SPLIT_WRITER, BLOCK], stdout=subprocess.PIPE)
+    supervisor.watch(process, lambda p, code: done.set(), on_stdout_line=on_line)
+    results.append(check('Split reads: writer exited', True, done.wait(10)))
+    results.append(check('Split reads: samples', 2, len(samples)))
+    results.append(check('Split reads: values', [(250, 2500.1, 1.01)] * 2,
+                         [(s['frame'], s['bitrate_kbps'], s['speed']) for s in samples]))
+
+    print()
+    print(f'{sum(results)}/{len(results)} checks passed')
+    return all(results)
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if main() else 1)
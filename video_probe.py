@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Video Probe
+ffprobe results cached in the database, keyed by path, inode, size and
+mtime, so an unchanged file is probed once; copies share results by content
+key. Probes of new library videos, folder scans and thumbnails run as jobs on
+the background job queue; a scan fingerprints and probes new files
+concurrently with a bounded pool, and skips or hard-links duplicates.
+"""
+
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from content_index import sample_fingerprint
+from database import db, get_config, ProbeCache, VideoLibrary
+
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.wmv', '.webm', '.m4v']
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)  # 'probe_workers' configuration, ffprobe mostly waits on I/O
+PROBE_TIMEOUT = 60  # seconds per file
+COMMIT_EVERY = 25  # library rows per commit during a scan
+THUMBNAIL_DIR = './videos/.thumbnails'
+THUMBNAIL_WIDTH = 320
+
+
+def run_ffprobe(path):
+    """{'duration': float or None, 'resolution': 'WxH' or None}, blocking"""
+    result = {'duration': None, 'resolution': None}
+    try:
+        completed = subprocess.run([
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-show_entries', 'stream=width,height',
+            '-of', 'json',
+            path
+        ], capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+        if completed.returncode == 0:
+            data = json.loads(completed.stdout)
+            if 'format' in data and 'duration' in data['format']:
+                result['duration'] = float(data['format']['duration'])
+            for stream in data.get('streams', []):
+                if 'width' in stream and 'height' in stream:
+                    result['resolution'] = f"{stream['width']}x{stream['height']}"
+                    break
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        print(f"Error probing {path}: {e}")
+    return result
+
+
+def thumbnail_command(source, output, at_seconds):
+    """One frame at at_seconds, scaled to THUMBNAIL_WIDTH, as JPEG"""
+    return [
+        'ffmpeg', '-y',
+        '-loglevel', 'error',
+        '-nostats',
+        '-ss', f'{at_seconds:.2f}',
+        '-i', source,
+        '-frames:v', '1',
+        '-vf', f'scale={THUMBNAIL_WIDTH}:-2',
+        '-q:v', '4',
+        output
+    ]
+
+
+def sample_or_none(path, size):
+    """Sampled fingerprint, None if the file cannot be read"""
+    try:
+        return sample_fingerprint(path, size)
+    except OSError as e:
+        print(f"Error fingerprinting {path}: {e}")
+        return None
+
+
+def to_metadata(entry, size_bytes):
+    """The metadata dict the video endpoints store on VideoLibrary"""
+    return {
+        'duration_seconds': entry.duration_seconds or 0,
+        'resolution': entry.resolution,
+        'file_size_mb': size_bytes / (1024 * 1024)
+    }
+
+
+class VideoProber:
+    """Probe cache, ffprobe pool and the probe, scan and thumbnail jobs"""
+
+    def __init__(self, service):
+        self.service = service
+        self.pool = None
+        self.lock = threading.Lock()
+        service.jobs.register('probe', self._run_probe, priority=20)
+        service.jobs.register('scan', self._run_scan, priority=15, max_attempts=1, concurrency=1)
+        service.jobs.register('thumbnail', self._run_thumbnail, priority=5, max_attempts=2)
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                workers = int(get_config('probe_workers', DEFAULT_WORKERS))
+                self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ffprobe')
+            return self.pool
+
+    def lookup(self, path, stat, fingerprint=None):
+        """Cached entry for an unchanged file, else one for the same content (copied), else None"""
+        entry = ProbeCache.query.filter_by(path=os.path.abspath(path)).first()
+        if entry and entry.matches(stat):
+            if fingerprint and not entry.fingerprint:
+                entry.fingerprint = fingerprint
+            return entry
+        if fingerprint:
+            # ffprobe reads the container header and index, which the fingerprint samples
+            shared = ProbeCache.query.filter_by(fingerprint=fingerprint).first()
+            if shared:
+                return self.store(path, stat, {'duration': shared.duration, 'resolution': shared.resolution}, fingerprint)
+        return None
+
+    def store(self, path, stat, result, fingerprint=None):
+        """Save a probe result (caller commits)"""
+        path = os.path.abspath(path)
+        entry = ProbeCache.query.filter_by(path=path).first()
+        if not entry:
+            entry = ProbeCache(path=path)
+            db.session.add(entry)
+        entry.inode, entry.size_bytes, entry.mtime = stat.st_ino, stat.st_size, stat.st_mtime
+        entry.duration = result['duration']
+        entry.duration_seconds = int(result['duration']) if result['duration'] else 0
+        entry.resolution = result['resolution']
+        entry.fingerprint = fingerprint
+        entry.probed_at = datetime.utcnow()
+        return entry
+
+    def get_metadata(self, path, fingerprint=None):
+        """Metadata of one file, probed only if neither it nor a copy was probed unchanged"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {'duration_seconds': 0, 'resolution': None, 'file_size_mb': 0}
+        entry = self.lookup(path, stat, fingerprint)
+        if not entry:
+            entry = self.store(path, stat, run_ffprobe(path), fingerprint)
+        db.session.commit()
+        return to_metadata(entry, stat.st_size)
+
+    def request_probe(self, video):
+        """Queue the metadata probe (then the thumbnail) of a library video"""
+        return self.service.jobs.submit('probe', {'video_id': video.id}, dedupe_key=f'probe:{video.id}')
+
+    def request_thumbnail(self, video):
+        return self.service.jobs.submit('thumbnail', {'video_id': video.id}, dedupe_key=f'thumbnail:{video.id}')
+
+    def start_scan(self, videos_dir='./videos'):
+        """Queue a scan of a folder (or return the one already queued or running)"""
+        return self.service.jobs.submit('scan', {'directory': videos_dir},
+                                        dedupe_key=f'scan:{os.path.abspath(videos_dir)}')
+
+    def _run_probe(self, job):
+        video = VideoLibrary.query.get(job.payload['video_id'])
+        if not video:
+            return {'skipped': 'video not found'}
+        try:
+            fingerprint = self.service.content.refresh(video)
+        except OSError:
+            fingerprint = None
+        metadata = self.get_metadata(video.file_path, fingerprint)
+        video.file_size_mb = metadata['file_size_mb']
+        video.duration_seconds = metadata['duration_seconds']
+        video.resolution = metadata['resolution']
+        db.session.commit()
+        self.service.events.publish('videos', {'action': 'updated', 'video_id': video.id})
+        self.request_thumbnail(video)
+        return metadata
+
+    def _run_thumbnail(self, job):
+        video = VideoLibrary.query.get(job.payload['video_id'])
+        if not video or not os.path.exists(video.file_path):
+            return {'skipped': 'video not found'}
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        # Named by content key: copies of a video share one thumbnail
+        output = os.path.join(THUMBNAIL_DIR, f'{video.fingerprint or video.id}.jpg')
+        if not (video.fingerprint and os.path.exists(output)):
+            # 10% in (at most 10s) skips black intro frames
+            at_seconds = min((video.duration_seconds or 0) * 0.1, 10)
+            process = job.track(subprocess.Popen(thumbnail_command(video.file_path, output, at_seconds),
+                                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE))
+            self.service.placement.place(process, 'batch')
+            try:
+                _, stderr = process.communicate(timeout=PROBE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            job.check()
+            if process.returncode != 0 or not os.path.exists(output):
+                raise RuntimeError(stderr.decode('utf-8', 'replace').strip()[-300:] or f'ffmpeg exited {process.returncode}')
+        video.thumbnail_path = output
+        db.session.commit()
+        self.service.events.publish('videos', {'action': 'updated', 'video_id': video.id})
+        return {'thumbnail_path': output}
+
+    def _run_scan(self, job):
+        videos_dir = job.payload['directory']
+        if not os.path.exists(videos_dir):
+            os.makedirs(videos_dir)
+
+        files = []
+        with os.scandir(videos_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                    files.append((entry.name, os.path.join(videos_dir, entry.name), entry.stat()))
+
+        known = {filename for (filename,) in VideoLibrary.query.with_entities(VideoLibrary.filename)}
+        new_files = [f for f in files if f[0] not in known]
+        counts = {'found': len(files), 'new': len(new_files), 'cached': 0, 'probed': 0, 'added': 0,
+                  'duplicates': 0, 'linked': 0, 'errors': 0}
+        job.update(progress=0, force=True, **counts)
+
+        # Fingerprints read a few blocks per file: in parallel, like the probes
+        pool = self._get_pool()
+        samples = list(pool.map(lambda f: sample_or_none(f[1], f[2].st_size), new_files))
+
+        added, to_probe = [], []
+        for (filename, file_path, stat), sample in zip(new_files, samples):
+            if sample is None:
+                counts['errors'] += 1
+                continue
+            # Earlier files of this scan are candidates too (autoflush)
+            video, outcome = self.register_file(filename, file_path, stat, sample)
+            if outcome in ('duplicate', 'linked'):
+                counts['duplicates'] += 1
+            if outcome == 'linked':
+                counts['linked'] += 1
+            elif outcome == 'cached':
+                counts['cached'] += 1
+            elif outcome == 'new':
+                to_probe.append((video, file_path, stat))
+            if video:
+                added.append(video)
+                counts['added'] += 1
+            job.update(**counts)
+        db.session.commit()
+
+        futures = {pool.submit(run_ffprobe, file_path): (video, file_path, stat)
+                   for video, file_path, stat in to_probe}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                video, file_path, stat = futures[future]
+                result = future.result()
+                if result['duration'] is None:
+                    counts['errors'] += 1
+                self._apply(video, self.store(file_path, stat, result, video.fingerprint), stat)
+                counts['probed'] += 1
+                if done % COMMIT_EVERY == 0:
+                    db.session.commit()
+                job.update(progress=done * 100 / len(to_probe), **counts)
+        except Exception:
+            # Keep what was probed so far (cancelled or failed midway)
+            for future in futures:
+                future.cancel()
+            db.session.commit()
+            self.service.events.publish('videos', {'action': 'scanned'})
+            raise
+        db.session.commit()
+        self.service.events.publish('videos', {'action': 'scanned'})
+
+        for video in added:
+            if not video.thumbnail_path:
+                self.request_thumbnail(video)
+        job.message = (f"Scan completed: {counts['found']} found, {counts['added']} added, "
+                       f"{counts['duplicates']} duplicates")
+        return counts
+
+    def register_file(self, filename, file_path, stat, sample=None, source='scan'):
+        """Add a file of a videos folder to the library under the duplicate policy (caller commits)
+
+        Returns (video, outcome): 'linked' or 'duplicate' (video None if rejected) for
+        content already in the library, 'cached' if a probe result could be reused,
+        'new' if the file still needs a probe.
+        """
+        content = self.service.content
+        key, full, duplicate = content.identify(file_path, stat.st_size, sample=sample)
+        if duplicate:
+            if content.policy() == 'reject':
+                return None, 'duplicate'
+            linked = content.link(file_path, duplicate.file_path)
+            if linked:
+                stat = os.stat(file_path)
+            video = self._add_video(filename, file_path, stat, key, full, source)
+            video.duration_seconds, video.resolution = duplicate.duration_seconds, duplicate.resolution
+            video.thumbnail_path = duplicate.thumbnail_path
+            return video, 'linked' if linked else 'duplicate'
+
+        video = self._add_video(filename, file_path, stat, key, full, source)
+        entry = self.lookup(file_path, stat, key)
+        if entry:
+            self._apply(video, entry, stat)
+            return video, 'cached'
+        return video, 'new'
+
+    def _apply(self, video, entry, stat):
+        metadata = to_metadata(entry, stat.st_size)
+        video.file_size_mb = metadata['file_size_mb']
+        video.duration_seconds = metadata['duration_seconds']
+        video.resolution = metadata['resolution']
+
+    def _add_video(self, filename, file_path, stat, fingerprint, full_hash, source='scan'):
+        video = VideoLibrary(
+            title=filename.rsplit('.', 1)[0],  # Remove extension
+            filename=filename,
+            file_path=file_path,
+            source=source,
+            file_size_mb=stat.st_size / (1024 * 1024),
+            fingerprint=fingerprint,
+            file_hash=full_hash,
+            hashed_size=stat.st_size,
+            hashed_mtime=stat.st_mtime
+        )
+        db.session.add(video)
+        return video
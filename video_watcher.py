@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Video Watcher
+Keeps the library in step with the videos folder as files come and go,
+instead of rescanning the whole folder. inotify (through libc, Linux) reports
+each created, written, moved and deleted name; where it is unavailable the
+folder is listed with os.scandir every few seconds and diffed against the
+previous listing, which costs no database query for unchanged files. A
+changed name waits until its size and mtime have stopped moving, so files
+still being copied are left alone, and then only that name is looked up:
+new files are registered (duplicate policy, probe job), changed ones get
+their size updated and a re-probe, deleted ones are flagged missing.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db, get_config, VideoLibrary
+from video_probe import VIDEO_EXTENSIONS
+
+WATCH_DIR = './videos'
+MODES = ('auto', 'poll', 'off')
+DEFAULT_MODE = 'auto'  # Override with the 'video_watch_mode' configuration (auto tries inotify first)
+DEFAULT_SETTLE_SECONDS = 5  # 'watch_settle_seconds': quiet time before a written file is picked up
+DEFAULT_POLL_SECONDS = 10  # 'watch_poll_seconds': listing interval without inotify
+CHECK_INTERVAL = 1.0  # seconds between size/mtime checks of a settling file
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify:
+    """Non-recursive inotify watch of one directory"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {directory} failed")
+
+    def read(self, timeout):
+        """[(mask, name)] of the events within timeout seconds"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_video_name(name):
+    """Library candidates: video extension, not hidden, not an upload/link in progress"""
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def list_videos(directory):
+    """{name: (size, mtime)} of the video files in directory"""
+    listing = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_video_name(entry.name):
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        listing[entry.name] = (stat.st_size, stat.st_mtime)
+                except OSError:
+                    pass  # deleted while listing
+    return listing
+
+
+class VideoWatcher:
+    """Registers, updates and flags library videos as files in the folder change"""
+
+    def __init__(self, service, prober, directory=WATCH_DIR):
+        self.service = service
+        self.prober = prober
+        self.directory = directory
+        self.mode = 'stopped'
+        self.inotify = None
+        self.listing = None  # last os.scandir listing (poll mode)
+        self.pending = {}  # {name: {'due': monotonic time, 'seen': (size, mtime) or None}}
+        self.counts = {'added': 0, 'updated': 0, 'missing': 0, 'restored': 0, 'duplicates': 0, 'errors': 0}
+        self.last_change = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start watching (per 'video_watch_mode'); changes made while stopped are caught up first"""
+        if self.thread:
+            return
+        with self.service.app.app_context():
+            mode = get_config('video_watch_mode', DEFAULT_MODE)
+        if mode == 'off':
+            return
+        self.stopping.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        self.mode = 'poll'
+        if mode != 'poll':
+            try:
+                self.inotify = Inotify(self.directory)
+                self.mode = 'inotify'
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable for {self.directory}, polling instead: {e}")
+        self.thread = threading.Thread(target=self._run, name='video-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+        self.mode = 'stopped'
+        self.thread = None
+
+    def status(self):
+        with self.lock:
+            pending = len(self.pending)
+        return {
+            'mode': self.mode,
+            'directory': self.directory,
+            'pending': pending,
+            'counts': dict(self.counts),
+            'last_change': self.last_change.isoformat() if self.last_change else None,
+        }
+
+    def _settings(self):
+        with self.service.app.app_context():
+            return (float(get_config('watch_settle_seconds', DEFAULT_SETTLE_SECONDS)),
+                    float(get_config('watch_poll_seconds', DEFAULT_POLL_SECONDS)))
+
+    def _mark(self, name, seen=None):
+        """Check name once it has settled; seen is its (size, mtime) if just listed"""
+        with self.lock:
+            self.pending[name] = {'due': time.monotonic() + (0 if seen else CHECK_INTERVAL), 'seen': seen}
+
+    def _run(self):
+        self.settle, poll_seconds = self._settings()
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Error reconciling {self.directory} with the library: {e}")
+        next_poll = time.monotonic() + poll_seconds
+        while not self.stopping.is_set():
+            try:
+                if self.inotify:
+                    self._read_events()
+                else:
+                    self.stopping.wait(CHECK_INTERVAL)
+                    if time.monotonic() >= next_poll:
+                        self._poll()
+                        next_poll = time.monotonic() + poll_seconds
+                self._check_pending()
+            except Exception as e:
+                print(f"Error in video watcher: {e}")
+                time.sleep(CHECK_INTERVAL)
+
+    def _read_events(self):
+        for mask, name in self.inotify.read(CHECK_INTERVAL):
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: compare the whole folder once
+                self.reconcile()
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                print(f"{self.directory} was removed or moved, polling instead of inotify")
+                self.inotify.close()
+                self.inotify = None
+                self.mode = 'poll'
+                os.makedirs(self.directory, exist_ok=True)
+                self.listing = None
+                return
+            elif name and not mask & IN_ISDIR and is_video_name(name):
+                self._mark(name)
+
+    def _poll(self):
+        """Diff a fresh listing against the previous one and mark what changed"""
+        os.makedirs(self.directory, exist_ok=True)
+        listing = list_videos(self.directory)
+        if self.listing is None:
+            self.listing = listing
+            self.reconcile(listing)
+            return
+        for name, seen in listing.items():
+            if self.listing.get(name) != seen:
+                self._mark(name, seen)
+        for name in self.listing.keys() - listing.keys():
+            self._mark(name)
+        self.listing = listing
+
+    def reconcile(self, listing=None):
+        """Mark every file that differs from the library: the one full pass, at start or after lost events"""
+        listing = listing if listing is not None else list_videos(self.directory)
+        if not self.inotify:
+            self.listing = listing
+        directory = os.path.abspath(self.directory)
+        with self.service.app.app_context():
+            rows = VideoLibrary.query.with_entities(
+                VideoLibrary.filename, VideoLibrary.file_path, VideoLibrary.hashed_size,
+                VideoLibrary.hashed_mtime, VideoLibrary.missing_since
+            ).all()
+            db.session.remove()
+        known = set()
+        for filename, file_path, size, mtime, missing_since in rows:
+            known.add(filename)
+            if os.path.dirname(os.path.abspath(file_path)) != directory:
+                continue
+            seen = listing.get(filename)
+            if seen is None:
+                if not missing_since:
+                    self._mark(filename)
+            elif missing_since or seen != (size, mtime):
+                self._mark(filename, seen)
+        for name, seen in listing.items():
+            if name not in known:
+                self._mark(name, seen)
+
+    def _check_pending(self):
+        now = time.monotonic()
+        with self.lock:
+            due = [(name, entry) for name, entry in self.pending.items() if entry['due'] <= now]
+        if not due:
+            return
+        with self.service.app.app_context():
+            for name, entry in due:
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    stat = None
+                if stat:
+                    seen = (stat.st_size, stat.st_mtime)
+                    if seen != entry['seen'] or time.time() - stat.st_mtime < self.settle:
+                        # Still being written (or not looked at yet): check again shortly
+                        with self.lock:
+                            if self.pending.get(name) is entry:
+                                entry['seen'], entry['due'] = seen, now + CHECK_INTERVAL
+                        continue
+                with self.lock:
+                    if self.pending.get(name) is not entry:
+                        continue  # a newer event restarted its settle time
+                    del self.pending[name]
+                try:
+                    self._apply(name, path, stat)
+                except IntegrityError:
+                    # Registered by an upload, download or scan in the meantime
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    self.counts['errors'] += 1
+                    print(f"Error updating library for {path}: {e}")
+            db.session.remove()
+
+    def _apply(self, name, path, stat):
+        """Bring the library row of one settled file in line with the file (commits)"""
+        video = VideoLibrary.query.filter_by(filename=name).first()
+        if video and os.path.dirname(os.path.abspath(video.file_path)) != os.path.abspath(self.directory):
+            return  # the name belongs to a library video elsewhere
+
+        if stat is None:
+            if os.path.exists(path + '.part'):
+                return  # an upload registered the name and is moving its file into place
+            if video and not video.missing_since:
+                video.missing_since = datetime.utcnow()
+                db.session.commit()
+                self._changed('missing', video)
+            return
+
+        if not video:
+            video, outcome = self.prober.register_file(name, path, stat, source='watch')
+            if not video:
+                self.counts['duplicates'] += 1
+                print(f"Ignoring {path}: duplicate of a library video")
+                return
+            db.session.commit()
+            if outcome in ('duplicate', 'linked'):
+                self.counts['duplicates'] += 1
+            self._changed('added', video, 'created')
+            if outcome == 'new':
+                self.prober.request_probe(video)
+            elif not video.thumbnail_path:
+                self.prober.request_thumbnail(video)
+            return
+
+        restored = video.missing_since is not None
+        video.missing_since = None
+        video.file_size_mb = stat.st_size / (1024 * 1024)
+        stale = (video.hashed_size, video.hashed_mtime) != (stat.st_size, stat.st_mtime)
+        db.session.commit()
+        if restored or stale:
+            self._changed('restored' if restored else 'updated', video, 'updated')
+        if stale:
+            # The probe job refreshes the content key, then duration and resolution
+            self.prober.request_probe(video)
+
+    def _changed(self, count, video, action=None):
+        self.counts[count] += 1
+        self.last_change = datetime.utcnow()
+        self.service.events.publish('videos', {'action': action or count, 'video_id': video.id})